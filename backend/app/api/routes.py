@@ -1,73 +1,348 @@
 import asyncio
 import os
+from datetime import datetime
 from math import ceil
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 from app.api import schemas
 from app.config import settings
-from app.database.database import engine, get_db
+from app.database.database import SessionLocal, engine, get_db
 from app.database.models import Folder, Image
+from app.services.cache_service import (CacheService,
+                                        flush_thumbnail_evictions,
+                                        listing_cache, sync_external_changes,
+                                        thumbnail_cache)
+from app.services.conversion_service import ConversionService
+from app.services.download_service import DownloadService, content_disposition
 from app.services.file_service import FileService
 from app.services.folder_service import FolderService
+from app.services.folder_tree_service import folder_tree
 from app.services.image_service import ImageService
-from app.services.init_service import InitializationService
+from app.services.index_transfer_service import IndexTransferService
+from app.services.init_service import InitializationService, scan_state
+from app.services.prefetch_service import client_key, prefetcher
+from app.services.render_service import RenditionService
+from app.services.retry_service import RetryService, retry_worker
+from app.services.scan_pipeline import scan_priority
+from app.services.search_service import SearchService
+from app.services.similarity_service import SimilarityService
+from app.services.sprite_service import SpriteService
+from app.utils.folder_tree import FolderNode
 from app.utils.logger import logger
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import FileResponse
+from app.utils.metrics import LISTING_CACHE_TOTAL
+from app.utils.pack_store import PackStore
+from app.utils.profiling import timing
+from app.utils.static_files import packed_response
+from app.utils.zip_stream import ZipStream, parse_range
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (FileResponse, ORJSONResponse, Response,
+                               StreamingResponse)
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 
 
-def _build_image_dict(image: Image) -> dict:
-    """将 Image ORM 对象转换为前端可用的字典，路径转换为 URL 路径"""
+def _thumbnail_url(image: Image) -> str:
+    """
+    缩略图仍在缓存中时直接走静态文件路由；
+    已被淘汰（或尚未生成）时指向按需生成接口。
+    """
+    if image.thumbnail_path and image.thumbnail_path in thumbnail_cache:
+        return f"/data/thumbnails/{image.thumbnail_path}"
+    return f"/api/images/{image.id}/thumbnail"
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+# 图片对外字段：名称 → 取值函数（路径转换为 URL 路径）。列表接口可通过 fields= 选择
+_IMAGE_FIELDS: Dict[str, Callable[[Image], Any]] = {
+    "id": lambda image: image.id,
+    "folder_id": lambda image: image.folder_id,
+    "file_path": lambda image: f"/data/images/{image.file_path}" if image.file_path else None,
+    "thumbnail_path": _thumbnail_url,
+    "converted_path": lambda image: (
+        f"/data/converted/{image.converted_path}" if image.converted_path else None
+    ),
+    "mime_type": lambda image: image.mime_type,
+    "image_type": lambda image: image.image_type,
+    "is_heic": lambda image: image.is_heic,
+    "exif_data": lambda image: image.exif_data,
+    "thumbhash": lambda image: image.thumbhash,
+    "duration": lambda image: image.duration,
+    "fps": lambda image: image.fps,
+    "width": lambda image: image.width,
+    "height": lambda image: image.height,
+    "created_at": lambda image: _iso(image.created_at),
+    "updated_at": lambda image: _iso(image.updated_at),
+}
+
+# 列表默认不返回 exif_data：它占列表响应体积的大部分，查看大图时再经 /images/{id}/exif 获取
+_LISTING_FIELDS = tuple(name for name in _IMAGE_FIELDS if name != "exif_data")
+
+
+def _parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    解析 fields= 参数：不传为列表默认字段，"*" 为全部字段，
+    否则为逗号分隔的字段名（id 总是返回）。
+    """
+    if not fields:
+        return _LISTING_FIELDS
+    if fields.strip() == "*":
+        return tuple(_IMAGE_FIELDS)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in _IMAGE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return tuple(dict.fromkeys(["id", *names]))
+
+
+def _build_image_dict(image: Image, fields: Sequence[str] = tuple(_IMAGE_FIELDS)) -> dict:
+    """将 Image ORM 对象转换为前端可用的字典，只包含 fields 中的字段"""
+    return {name: _IMAGE_FIELDS[name](image) for name in fields}
+
+
+def _json_response(content: Any) -> ORJSONResponse:
+    """
+    列表接口直接用 orjson 序列化已构造好的字典，
+    跳过 FastAPI 默认的 jsonable_encoder 递归遍历与标准库 json。
+    """
+    with timing("serialize"):
+        return ORJSONResponse(content)
+
+
+def _folder_dict(node: FolderNode) -> dict:
     return {
-        "id": image.id,
-        "folder_id": image.folder_id,
-        "file_path": f"/data/images/{image.file_path}" if image.file_path else None,
-        "thumbnail_path": f"/data/thumbnails/{image.thumbnail_path}" if image.thumbnail_path else None,
-        "converted_path": f"/data/converted/{image.converted_path}" if image.converted_path else None,
-        "mime_type": image.mime_type,
-        "image_type": image.image_type,
-        "is_heic": image.is_heic,
-        "exif_data": image.exif_data,
-        "created_at": image.created_at.isoformat() if image.created_at else None,
-        "updated_at": image.updated_at.isoformat() if image.updated_at else None,
+        "id": node.id,
+        "name": node.name,
+        "folder_path": node.folder_path,
+        "parent_id": node.parent_id,
+        "has_subfolders": node.subfolder_count > 0,
+        "subfolder_count": node.subfolder_count,
+        "descendant_count": node.descendant_count,
     }
 
+
 @router.get("/folders", response_model=List[schemas.Folder])
-async def get_folders(db: Session = Depends(get_db)):
-    """获取所有文件夹列表"""
-    return db.query(Folder).all()
+async def get_folders():
+    """获取所有文件夹列表（来自内存中的文件夹树）"""
+    sync_external_changes()
+    return _json_response([_folder_dict(node) for node in folder_tree.nodes()])
+
+
+@router.get("/folders/{folder_id}/breadcrumbs", response_model=List[schemas.Folder])
+async def get_folder_breadcrumbs(folder_id: int):
+    """从顶层到该文件夹（含自身）的路径"""
+    sync_external_changes()
+    chain = folder_tree.ancestors(folder_id)
+    if not chain:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return _json_response([_folder_dict(node) for node in chain])
+
+
+def _sprite_cell(cell: Optional[int]) -> int:
+    if cell is None:
+        return settings.SPRITE_CELL_SIZE_LIST[-1]
+    if cell not in settings.SPRITE_CELL_SIZE_LIST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"cell must be one of {settings.SPRITE_CELL_SIZE_LIST}",
+        )
+    return cell
 
 
 @router.get("/folders/{folder_id}/images")
 async def get_folder_images(
+    request: Request,
     folder_id: int = 1,
     page: int = Query(default=1, ge=1),
+    cell: Optional[int] = Query(default=None),
+    fields: Optional[str] = Query(default=None),
     db: Session = Depends(get_db),
 ):
-    """获取指定文件夹中的所有图片（分页）"""
-    images_query = db.query(Image).filter(Image.folder_id == folder_id)
+    """
+    获取指定文件夹中的所有图片（分页），fields 见 _parse_fields。
+    序列化后的响应按 (文件夹, 页码, 字段, 雪碧图格子) 缓存，文件夹内容变更时失效。
+    """
+    selected = _parse_fields(fields)
+    sprite_cell = _sprite_cell(cell) if settings.SPRITE_ENABLED else None
+    cache_key = (page, selected, sprite_cell)
 
-    total_images = images_query.count()
+    sync_external_changes()
+    # 扫描进行中：该文件夹尚未处理的文件插队
+    scan_priority.boost(folder_id)
+    cached = listing_cache.get(folder_id, cache_key) if settings.LISTING_CACHE_ENABLED else None
+    if cached is not None:
+        LISTING_CACHE_TOTAL.labels("hit").inc()
+        body, total_pages = cached
+    else:
+        LISTING_CACHE_TOTAL.labels("miss").inc()
+        # 必须在查询之前取代数，查询期间发生的变更会使本次结果不被缓存
+        generation = listing_cache.generation(folder_id)
+        body, total_pages = _render_folder_images(db, folder_id, page, selected, sprite_cell)
+        if settings.LISTING_CACHE_ENABLED:
+            listing_cache.put(folder_id, cache_key, generation, (body, total_pages))
+
+    # 后台预热后续分页（取代该客户端之前的分页预取）
+    prefetcher.after_images_page(client_key(request), folder_id, page, total_pages)
+
+    return Response(content=body, media_type="application/json")
+
+
+def _render_folder_images(
+    db: Session,
+    folder_id: int,
+    page: int,
+    selected: Sequence[str],
+    sprite_cell: Optional[int],
+) -> Tuple[bytes, int]:
+    """查询并序列化一页图片，返回 (响应体, 总页数)"""
+    total_images = db.query(Image).filter(Image.folder_id == folder_id).count()
     total_pages = ceil(total_images / settings.PAGE_SIZE)
 
-    images = (
-        images_query
-        .offset((page - 1) * settings.PAGE_SIZE)
-        .limit(settings.PAGE_SIZE)
-        .all()
-    )
+    images = ImageService(db).get_folder_page(folder_id, page)
 
-    return {
-        "items": [_build_image_dict(img) for img in images],
+    with timing("serialize"):
+        items = [_build_image_dict(img, selected) for img in images]
+
+    response = {
+        "items": items,
         "total": total_images,
         "page": page,
         "total_pages": total_pages,
         "page_size": settings.PAGE_SIZE,
     }
 
+    # 雪碧图：一页缩略图合成一张，条目带上各自的格子坐标（无可用缩略图时为 null）
+    if sprite_cell is not None:
+        layout = SpriteService(sprite_cell).layout(folder_id, page, images)
+        response["sprite"] = layout["sheet"] if layout else None
+        positions = layout["positions"] if layout else {}
+        for item in items:
+            item["sprite"] = positions.get(item["id"])
+
+    return _json_response(response).body, total_pages
+
+
+@router.get("/folders/{folder_id}/images/sprite")
+async def get_folder_images_sprite(
+    folder_id: int,
+    page: int = Query(default=1, ge=1),
+    cell: Optional[int] = Query(default=None),
+    v: Optional[str] = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    一页缩略图的雪碧图（JPEG）。URL 中的 v 为页内容摘要，
+    内容变化后 URL 随之变化，因此可以长期缓存；v 与当前内容不一致
+    （旧页面引用的过期 URL）时返回当前雪碧图但不允许缓存。
+    """
+    if not settings.SPRITE_ENABLED:
+        raise HTTPException(status_code=404, detail="Sprites disabled")
+
+    images = ImageService(db).get_folder_page(folder_id, page)
+    sprite_service = SpriteService(_sprite_cell(cell))
+    if not images or not any(sprite_service.has_thumbnail(img) for img in images):
+        raise HTTPException(status_code=404, detail="Sprite unavailable")
+
+    try:
+        sprite_path = await sprite_service.get_sprite_path(folder_id, page, images)
+    except Exception as e:
+        logger.error(f"生成雪碧图失败 folder_id={folder_id} page={page}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Sprite generation failed")
+
+    if v == sprite_service.version(images):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    return FileResponse(sprite_path, media_type="image/jpeg", headers={"Cache-Control": cache_control})
+
+
+def _zip_response(request: Request, stream: ZipStream, filename: str) -> Response:
+    """
+    流式 ZIP 响应。支持单区间 Range 续传；If-Range 与当前 etag 不一致
+    （文件在两次请求之间有变化）时返回完整归档。
+    """
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": stream.etag,
+        "Content-Disposition": content_disposition(filename),
+    }
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == stream.etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), stream.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{stream.size}"
+            return Response(status_code=416, headers=headers)
+
+    status_code = 200
+    start, end = 0, stream.size - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stream.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    # 同步生成器由 Starlette 在线程池中迭代；客户端断开时停止迭代，不再读取后续文件
+    return StreamingResponse(
+        stream.iter_bytes(start, end),
+        status_code=status_code,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+@router.get("/folders/{folder_id}/download")
+async def download_folder(
+    request: Request,
+    folder_id: int,
+    recursive: bool = Query(default=False),
+    db: Session = Depends(get_db),
+):
+    """打包下载文件夹（recursive=true 时包含全部子文件夹），ZIP64 只存储模式"""
+    if not settings.DOWNLOAD_ENABLED:
+        raise HTTPException(status_code=404, detail="Downloads disabled")
+    folder = db.query(Folder).filter(Folder.id == folder_id).first()
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    with timing("fs"):
+        stream, filename = await run_in_threadpool(
+            DownloadService(db).folder_archive, folder, recursive
+        )
+    return _zip_response(request, stream, filename)
+
+
+@router.post("/images/download")
+async def download_images(
+    request: Request,
+    selection: schemas.ImageSelection,
+    db: Session = Depends(get_db),
+):
+    """打包下载选中的图片，归档内保留相对图库根目录的路径"""
+    if not settings.DOWNLOAD_ENABLED:
+        raise HTTPException(status_code=404, detail="Downloads disabled")
+    if len(selection.ids) > settings.DOWNLOAD_MAX_SELECTION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.DOWNLOAD_MAX_SELECTION} images per download",
+        )
+
+    with timing("fs"):
+        stream, filename = await run_in_threadpool(
+            DownloadService(db).selection_archive, selection.ids
+        )
+    if not stream.entries:
+        raise HTTPException(status_code=404, detail="No images found")
+    return _zip_response(request, stream, filename)
+
 
 @router.get("/images/{image_id}", response_model=schemas.Image)
 async def get_image(image_id: int, db: Session = Depends(get_db)):
@@ -79,9 +354,34 @@ async def get_image(image_id: int, db: Session = Depends(get_db)):
     return image
 
 
+@router.get("/images/{image_id}/exif")
+async def get_image_exif(image_id: int, db: Session = Depends(get_db)):
+    """单张图片的 EXIF（列表接口默认不返回 exif_data，查看大图时按需获取）"""
+    row = db.query(Image.id, Image.exif_data).filter(Image.id == image_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return _json_response({"id": row.id, "exif_data": row.exif_data})
+
+
+@router.get("/health/ready")
+async def readiness():
+    """
+    就绪检查：服务启动后即可响应（初始扫描在后台进行），
+    返回扫描阶段与进度；初始化失败时返回 503。
+    """
+    state = scan_state.to_dict()
+    status_code = 503 if state["phase"] == "failed" else 200
+    return ORJSONResponse(
+        {"status": "ok" if status_code == 200 else "error", "scan": state},
+        status_code=status_code,
+    )
+
+
 @router.post("/scan")
 async def trigger_full_scan(db: Session = Depends(get_db)):
     """手动触发全盘扫描"""
+    if scan_state.scanning:
+        raise HTTPException(status_code=409, detail="扫描正在进行中")
     try:
         init_service = InitializationService(db)
         success, message = await init_service.full_scan()
@@ -100,6 +400,103 @@ async def trigger_full_scan(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/index/export")
+async def export_index():
+    """以 NDJSON 流式导出 folders / images 索引（格式见 IndexTransferService）"""
+
+    def lines():
+        # 响应可能持续很久，使用独立 Session，随生成器结束关闭
+        db = SessionLocal()
+        try:
+            yield from IndexTransferService(db).export_lines()
+        finally:
+            db.close()
+
+    filename = f"simplephotos-index-{datetime.utcnow():%Y%m%d%H%M%S}.ndjson"
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": content_disposition(filename)},
+    )
+
+
+@router.post("/index/import")
+async def import_index(
+    request: Request,
+    replace: bool = Query(default=False),
+    batch_size: int = Query(default=1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """
+    导入 /index/export 的输出（请求体为 NDJSON），边接收边分批写库。
+    索引不为空时需指定 replace=true 先清空。
+    """
+    if scan_state.scanning:
+        raise HTTPException(status_code=409, detail="扫描正在进行中")
+    try:
+        importer = await run_in_threadpool(
+            IndexTransferService(db).importer, replace, batch_size
+        )
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            await run_in_threadpool(importer.add_lines, lines)
+        await run_in_threadpool(importer.add_lines, [pending])
+        counts = await run_in_threadpool(importer.finish)
+    except ValueError as e:
+        # 格式错误 / 索引不为空；orjson.JSONDecodeError 也是 ValueError
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        FolderService.clear_all_cache()
+    return {"status": "success", **counts}
+
+
+@router.get("/failed-images", response_model=schemas.PaginatedFailedImageResponse)
+async def get_failed_images(
+    page: int = Query(default=1, ge=1),
+    error_class: Optional[str] = Query(default=None, pattern="^(transient|permanent)$"),
+    db: Session = Depends(get_db),
+):
+    """获取处理失败的文件列表（分页，可按错误类别过滤）"""
+    query = RetryService(db).list_failures(error_class)
+    total = query.count()
+    items = (
+        query
+        .offset((page - 1) * settings.PAGE_SIZE)
+        .limit(settings.PAGE_SIZE)
+        .all()
+    )
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "total_pages": ceil(total / settings.PAGE_SIZE),
+        "page_size": settings.PAGE_SIZE,
+    }
+
+
+@router.post("/failed-images/retry")
+async def retry_failed_images(
+    selection: schemas.FailedImageSelection,
+    db: Session = Depends(get_db),
+):
+    """批量重试失败文件（ids 为空表示全部），由后台重试任务立即执行"""
+    scheduled = RetryService(db).schedule_retry(selection.ids)
+    retry_worker.wake()
+    return {"status": "success", "scheduled": scheduled}
+
+
+@router.post("/failed-images/clear")
+async def clear_failed_images(
+    selection: schemas.FailedImageSelection,
+    db: Session = Depends(get_db),
+):
+    """批量删除失败记录（ids 为空表示全部）"""
+    deleted = RetryService(db).clear(selection.ids)
+    return {"status": "success", "deleted": deleted}
+
+
 @router.get("/")
 async def root():
     return {"message": "图片浏览服务已启动"}
@@ -109,48 +506,206 @@ async def root():
 async def get_image_full(image_id: int, db: Session = Depends(get_db)):
     """
     获取完整图片/视频文件。
-    - HEIC 文件：返回转换后的 JPEG（converted_path）
+    - HEIC 文件：返回转换后的 JPEG（未转换过则按需转换，并预转换后续几张）
     - 其他格式：返回原文件（file_path）
     """
     image = db.query(Image).filter(Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
+    if image.is_heic:
+        conversion_service = ConversionService(db)
+        try:
+            with timing("convert"):
+                full_path = await conversion_service.get_converted_path(image)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        except Exception as e:
+            logger.error(f"HEIC 转换失败 {image.file_path}: {str(e)}")
+            raise HTTPException(status_code=500, detail="HEIC conversion failed")
+        conversion_service.schedule_preconvert(image)
+        return FileResponse(full_path, media_type="image/jpeg")
+
     # 所有路径均为相对路径，需拼接到实际目录
-    if image.is_heic and image.converted_path:
-        full_path = os.path.join(settings.CONVERTED_DIR, image.converted_path)
-        return FileResponse(full_path)
-    else:
-        full_path = os.path.join(settings.IMAGES_DIR, image.file_path)
-        return FileResponse(full_path)
+    full_path = os.path.join(settings.IMAGES_DIR, image.file_path)
+
+    with timing("fs"):
+        exists = os.path.isfile(full_path)
+    if not exists:
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(full_path)
+
+
+@router.get("/images/{image_id}/render")
+async def render_image(
+    image_id: int,
+    w: Optional[int] = Query(default=None),
+    h: Optional[int] = Query(default=None),
+    fit: str = Query(default="contain"),
+    fmt: str = Query(default="jpeg"),
+    db: Session = Depends(get_db),
+):
+    """
+    按需缩放的图片（已按 EXIF 方向校正）。w / h 须为 RENDITION_SIZES 中的值，
+    fit=contain 缩放到边框以内，fit=cover 居中裁剪为 w×h；fmt 为 jpeg / webp / png。
+    """
+    if not settings.RENDITION_ENABLED:
+        raise HTTPException(status_code=404, detail="Renditions disabled")
+    error = RenditionService.validate(w, h, fit, fmt)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    image = db.query(Image).filter(Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.image_type == "video":
+        raise HTTPException(status_code=400, detail="Videos cannot be rendered")
+
+    service = RenditionService(w, h, fit, fmt)
+    try:
+        with timing("render"):
+            path = await service.get_rendition_path(image)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception as e:
+        logger.error(f"生成缩放图失败 {image.file_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Render failed")
+    return FileResponse(path, media_type=service.media_type)
+
+
+@router.get("/images/{image_id}/thumbnail")
+async def get_image_thumbnail(image_id: int, request: Request, db: Session = Depends(get_db)):
+    """获取缩略图；已被缓存淘汰时重新生成"""
+    image = db.query(Image).filter(Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        with timing("thumbnail"):
+            thumb_key = await ImageService(db).ensure_thumbnail(image)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception as e:
+        # 原文件损坏等情况，与从未生成过缩略图一样按不存在处理
+        logger.error(f"生成缩略图失败 {image.file_path}: {str(e)}")
+        raise HTTPException(status_code=404, detail="Thumbnail unavailable")
+    flush_thumbnail_evictions()
+    if isinstance(thumbnail_cache, PackStore):
+        response = await packed_response(thumbnail_cache, thumb_key, request.headers)
+        if response is None:
+            raise HTTPException(status_code=404, detail="Thumbnail unavailable")
+        return response
+    return FileResponse(thumbnail_cache.path_for(thumb_key), media_type="image/jpeg")
+
+
+@router.get("/images/{image_id}/similar")
+async def get_similar_images(
+    image_id: int,
+    max_distance: int = Query(default=10, ge=0, le=32),
+    limit: int = Query(default=50, ge=1, le=500),
+    fields: Optional[str] = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """相似图片（感知哈希汉明距离 <= max_distance），按距离升序"""
+    selected = _parse_fields(fields)
+    image = db.query(Image).filter(Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    sync_external_changes()
+    matches = SimilarityService(db).find_similar(image, max_distance, limit)
+    with timing("serialize"):
+        items = [
+            {**_build_image_dict(match, selected), "distance": distance}
+            for match, distance in matches
+        ]
+    return _json_response({"items": items, "total": len(items)})
+
+
+@router.get("/search")
+async def search_images(
+    q: str = Query(min_length=1, max_length=200),
+    after: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=200),
+    fields: Optional[str] = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    按文件名 / 文件夹路径 / 相机型号检索（多个词须全部命中），按 id 升序。
+    翻页时把上一页返回的 next_cursor 作为 after 传入。
+    """
+    selected = _parse_fields(fields)
+    images, next_cursor = SearchService(db).search(q, after, limit)
+    with timing("serialize"):
+        items = [_build_image_dict(img, selected) for img in images]
+    return _json_response({"items": items, "next_cursor": next_cursor, "limit": limit})
+
+
+@router.get("/duplicates")
+async def get_duplicate_groups(
+    max_distance: int = Query(default=4, ge=0, le=16),
+    page: int = Query(default=1, ge=1),
+    fields: Optional[str] = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """重复/近似重复图片分组报告（按组大小降序，分页）"""
+    selected = _parse_fields(fields)
+    sync_external_changes()
+    service = SimilarityService(db)
+    # 大图库分组计算耗时数秒，在线程中执行，并发的相同请求共用一次计算
+    groups = await service.duplicate_groups(max_distance)
+    total = len(groups)
+    page_groups = service.load_groups(
+        groups[(page - 1) * settings.PAGE_SIZE: page * settings.PAGE_SIZE]
+    )
+
+    with timing("serialize"):
+        items = [
+            {"size": len(group), "images": [_build_image_dict(img, selected) for img in group]}
+            for group in page_groups
+        ]
+    return _json_response({
+        "items": items,
+        "total": total,
+        "page": page,
+        "total_pages": ceil(total / settings.PAGE_SIZE),
+        "page_size": settings.PAGE_SIZE,
+        "duplicate_images": sum(len(group) for group in groups),
+    })
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """磁盘缓存（缩略图 / HEIC 转换）占用与命中统计"""
+    return CacheService.stats()
 
 
 @router.get("/folders/{parent_id}/subfolders")
 async def get_subfolders(
+    request: Request,
     parent_id: int = 1,
     page: int = Query(default=1, ge=1),
-    db: Session = Depends(get_db),
 ):
-    """获取指定文件夹下的所有子文件夹（分页）"""
+    """获取指定文件夹下的所有子文件夹（分页，按名称排序，来自内存中的文件夹树）"""
+    sync_external_changes()
     # 约定 0 为根目录（parent_id 为 NULL 的记录）
-    filter_condition = Folder.parent_id.is_(None) if parent_id == 0 else Folder.parent_id == parent_id
-    base_query = db.query(Folder).filter(filter_condition).order_by(Folder.name.asc())
+    total_folders, folders = folder_tree.children(
+        None if parent_id == 0 else parent_id,
+        offset=(page - 1) * settings.PAGE_SIZE,
+        limit=settings.PAGE_SIZE,
+    )
+    total_pages = ceil(total_folders / settings.PAGE_SIZE)
 
-    # 后台异步触发文件夹内容验证（补偿机制）
-    folder_service = FolderService(db)
-    asyncio.create_task(folder_service.validate_folder_content(parent_id))
+    # 扫描进行中：该文件夹与可见子文件夹的首页插队，扫描结束后才需要补偿；
+    # 否则后台异步触发文件夹内容验证（补偿机制），任务内使用独立 Session
+    if not scan_priority.boost(parent_id, [folder.id for folder in folders]):
+        asyncio.create_task(FolderService.validate_in_background(parent_id))
 
-    total_folders = base_query.count()
-    total_pages = ceil(total_folders / settings.PAGE_SIZE)
-    folders = (
-        base_query
-        .offset((page - 1) * settings.PAGE_SIZE)
-        .limit(settings.PAGE_SIZE)
-        .all()
-    )
+    # 后台预热可见子文件夹的首屏缩略图
+    prefetcher.after_subfolders_page(client_key(request), [folder.id for folder in folders])
 
     return {
-        "items": folders,
+        "items": [_folder_dict(folder) for folder in folders],
         "total": total_folders,
         "page": page,
         "total_pages": total_pages,
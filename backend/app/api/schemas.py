@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, computed_field
+from pydantic import BaseModel, Field, computed_field
 
 
 class ImageBase(BaseModel):
@@ -51,11 +51,10 @@ class Folder(BaseModel):
     name: str
     folder_path: str
     parent_id: Optional[int] = None
-
-    @computed_field
-    def has_subfolders(self) -> bool:
-        """是否有子文件夹"""
-        return True  # 可以优化为实际查询
+    has_subfolders: bool
+    # 直接子文件夹数 / 子树中的文件夹总数（不含自身）
+    subfolder_count: int
+    descendant_count: int
 
     class Config:
         from_attributes = True
@@ -81,3 +80,36 @@ class PaginatedFolderResponse(BaseModel):
     page: int
     total_pages: int
     page_size: int
+
+
+class FailedImage(BaseModel):
+    id: int
+    file_path: str
+    folder_path: Optional[str] = None
+    error_message: Optional[str] = None
+    error_class: Optional[str] = None
+    retry_count: int = 0
+    last_attempt_at: Optional[datetime] = None
+    next_retry_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedFailedImageResponse(BaseModel):
+    items: List[FailedImage]
+    total: int
+    page: int
+    total_pages: int
+    page_size: int
+
+
+class FailedImageSelection(BaseModel):
+    """批量操作的目标记录；ids 为空表示全部"""
+    ids: Optional[List[int]] = None
+
+
+class ImageSelection(BaseModel):
+    """选中下载的图片"""
+    ids: List[int] = Field(min_length=1)
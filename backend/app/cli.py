@@ -0,0 +1,700 @@
+"""
+离线命令行工具：在 Web 服务进程之外执行扫描与维护任务。
+
+用法（在 backend 目录下，环境变量与 Web 服务相同）：
+  python -m app.cli scan [--workers N]        导入数据库中还没有的文件（已入库的跳过，中断后重跑即续传）
+  python -m app.cli rescan                    清空后全量重建（同 POST /api/scan，图片 ID 会变化）
+  python -m app.cli rescan --incremental      逐个文件夹与文件系统对比：补录新增、清理已删除
+  python -m app.cli thumbs [--regenerate]     补齐缺失的缩略图；--regenerate 重新生成全部
+  python -m app.cli gc [--dry-run]            清理未被引用的缓存文件与源文件已不存在的失败记录
+  python -m app.cli verify [--json]           校验数据库与文件系统是否一致，不一致时退出码为 1
+  python -m app.cli shard plan [--depth N]    多节点分片扫描：建立文件夹记录并切分分片（执行一次）
+  python -m app.cli shard work [--workers N]  在每个节点上运行：领取分片并处理，直到全部完成
+  python -m app.cli shard status [--json]     查看分片进度与租约
+  python -m app.cli export [-o FILE]          导出 folders / images 索引为 NDJSON（.gz 结尾时 gzip 压缩）
+  python -m app.cli import FILE [--replace]   导入 export 的输出（FILE 为 - 时读标准输入），不必重新扫描
+
+与 Web 服务共用同一数据库：SQLite 使用 WAL 模式，写库期间 Web 服务照常响应读请求；
+写库期间定期更新跨进程变更标记（见 app/utils/change_stamp.py），
+Web 服务据此使列表页缓存与相似度索引失效，新内容在几秒内可见；
+文件夹变更单独标记，只在本进程确实改写了文件夹时更新，Web 服务据此在后台重新加载文件夹树。
+
+scan / shard work 的 --workers 为扫描流水线的并发解码数（见 app/services/scan_pipeline.py）；
+rescan --incremental / thumbs 的 --workers 个线程各自使用独立的事件循环与数据库 Session 并行处理。
+Ctrl-C / SIGTERM 会在处理完当前文件后停止，已提交的结果保留。
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+# 结果示例的默认条数（verify / gc）
+_SAMPLE_LIMIT = 10
+
+
+# -----------------------------------------------------------------------
+# 进度与并行
+# -----------------------------------------------------------------------
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class _Progress:
+    """
+    后台线程定期向 stderr 输出 scan_state 中的进度（完成数 / 总数、速率、预计剩余时间），
+    同时更新跨进程变更标记，让 Web 服务及时看到新写入的数据。
+    images=False 时（只生成缩略图，不增删图片）图片变更标记只在结束时更新一次。
+    """
+
+    def __init__(self, label: str, interval: float, images: bool = True):
+        self.label = label
+        self.interval = interval
+        self.images = images
+        self._folder_generation = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cli-progress", daemon=True)
+        self._start = 0.0
+
+    def __enter__(self) -> "_Progress":
+        from app.services.init_service import scan_state
+
+        from app.services.folder_tree_service import folder_tree
+
+        scan_state.begin()
+        self._folder_generation = folder_tree.generation
+        self._start = time.monotonic()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        from app.services.cache_service import external_changes
+        from app.services.init_service import scan_state
+
+        if scan_state.scanning:
+            scan_state.finish(exc_type is None, str(exc) if exc else None)
+        self._done.set()
+        self._thread.join()
+        external_changes.touch()
+        self._folder_generation = _signal_folder_changes(self._folder_generation)
+        self._report(final=True)
+
+    def _run(self) -> None:
+        from app.services.cache_service import external_changes
+
+        while not self._done.wait(self.interval):
+            if self.images:
+                external_changes.touch()
+            self._folder_generation = _signal_folder_changes(self._folder_generation)
+            self._report()
+
+    def _report(self, final: bool = False) -> None:
+        from app.services.init_service import scan_state
+
+        state = scan_state.to_dict()
+        done, total = state["files_done"], state["files_total"]
+        elapsed = time.monotonic() - self._start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        parts = [f"[{self.label}] {done}/{total}" if total else f"[{self.label}] {done}"]
+        if total:
+            parts.append(f"{done / total:.1%}")
+        parts.append(f"{rate:.1f}/s")
+        if final:
+            parts.append(f"用时 {_format_duration(elapsed)}，{state['phase']}")
+        elif total and rate > 0:
+            parts.append(f"剩余约 {_format_duration((total - done) / rate)}")
+        if state["queues"] and not final:
+            # 扫描流水线各队列深度：长期接近满的队列，其下游阶段就是瓶颈
+            parts.append("队列 " + " ".join(f"{name}={depth}" for name, depth in state["queues"].items()))
+        print(" ".join(parts), file=sys.stderr, flush=True)
+
+
+def _signal_folder_changes(since: int) -> int:
+    """本进程自 since 以来改写过文件夹时更新文件夹变更标记，返回当前的 folder_tree.generation"""
+    from app.services.cache_service import external_folder_changes
+    from app.services.folder_tree_service import folder_tree
+
+    generation = folder_tree.generation
+    if generation != since:
+        external_folder_changes.touch()
+    return generation
+
+
+def _run_parallel(
+    items: Iterable[Any],
+    workers: int,
+    handler: Callable[[Any, Any], Awaitable[str]],
+) -> Counter:
+    """
+    items 由 workers 个线程从共享队列中领取，每个线程一个事件循环和一个 Session，
+    逐个 await handler(db, item)，按返回的结果标签计数（异常计为 failed）。
+    """
+    from app.database.database import SessionLocal
+    from app.services.init_service import scan_state
+    from app.utils.logger import logger
+
+    pending: "queue.SimpleQueue" = queue.SimpleQueue()
+    for item in items:
+        pending.put(item)
+    counts: Counter = Counter()
+    counts_lock = threading.Lock()
+
+    async def drain(db) -> None:
+        while not scan_state.stop_requested:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = await handler(db, item)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"处理失败 {item}: {str(e)}")
+                result = "failed"
+            with counts_lock:
+                counts[result] += 1
+            scan_state.advance()
+
+    def worker() -> None:
+        db = SessionLocal()
+        try:
+            asyncio.run(drain(db))
+        finally:
+            db.close()
+
+    threads = [
+        threading.Thread(target=worker, name=f"cli-worker-{i}")
+        for i in range(max(1, workers))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def _install_stop_handlers() -> None:
+    """第一次 Ctrl-C / SIGTERM 请求各线程处理完当前文件后停止，再按一次 Ctrl-C 立即退出"""
+    from app.services.init_service import scan_state
+
+    def handle(signum, frame):
+        if scan_state.stop_requested and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        scan_state.request_stop()
+        print("正在停止：处理完当前文件后退出（再按一次 Ctrl-C 立即退出）",
+              file=sys.stderr, flush=True)
+
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+
+
+def _print_samples(title: str, values: List[str], limit: int) -> None:
+    print(f"{title}: {len(values)}")
+    for value in sorted(values)[:limit]:
+        print(f"  {value}")
+    if len(values) > limit:
+        print(f"  ... 另有 {len(values) - limit} 项")
+
+
+# -----------------------------------------------------------------------
+# 子命令
+# -----------------------------------------------------------------------
+def cmd_scan(args: argparse.Namespace) -> int:
+    from app.database.database import SessionLocal
+    from app.services.init_service import InitializationService
+
+    async def scan() -> bool:
+        db = SessionLocal()
+        try:
+            service = InitializationService(db)
+            if not await service.process_folders():
+                return False
+            return await service.process_files(workers=args.workers)
+        finally:
+            db.close()
+
+    with _Progress("scan", args.progress_interval):
+        ok = asyncio.run(scan())
+    return 0 if ok else 1
+
+
+def cmd_rescan(args: argparse.Namespace) -> int:
+    if args.incremental:
+        return _rescan_incremental(args)
+
+    from app.database.database import SessionLocal
+    from app.services.init_service import InitializationService
+
+    async def rescan() -> bool:
+        db = SessionLocal()
+        try:
+            service = InitializationService(db)
+            ok, message = await service.full_scan()
+            print(message, file=sys.stderr)
+            return ok
+        finally:
+            db.close()
+
+    with _Progress("rescan", args.progress_interval):
+        ok = asyncio.run(rescan())
+    return 0 if ok else 1
+
+
+def _rescan_incremental(args: argparse.Namespace) -> int:
+    """
+    对所有文件夹做一次补偿验证（与用户浏览时触发的相同逻辑）。
+    验证过程中新发现的子文件夹在下一轮继续验证，直到没有新的文件夹。
+    """
+    from app.database.database import SessionLocal
+    from app.database.models import Folder
+    from app.services.folder_service import FolderService
+    from app.services.init_service import scan_state
+
+    async def validate(db, folder_id: int) -> str:
+        await FolderService(db).validate_folder_content(folder_id)
+        return "validated"
+
+    validated = set()
+    counts: Counter = Counter()
+    with _Progress("rescan", args.progress_interval):
+        while not scan_state.stop_requested:
+            db = SessionLocal()
+            try:
+                folder_ids = [
+                    folder_id for (folder_id,) in db.query(Folder.id).order_by(Folder.id)
+                    if folder_id not in validated
+                ]
+            finally:
+                db.close()
+            if not folder_ids:
+                break
+            validated.update(folder_ids)
+            scan_state.set_total(len(validated))
+            counts.update(_run_parallel(folder_ids, args.workers, validate))
+
+    print(f"已验证 {counts['validated']} 个文件夹，失败 {counts['failed']}", file=sys.stderr)
+    return 0 if not counts["failed"] else 1
+
+
+def cmd_thumbs(args: argparse.Namespace) -> int:
+    """补齐缺失（从未生成、已被缓存淘汰或文件丢失）的缩略图；--regenerate 时全部重新生成"""
+    from app.database.database import SessionLocal
+    from app.database.models import Image
+    from app.services.cache_service import thumbnail_cache, thumbnail_exists
+    from app.services.image_service import ImageService
+    from app.services.init_service import scan_state
+    from app.utils.pack_store import PackStore
+
+    db = SessionLocal()
+    try:
+        query = db.query(Image.id, Image.thumbnail_path).order_by(Image.id)
+        if args.folder is not None:
+            query = query.filter(Image.folder_id == args.folder)
+        rows = query.all()
+    finally:
+        db.close()
+
+    if isinstance(thumbnail_cache, PackStore) and not args.regenerate:
+        # 从 files 切换到 pack：旧目录中的缩略图一次性导入段文件
+        migrated = sum(
+            thumbnail_cache.import_legacy(thumbnail_path) for _, thumbnail_path in rows if thumbnail_path
+        )
+        if migrated:
+            print(f"已将 {migrated} 张缩略图导入打包存储", file=sys.stderr)
+    image_ids = [
+        image_id for image_id, thumbnail_path in rows
+        if args.regenerate or not thumbnail_path or not thumbnail_exists(thumbnail_path)
+    ]
+
+    async def regenerate(db, image_id: int) -> str:
+        image = db.query(Image).filter(Image.id == image_id).first()
+        if image is None:
+            return "skipped"
+        await ImageService(db).ensure_thumbnail(image, force=args.regenerate)
+        return "generated"
+
+    with _Progress("thumbs", args.progress_interval, images=False):
+        scan_state.set_total(len(image_ids))
+        counts = _run_parallel(image_ids, args.workers, regenerate)
+
+    from app.services.cache_service import CacheService, flush_thumbnail_evictions
+
+    flush_thumbnail_evictions()
+    CacheService.save_indexes()
+    print(f"已生成 {counts['generated']} 张缩略图，失败 {counts['failed']}", file=sys.stderr)
+    return 0 if not counts["failed"] else 1
+
+
+def _cache_files(root: str) -> Dict[str, float]:
+    """缓存目录下的文件（相对路径 → mtime），跳过索引与未完成的临时文件"""
+    from app.utils.disk_cache import INDEX_FILE_NAME
+
+    found = {}
+    for dirpath, _, filenames in os.walk(root):
+        for file_name in filenames:
+            if file_name.startswith(INDEX_FILE_NAME) or file_name.endswith(".tmp"):
+                continue
+            full_path = os.path.join(dirpath, file_name)
+            try:
+                found[os.path.relpath(full_path, root)] = os.path.getmtime(full_path)
+            except OSError:
+                continue
+    return found
+
+
+def _referenced_cache_keys(db) -> Dict[str, set]:
+    """数据库引用的缩略图与 HEIC 转换文件（含按需转换的固定文件名）"""
+    from app.database.models import Image
+    from app.services.conversion_service import ConversionService
+
+    thumbnails, converted = set(), set()
+    for image in db.query(Image.id, Image.file_path, Image.fingerprint, Image.thumbnail_path,
+                          Image.converted_path, Image.is_heic).yield_per(10000):
+        if image.thumbnail_path:
+            thumbnails.add(image.thumbnail_path)
+        if image.converted_path:
+            converted.add(image.converted_path)
+        if image.is_heic:
+            converted.add(ConversionService.cache_key(image))
+    return {"thumbnails": thumbnails, "converted": converted}
+
+
+def _orphan_cache_files(db, grace_seconds: float) -> Dict[str, List[str]]:
+    """
+    未被数据库引用的缓存文件。最近 grace_seconds 内写入的文件不算：
+    生成缩略图时先写文件再提交数据库，刚写好的文件可能还没有对应记录。
+    """
+    from app.services.cache_service import thumbnail_cache
+    from app.utils.pack_store import PackStore
+
+    referenced = _referenced_cache_keys(db)
+    cutoff = time.time() - grace_seconds
+    found = {name: _cache_files(str(root)) for name, root in _cache_roots().items()}
+    if isinstance(thumbnail_cache, PackStore):
+        # 打包存储中的条目（以最近访问时间代替 mtime），加上旧目录中尚未导入的文件
+        found["thumbnails"].update(thumbnail_cache.items())
+    return {
+        name: [
+            key for key, mtime in files.items()
+            if key not in referenced[name] and mtime < cutoff
+        ]
+        for name, files in found.items()
+    }
+
+
+def _cache_roots() -> Dict[str, str]:
+    from app.config import settings
+
+    return {"thumbnails": settings.THUMBNAIL_DIR, "converted": settings.CONVERTED_DIR}
+
+
+def cmd_gc(args: argparse.Namespace) -> int:
+    from app.config import settings
+    from app.database.database import SessionLocal
+    from app.database.models import FailedImage
+    from app.services.cache_service import CacheService, thumbnail_cache
+    from app.services.conversion_service import converted_cache
+    from app.utils.pack_store import PackStore
+
+    db = SessionLocal()
+    try:
+        orphans = _orphan_cache_files(db, args.grace)
+        stale_failures = [
+            failure for failure in db.query(FailedImage)
+            if not os.path.isfile(os.path.join(settings.IMAGES_DIR, failure.file_path))
+        ]
+
+        for name, cache in (("thumbnails", thumbnail_cache), ("converted", converted_cache)):
+            _print_samples(f"未被引用的{name}缓存文件", orphans[name], args.limit)
+            if args.dry_run:
+                continue
+            for key in orphans[name]:
+                if key in cache:
+                    cache.discard(key)
+                else:
+                    try:
+                        os.remove(os.path.join(_cache_roots()[name], key))
+                    except FileNotFoundError:
+                        pass
+
+        if isinstance(thumbnail_cache, PackStore) and not args.dry_run:
+            reclaimed = thumbnail_cache.compact(settings.THUMBNAIL_PACK_COMPACT_RATIO)
+            print(f"打包存储压缩回收 {reclaimed} 字节")
+
+        _print_samples("源文件已不存在的失败记录", [f.file_path for f in stale_failures], args.limit)
+        if not args.dry_run:
+            for failure in stale_failures:
+                db.delete(failure)
+            db.commit()
+            CacheService.save_indexes()
+    finally:
+        db.close()
+
+    if args.dry_run:
+        print("（--dry-run：未删除任何内容）")
+    return 0
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """只读校验：数据库记录与文件系统、缓存文件是否一致"""
+    from app.config import settings
+    from app.database.database import SessionLocal
+    from app.database.models import FailedImage, Folder, Image
+    from app.services.cache_service import thumbnail_exists
+    from app.services.file_service import FileService
+
+    db = SessionLocal()
+    try:
+        _, files = FileService(db).collect_paths()
+        disk_files = {os.path.relpath(path, settings.IMAGES_DIR) for path, _ in files}
+        db_files = {path for (path,) in db.query(Image.file_path)}
+        failed_files = {path for (path,) in db.query(FailedImage.file_path)}
+
+        missing_folders = [
+            path for (path,) in db.query(Folder.folder_path)
+            if not os.path.isdir(os.path.join(settings.IMAGES_DIR, path))
+        ]
+        missing_thumbnails = [
+            path for path, thumbnail_path in db.query(Image.file_path, Image.thumbnail_path)
+            if not thumbnail_path or not thumbnail_exists(thumbnail_path)
+        ]
+        orphans = _orphan_cache_files(db, args.grace)
+    finally:
+        db.close()
+
+    report = {
+        # 数据库中有、磁盘上已不存在（rescan --incremental 会清理）
+        "missing_sources": sorted(db_files - disk_files),
+        "missing_folders": sorted(missing_folders),
+        # 磁盘上有、既未入库也不在失败列表中（scan 会补录）
+        "unindexed_files": sorted(disk_files - db_files - failed_files),
+        "failed_files": sorted(failed_files & disk_files),
+        # 缩略图缺失不影响使用（访问时按需生成），thumbs 可以提前补齐
+        "missing_thumbnails": sorted(missing_thumbnails),
+        "orphan_thumbnails": sorted(orphans["thumbnails"]),
+        "orphan_converted": sorted(orphans["converted"]),
+    }
+    consistent = not (
+        report["missing_sources"] or report["missing_folders"] or report["unindexed_files"]
+    )
+
+    if args.json:
+        print(json.dumps({
+            "consistent": consistent,
+            "counts": {name: len(values) for name, values in report.items()},
+            "samples": {name: values[: args.limit] for name, values in report.items()},
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"数据库图片: {len(db_files)}，磁盘文件: {len(disk_files)}")
+        for name, values in report.items():
+            _print_samples(name, values, args.limit)
+        print("一致" if consistent else "不一致")
+    return 0 if consistent else 1
+
+
+def cmd_shard(args: argparse.Namespace) -> int:
+    """多节点分片扫描（见 app/services/shard_service.py）"""
+    from app.config import settings
+    from app.database.database import SessionLocal
+    from app.services.shard_service import ShardService
+
+    db = SessionLocal()
+    try:
+        service = ShardService(db)
+        if args.shard_command == "plan":
+            depth = settings.SHARD_DEPTH if args.depth is None else args.depth
+            created = asyncio.run(service.plan(depth, reset=args.reset))
+            print(f"新增 {created} 个分片", file=sys.stderr)
+            return 0
+
+        if args.shard_command == "work":
+            print(f"节点 {service.node_id} 开始领取分片", file=sys.stderr)
+            with _Progress("shard", args.progress_interval):
+                shards, files = asyncio.run(service.run(args.workers))
+            print(f"本节点完成 {shards} 个分片，{files} 个文件", file=sys.stderr)
+            return 0
+
+        status = service.status()
+        if args.json:
+            print(json.dumps(status, ensure_ascii=False, indent=2, default=str))
+        else:
+            print(" ".join(f"{name}={count}" for name, count in status["counts"].items()))
+            print(f"已处理文件: {status['files_done']}，失败: {status['files_failed']}")
+            for lease in status["leased"]:
+                print(f"  [leased] {lease['folder_path']} owner={lease['owner']} "
+                      f"expires={lease['lease_expires_at']} attempts={lease['attempts']}")
+            for failure in status["failed"]:
+                print(f"  [failed] {failure['folder_path']}: {failure['error']}")
+        return 0
+    finally:
+        db.close()
+
+
+def _open_index_file(path: str, mode: str):
+    """索引导出文件：- 为标准输入/输出，.gz 结尾时透明压缩"""
+    if path == "-":
+        return os.fdopen(os.dup((sys.stdout if "w" in mode else sys.stdin).fileno()), mode)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    """流式导出索引（见 app/services/index_transfer_service.py）"""
+    from app.database.database import SessionLocal
+    from app.services.index_transfer_service import IndexTransferService
+
+    db = SessionLocal()
+    lines = 0
+    try:
+        with _open_index_file(args.output, "wb") as output:
+            for line in IndexTransferService(db).export_lines():
+                output.write(line)
+                lines += 1
+    finally:
+        db.close()
+    print(f"导出 {lines - 1} 条记录", file=sys.stderr)
+    return 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    """从 export 的输出恢复索引，按批插入"""
+    from app.database.database import SessionLocal
+    from app.services.cache_service import external_changes
+    from app.services.index_transfer_service import IndexTransferService
+
+    db = SessionLocal()
+    started = time.monotonic()
+    try:
+        importer = IndexTransferService(db).importer(args.replace, args.batch_size)
+        with _open_index_file(args.input, "rb") as source:
+            importer.add_lines(source)
+        counts = importer.finish()
+    except ValueError as e:
+        print(f"导入失败: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+        external_changes.touch()
+    print(f"导入文件夹 {counts['folders']} 个，图片 {counts['images']} 张，"
+          f"耗时 {_format_duration(time.monotonic() - started)}", file=sys.stderr)
+    return 0
+
+
+# -----------------------------------------------------------------------
+# 入口
+# -----------------------------------------------------------------------
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli", description="SimplePhotos 离线扫描与维护工具"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="在终端输出 INFO 日志")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_worker_args(sub: argparse.ArgumentParser) -> None:
+        sub.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                         help="并行线程数（默认 CPU 核数）")
+        sub.add_argument("--progress-interval", type=float, default=2.0,
+                         help="进度输出间隔（秒）")
+
+    scan = subparsers.add_parser("scan", help="导入数据库中还没有的文件")
+    add_worker_args(scan)
+    scan.set_defaults(func=cmd_scan)
+
+    rescan = subparsers.add_parser("rescan", help="全量重建，或 --incremental 增量同步")
+    rescan.add_argument("--incremental", action="store_true",
+                        help="逐个文件夹对比文件系统，只处理差异（不清空数据库）")
+    add_worker_args(rescan)
+    rescan.set_defaults(func=cmd_rescan)
+
+    thumbs = subparsers.add_parser("thumbs", help="补齐或重新生成缩略图")
+    thumbs.add_argument("--regenerate", action="store_true", help="重新生成全部缩略图")
+    thumbs.add_argument("--folder", type=int, help="只处理指定文件夹 ID")
+    add_worker_args(thumbs)
+    thumbs.set_defaults(func=cmd_thumbs)
+
+    shard = subparsers.add_parser("shard", help="多节点分片扫描（共享 PostgreSQL 与 CACHE_DIR）")
+    shard_commands = shard.add_subparsers(dest="shard_command", required=True)
+    plan = shard_commands.add_parser("plan", help="建立文件夹记录并切分分片")
+    plan.add_argument("--depth", type=int, default=None,
+                      help="按该深度的文件夹子树切分（默认 SHARD_DEPTH）")
+    plan.add_argument("--reset", action="store_true", help="清空已有分片后重新规划")
+    work = shard_commands.add_parser("work", help="领取并处理分片，直到全部完成")
+    add_worker_args(work)
+    status = shard_commands.add_parser("status", help="查看分片进度与租约")
+    status.add_argument("--json", action="store_true", help="以 JSON 输出")
+    shard.set_defaults(func=cmd_shard)
+
+    export = subparsers.add_parser("export", help="导出索引为 NDJSON")
+    export.add_argument("-o", "--output", default="-",
+                        help="输出文件（默认标准输出，.gz 结尾时压缩）")
+    export.set_defaults(func=cmd_export)
+
+    index_import = subparsers.add_parser("import", help="从 NDJSON 导出文件恢复索引")
+    index_import.add_argument("input", help="export 的输出文件（- 为标准输入，支持 .gz）")
+    index_import.add_argument("--replace", action="store_true", help="先清空现有索引")
+    index_import.add_argument("--batch-size", type=int, default=1000, help="每批插入的行数")
+    index_import.set_defaults(func=cmd_import)
+
+    for name, func, help_text in (
+        ("gc", cmd_gc, "清理未被引用的缓存文件与失效的失败记录"),
+        ("verify", cmd_verify, "校验数据库与文件系统是否一致"),
+    ):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--grace", type=float, default=3600,
+                         help="最近该秒数内写入的缓存文件不视为孤儿（默认 3600）")
+        sub.add_argument("--limit", type=int, default=_SAMPLE_LIMIT, help="每类输出的示例条数")
+        if name == "gc":
+            sub.add_argument("--dry-run", action="store_true", help="只列出，不删除")
+        else:
+            sub.add_argument("--json", action="store_true", help="以 JSON 输出")
+        sub.set_defaults(func=func)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+
+    workers = getattr(args, "workers", None)
+    if workers is not None:
+        # 媒体线程池在 app.utils.image_utils 导入时按 SCAN_WORKERS 创建，必须先于导入 app 设置
+        os.environ["SCAN_WORKERS"] = str(max(1, workers))
+
+    from app.database.database import create_tables
+    from app.utils.logger import logger
+
+    if not args.verbose:
+        # 终端只保留警告与进度输出，完整日志仍写入日志文件
+        for handler in logger.handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
+
+    from app.services.folder_tree_service import folder_tree, install_folder_tree_hooks
+
+    create_tables()
+    _install_stop_handlers()
+    # 会话事件维护 folder_tree.generation，据此判断本进程是否改写过文件夹
+    install_folder_tree_hooks()
+    generation = folder_tree.generation
+    try:
+        return args.func(args)
+    finally:
+        _signal_folder_changes(generation)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
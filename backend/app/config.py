@@ -5,6 +5,12 @@ from typing import List
 from pydantic_settings import BaseSettings
 
 
+def _parse_sizes(value: str, default: str) -> List[int]:
+    """逗号分隔的像素尺寸（如 "100,200"）→ 升序整数列表，为空时使用 default"""
+    sizes = sorted(int(size) for size in value.split(',') if size.strip())
+    return sizes or _parse_sizes(default, default)
+
+
 class Settings(BaseSettings):
     # 基础配置
     APP_NAME: str = "SimplePhotos"
@@ -17,7 +23,8 @@ class Settings(BaseSettings):
     # 数据目录配置
     DATA_DIR: Path = DATA_ROOT
     IMAGES_DIR: Path = Path(os.getenv('IMAGES_DIR', str(DATA_DIR / "images")))
-    CACHE_DIR: Path = DATA_DIR / "cache"
+    # 多节点分片扫描时指向各节点共享的缓存路径（NFS / SMB），缩略图写入同一位置
+    CACHE_DIR: Path = Path(os.getenv('CACHE_DIR', str(DATA_DIR / "cache")))
     THUMBNAIL_DIR: Path = CACHE_DIR / "thumbnails"
     CONVERTED_DIR: Path = CACHE_DIR / "converted"
     LOGS_DIR: Path = DATA_DIR / "logs"
@@ -32,6 +39,10 @@ class Settings(BaseSettings):
     PG_PASSWORD: str = os.getenv('PG_PASSWORD', '')
     PG_DATABASE: str = os.getenv('PG_DATABASE', 'simplephotos')
 
+    # SQLite 并发配置：启用 WAL，离线 CLI 写库时 Web 服务的读请求不被阻塞；
+    # SQLITE_BUSY_TIMEOUT: 等待其他进程 / 线程释放写锁的最长时间（秒）
+    SQLITE_BUSY_TIMEOUT: float = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))
+
     @property
     def DATABASE_URL(self) -> str:
         if self.DB_TYPE == 'postgresql':
@@ -60,34 +71,172 @@ class Settings(BaseSettings):
     API_THUMBNAILS_PATH: str = "/data/thumbnails"
     API_CONVERTED_PATH: str = "/data/converted"
 
-    # 扫描处理配置 - 使用简单的环境变量覆盖
+    # 扫描处理配置 - 使用简单的环境变量覆盖（流水线见 app/services/scan_pipeline.py）
+    # SCAN_WORKERS: 并发解码任务数（同时也是媒体线程池大小）
+    # SCAN_CHUNK_SIZE: 遍历分批与写库批量提交的文件数
+    # SCAN_QUEUE_SIZE: 各阶段之间队列的容量（文件数），决定在途文件数上限
+    # SCAN_PRIORITY_ENABLED: 扫描期间用户打开的文件夹（及其可见子文件夹的首页）插队优先处理
     SCAN_WORKERS: int = int(os.getenv('SCAN_WORKERS', os.cpu_count() or 4))
     SCAN_CHUNK_SIZE: int = int(os.getenv('SCAN_CHUNK_SIZE', 20))
+    SCAN_QUEUE_SIZE: int = int(os.getenv('SCAN_QUEUE_SIZE', 256))
+    SCAN_PRIORITY_ENABLED: bool = os.getenv('SCAN_PRIORITY_ENABLED', 'true').lower() == 'true'
+    # 多节点分片扫描（python -m app.cli shard ...，各节点共享 PostgreSQL 与 CACHE_DIR）
+    # SHARD_DEPTH: 按该深度的文件夹子树切分分片（更浅的文件夹各自只处理本层文件）
+    # SHARD_LEASE_SECONDS: 租约有效期，节点崩溃后超过该时间分片可被其他节点接管
+    # SHARD_HEARTBEAT_SECONDS: 续约间隔，应明显小于租约有效期
+    # SHARD_MAX_ATTEMPTS: 同一分片最多被领取的次数，超过后标记为失败（避免反复拖垮节点）
+    # SCAN_NODE_ID: 节点标识，默认 主机名:进程号
+    SHARD_DEPTH: int = int(os.getenv('SHARD_DEPTH', 1))
+    SHARD_LEASE_SECONDS: int = int(os.getenv('SHARD_LEASE_SECONDS', 120))
+    SHARD_HEARTBEAT_SECONDS: int = int(os.getenv('SHARD_HEARTBEAT_SECONDS', 30))
+    SHARD_MAX_ATTEMPTS: int = int(os.getenv('SHARD_MAX_ATTEMPTS', 3))
+    SCAN_NODE_ID: str = os.getenv('SCAN_NODE_ID', '')
+    # 单个视频处理（元数据 + 取帧）的时间预算（秒），超时即放弃该文件
+    VIDEO_TIME_BUDGET: float = float(os.getenv('VIDEO_TIME_BUDGET', 30))
+
+    # 缩略图缓存配置
+    # THUMBNAIL_CACHE_MAX_MB: THUMBNAIL_DIR 容量上限，超出后淘汰，0 表示不限
+    # THUMBNAIL_CACHE_POLICY: 淘汰策略，lru（最久未访问）/ lfu（访问次数最少）
+    THUMBNAIL_CACHE_MAX_MB: int = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', 0))
+    THUMBNAIL_CACHE_POLICY: str = os.getenv('THUMBNAIL_CACHE_POLICY', 'lru').lower()
+    # THUMBNAIL_STORE: 缩略图存储方式，files（每张一个文件）/ pack（打包存储，见 app/utils/pack_store.py）
+    # THUMBNAIL_PACK_DIR: 打包存储的段文件与索引目录
+    # THUMBNAIL_PACK_SEGMENT_MB: 单个段文件的大小上限
+    # THUMBNAIL_PACK_COMPACT_INTERVAL: 后台压缩间隔（秒），0 表示不自动压缩
+    # THUMBNAIL_PACK_COMPACT_RATIO: 段内已删除数据占比达到该值时压缩该段
+    THUMBNAIL_STORE: str = os.getenv('THUMBNAIL_STORE', 'files').lower()
+    THUMBNAIL_PACK_DIR: Path = Path(os.getenv('THUMBNAIL_PACK_DIR', str(CACHE_DIR / "thumbnail-packs")))
+    THUMBNAIL_PACK_SEGMENT_MB: int = int(os.getenv('THUMBNAIL_PACK_SEGMENT_MB', 256))
+    THUMBNAIL_PACK_COMPACT_INTERVAL: int = int(os.getenv('THUMBNAIL_PACK_COMPACT_INTERVAL', 600))
+    THUMBNAIL_PACK_COMPACT_RATIO: float = float(os.getenv('THUMBNAIL_PACK_COMPACT_RATIO', 0.5))
+
+    # 图片列表页缓存：缓存序列化后的响应，按文件夹代数精确失效
+    # LISTING_CACHE_SIZE: 最多缓存的列表页数（LRU）
+    LISTING_CACHE_ENABLED: bool = os.getenv('LISTING_CACHE_ENABLED', 'true').lower() == 'true'
+    LISTING_CACHE_SIZE: int = int(os.getenv('LISTING_CACHE_SIZE', 2048))
+
+    # 分页缩略图雪碧图配置
+    # SPRITE_ENABLED: 列表接口返回雪碧图坐标，前端一页只需一次缩略图请求
+    # SPRITE_CELL_SIZES: 允许的格子边长（像素，逗号分隔），默认取最大值；
+    #   按字符串声明（pydantic-settings 会把 List 字段的环境变量当 JSON 解析），
+    #   解析后的列表见 SPRITE_CELL_SIZE_LIST
+    # SPRITE_COLUMNS: 每行格子数；SPRITE_QUALITY: JPEG 质量
+    # SPRITE_CACHE_MAX_MB: 雪碧图缓存容量上限，超出按 LRU 淘汰，0 表示不限
+    SPRITE_ENABLED: bool = os.getenv('SPRITE_ENABLED', 'true').lower() == 'true'
+    SPRITE_CELL_SIZES: str = os.getenv('SPRITE_CELL_SIZES', '100,200')
+    SPRITE_COLUMNS: int = int(os.getenv('SPRITE_COLUMNS', 5))
+    SPRITE_QUALITY: int = int(os.getenv('SPRITE_QUALITY', 80))
+    SPRITE_CACHE_MAX_MB: int = int(os.getenv('SPRITE_CACHE_MAX_MB', 256))
+
+    @property
+    def SPRITE_CELL_SIZE_LIST(self) -> List[int]:
+        return _parse_sizes(self.SPRITE_CELL_SIZES, '100,200')
+
+    # 按需缩放接口（/api/images/{id}/render）
+    # RENDITION_SIZES: 允许的宽/高取值（像素，逗号分隔），其他尺寸返回 400，避免缓存被任意尺寸撑爆；
+    #   与 SPRITE_CELL_SIZES 一样按字符串声明，解析后的列表见 RENDITION_SIZE_LIST
+    # RENDITION_QUALITY: JPEG / WebP 质量
+    # RENDITION_CACHE_MAX_MB: 缩放结果缓存容量上限，超出按 LRU 淘汰，0 表示不限
+    RENDITION_ENABLED: bool = os.getenv('RENDITION_ENABLED', 'true').lower() == 'true'
+    RENDITION_SIZES: str = os.getenv('RENDITION_SIZES', '320,640,1024,1600,2048')
+    RENDITION_QUALITY: int = int(os.getenv('RENDITION_QUALITY', 85))
+    RENDITION_CACHE_MAX_MB: int = int(os.getenv('RENDITION_CACHE_MAX_MB', 1024))
+
+    @property
+    def RENDITION_SIZE_LIST(self) -> List[int]:
+        return _parse_sizes(self.RENDITION_SIZES, '320,640,1024,1600,2048')
+
+    # 打包下载（/api/folders/{id}/download 与 /api/images/download）
+    # DOWNLOAD_CHUNK_KB: 流式读取原文件的块大小，即单个下载占用的内存
+    # DOWNLOAD_MAX_SELECTION: 选中下载一次最多包含的图片数
+    DOWNLOAD_ENABLED: bool = os.getenv('DOWNLOAD_ENABLED', 'true').lower() == 'true'
+    DOWNLOAD_CHUNK_KB: int = int(os.getenv('DOWNLOAD_CHUNK_KB', 1024))
+    DOWNLOAD_MAX_SELECTION: int = int(os.getenv('DOWNLOAD_MAX_SELECTION', 10000))
+
+    # 浏览预取配置（见 app/services/prefetch_service.py）
+    # PREFETCH_PAGES: 返回第 N 页后预热的后续页数
+    # PREFETCH_SUBFOLDER_IMAGES: 每个可见子文件夹预热的首屏图片数
+    # PREFETCH_CONCURRENCY: 所有预取任务共用的并发上限
+    # PREFETCH_TIME_BUDGET: 单个预取任务的时间预算（秒）
+    PREFETCH_ENABLED: bool = os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true'
+    PREFETCH_PAGES: int = int(os.getenv('PREFETCH_PAGES', 2))
+    PREFETCH_SUBFOLDER_IMAGES: int = int(os.getenv('PREFETCH_SUBFOLDER_IMAGES', 10))
+    PREFETCH_CONCURRENCY: int = int(os.getenv('PREFETCH_CONCURRENCY', 1))
+    PREFETCH_TIME_BUDGET: float = float(os.getenv('PREFETCH_TIME_BUDGET', 20))
+
+    # HEIC 转换配置
+    # HEIC_LAZY_CONVERSION: 扫描时不转换，首次打开原图时按需转换为 JPEG
+    # CONVERTED_CACHE_MAX_MB: 转换缓存（CONVERTED_DIR）容量上限，超出按 LRU 淘汰，0 表示不限
+    # HEIC_PRECONVERT_COUNT: 打开一张 HEIC 后，预先转换同文件夹中后续的张数
+    HEIC_LAZY_CONVERSION: bool = os.getenv('HEIC_LAZY_CONVERSION', 'true').lower() == 'true'
+    CONVERTED_CACHE_MAX_MB: int = int(os.getenv('CONVERTED_CACHE_MAX_MB', 2048))
+    HEIC_PRECONVERT_COUNT: int = int(os.getenv('HEIC_PRECONVERT_COUNT', 3))
+
+    # 失败文件重试配置
+    # 退避间隔 = RETRY_BASE_SECONDS * 2^重试次数，封顶 RETRY_MAX_BACKOFF_SECONDS
+    RETRY_ENABLED: bool = os.getenv('RETRY_ENABLED', 'true').lower() == 'true'
+    RETRY_INTERVAL_SECONDS: int = int(os.getenv('RETRY_INTERVAL_SECONDS', 60))
+    RETRY_BASE_SECONDS: int = int(os.getenv('RETRY_BASE_SECONDS', 60))
+    RETRY_MAX_BACKOFF_SECONDS: int = int(os.getenv('RETRY_MAX_BACKOFF_SECONDS', 6 * 3600))
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv('RETRY_MAX_ATTEMPTS', 8))
+    RETRY_BATCH_SIZE: int = int(os.getenv('RETRY_BATCH_SIZE', 50))
 
+    # 监控配置
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
 
-    def __init__(self):
-        super().__init__()
-        print(f"数据库配置:")
-        print(f"  DB_TYPE: {self.DB_TYPE}")
+    # JSON 响应压缩配置（brotli 为可选依赖，未安装时只用 gzip）
+    # COMPRESSION_MIN_BYTES: 小于该大小的响应不压缩
+    COMPRESSION_ENABLED: bool = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_BYTES: int = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+
+    # 性能剖析配置
+    # SERVER_TIMING_ENABLED: API 响应附带 Server-Timing 头（db / serialize / fs）
+    # SLOW_QUERY_MS: 慢查询日志阈值（毫秒），0 表示关闭
+    # PROFILE_SAMPLE_RATE: 对请求启用 cProfile 的采样率（0~1），0 表示关闭
+    # PROFILE_THRESHOLD_MS: 被采样请求耗时超过该阈值才保存剖析结果
+    #   （剖析覆盖整个事件循环，并发请求会混入结果，宜在单请求负载下采样）
+    SERVER_TIMING_ENABLED: bool = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+    SLOW_QUERY_MS: float = float(os.getenv('SLOW_QUERY_MS', 200))
+    PROFILE_SAMPLE_RATE: float = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_THRESHOLD_MS: float = float(os.getenv('PROFILE_THRESHOLD_MS', 1000))
+
+    def describe(self) -> str:
+        """配置摘要，服务启动时写入日志（导入模块时不输出）"""
+        lines = ["数据库配置:", f"  DB_TYPE: {self.DB_TYPE}"]
         if self.DB_TYPE == 'postgresql':
-            print(f"  PG_HOST: {self.PG_HOST}")
-            print(f"  PG_PORT: {self.PG_PORT}")
-            print(f"  PG_USER: {self.PG_USER}")
-            print(f"  PG_DATABASE: {self.PG_DATABASE}")
-            # 密码不输出，只显示是否已设置
-            print(f"  PG_PASSWORD: {'***' if self.PG_PASSWORD else '(empty)'}")
-        print(f"  DATABASE_URL: {self.DATABASE_URL}")
-
-        print(f"\n路径配置:")
-        print(f"  BASE_DIR: {self.BASE_DIR}")
-        print(f"  DATA_ROOT: {self.DATA_ROOT}")
-        print(f"  DATA_DIR: {self.DATA_DIR}")
-        print(f"  IMAGES_DIR: {self.IMAGES_DIR}")
-        print(f"  CACHE_DIR: {self.CACHE_DIR}")
-
-        print(f"\n扫描配置:")
-        print(f"  SCAN_WORKERS: {self.SCAN_WORKERS}")
-        print(f"  SCAN_CHUNK_SIZE: {self.SCAN_CHUNK_SIZE}")
+            lines += [
+                f"  PG_HOST: {self.PG_HOST}",
+                f"  PG_PORT: {self.PG_PORT}",
+                f"  PG_USER: {self.PG_USER}",
+                f"  PG_DATABASE: {self.PG_DATABASE}",
+                # 密码不输出，只显示是否已设置
+                f"  PG_PASSWORD: {'***' if self.PG_PASSWORD else '(empty)'}",
+            ]
+        lines.append(f"  DATABASE_URL: {self.DATABASE_URL}")
+
+        lines += [
+            "路径配置:",
+            f"  BASE_DIR: {self.BASE_DIR}",
+            f"  DATA_ROOT: {self.DATA_ROOT}",
+            f"  DATA_DIR: {self.DATA_DIR}",
+            f"  IMAGES_DIR: {self.IMAGES_DIR}",
+            f"  CACHE_DIR: {self.CACHE_DIR}",
+        ]
+
+        lines += [
+            "扫描配置:",
+            f"  SCAN_WORKERS: {self.SCAN_WORKERS}",
+            f"  SCAN_CHUNK_SIZE: {self.SCAN_CHUNK_SIZE}",
+            f"  SCAN_QUEUE_SIZE: {self.SCAN_QUEUE_SIZE}",
+            f"  SCAN_PRIORITY_ENABLED: {self.SCAN_PRIORITY_ENABLED}",
+        ]
+
+        lines += ["缩略图存储:", f"  THUMBNAIL_STORE: {self.THUMBNAIL_STORE}"]
+        if self.THUMBNAIL_STORE == 'pack':
+            lines.append(f"  THUMBNAIL_PACK_DIR: {self.THUMBNAIL_PACK_DIR}")
+        return "\n".join(lines)
 
     def setup_directories(self) -> None:
         """确保所有必要的目录存在，不存在则创建"""
@@ -8,7 +8,7 @@
 通过环境变量 DB_TYPE 切换。
 """
 from app.config import settings
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 
 # -----------------------------------------------------------------------
@@ -27,12 +27,57 @@ else:
     # SQLite 需要允许跨线程访问（开发用）
     engine = create_engine(
         settings.DATABASE_URL,
-        connect_args={"check_same_thread": False},
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT},
     )
 
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, _):
+        """
+        WAL 模式：写事务不阻塞读，Web 服务与离线 CLI（python -m app.cli）可同时访问同一数据库。
+        WAL 下 synchronous=NORMAL 仍保证崩溃后数据库一致，只可能丢失最近的提交。
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+# -----------------------------------------------------------------------
+# 建表与增量补列
+# -----------------------------------------------------------------------
+def create_tables() -> None:
+    """
+    创建缺失的表，并为已有表补齐新增的列。
+
+    create_all 只会建新表，不会修改已有表结构。项目没有引入迁移工具，
+    新增的列统一要求 nullable（或有 server_default），这里通过
+    ALTER TABLE ADD COLUMN 补齐，保证旧库升级后可直接使用。
+    """
+    from app.database.models import Base
+    from app.database.search_index import install_search_index
+
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+                ))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+        # 文件名 / 路径全文检索索引（FTS5 或 pg_trgm）
+        install_search_index(conn)
+
+
 # -----------------------------------------------------------------------
 # FastAPI 依赖注入：获取数据库 Session
 # -----------------------------------------------------------------------
@@ -5,8 +5,8 @@ SQLAlchemy ORM Model 唯一定义文件。
 import os
 from datetime import datetime
 
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, JSON,
-                        String, Text)
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, Float,
+                        ForeignKey, Integer, JSON, String, Text)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -64,6 +64,20 @@ class Image(Base):
     # 使用 JsonType：PG 下为 JSONB（可索引、性能好），其他数据库为标准 JSON
     exif_data = Column(JsonType, nullable=True)
 
+    # 64 位感知哈希（dHash，按有符号整数存储），用于相似图片检索
+    phash = Column(BigInteger, nullable=True, index=True)
+    # ThumbHash 占位图（base64，约 30 字节），前端在缩略图加载前绘制模糊预览
+    thumbhash = Column(String(64), nullable=True)
+    # 内容指纹（大小 + 首尾各 64 KB 的摘要，见 app/utils/fingerprint.py），
+    # 文件被移动 / 改名后据此找回原记录，不必重新处理
+    fingerprint = Column(String(64), nullable=True, index=True)
+
+    # 视频元数据（图片为 NULL）
+    duration = Column(Float, nullable=True)  # 秒
+    fps = Column(Float, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -77,5 +91,36 @@ class FailedImage(Base):
     file_path = Column(String(512), nullable=False, index=True)
     folder_path = Column(String(512), nullable=True)
     error_message = Column(Text, nullable=True)
+    # 错误分类：transient（IO/锁库/挂载抖动，可重试）/ permanent（文件损坏/不支持的编码）
+    error_class = Column(String(16), nullable=True, index=True)
     retry_count = Column(Integer, default=0)
+    last_attempt_at = Column(DateTime, nullable=True)
+    # 下次允许重试的时间（指数退避），NULL 表示立即可重试
+    next_retry_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ScanShard(Base):
+    """
+    多节点分片扫描的租约表（见 app/services/shard_service.py）。
+    每行是一个文件夹子树分片，节点通过条件 UPDATE 领取并定期续约，
+    租约过期的分片可被其他节点重新领取。
+    """
+    __tablename__ = "scan_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 分片根目录（相对 IMAGES_DIR）；recursive=False 时只处理该目录本层的文件
+    folder_path = Column(String(512), unique=True, nullable=False)
+    recursive = Column(Boolean, nullable=False, default=True)
+    # pending / leased / done / failed
+    status = Column(String(16), nullable=False, default="pending", index=True)
+    owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    files_done = Column(Integer, nullable=False, default=0)
+    files_failed = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,99 @@
+"""
+文件名 / 路径 / 相机型号全文检索索引。
+
+检索文本 = Image.file_path（含各级文件夹名）+ EXIF Make + EXIF Model。
+
+SQLite：
+  FTS5 虚拟表 images_fts（trigram 分词，支持任意子串、不区分大小写），
+  rowid 即 Image.id，由 images 表上的触发器同步：扫描、补偿验证、重试等
+  所有写入路径（包括 query.delete() 批量删除）都会自动更新，无需在 Python 代码中维护。
+  已有数据库首次创建索引时一次性回填。trigram 分词需要 SQLite >= 3.34，
+  不支持时不建索引，检索退化为 LIKE 扫描。
+
+PostgreSQL：
+  pg_trgm 扩展 + 检索文本表达式上的 GIN 索引，LIKE '%词%' 直接走索引，
+  表达式索引随行更新，无需触发器。
+"""
+from app.utils.logger import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+FTS_TABLE = "images_fts"
+
+# SQLite 触发器中的检索文本（new / old 为触发器行别名）
+_SQLITE_BODY = (
+    "{row}.file_path"
+    " || ' ' || coalesce(json_extract({row}.exif_data, '$.Make'), '')"
+    " || ' ' || coalesce(json_extract({row}.exif_data, '$.Model'), '')"
+)
+
+# PostgreSQL 检索文本表达式：查询条件必须与索引表达式完全一致才能走索引
+PG_SEARCH_EXPRESSION = (
+    "lower(file_path"
+    " || ' ' || coalesce(exif_data->>'Make', '')"
+    " || ' ' || coalesce(exif_data->>'Model', ''))"
+)
+
+
+def install_search_index(conn: Connection) -> None:
+    """创建检索索引（幂等），在 create_tables 中调用"""
+    if conn.dialect.name == "postgresql":
+        _install_pg(conn)
+    elif conn.dialect.name == "sqlite":
+        _install_sqlite(conn)
+
+
+def sqlite_fts_available(conn: Connection) -> bool:
+    return FTS_TABLE in inspect(conn).get_table_names()
+
+
+def _install_sqlite(conn: Connection) -> None:
+    existed = sqlite_fts_available(conn)
+    if not existed:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, tokenize='trigram')"
+            ))
+        except Exception as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram，文件检索将使用 LIKE 扫描: {str(e)}")
+            return
+
+    new_body = _SQLITE_BODY.format(row="new")
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON images BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, {new_body});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON images BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF file_path, exif_data ON images BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, {new_body});
+        END
+    """))
+
+    if not existed:
+        # 已有数据库升级：回填现有记录
+        body = _SQLITE_BODY.format(row="images")
+        result = conn.execute(text(
+            f"INSERT INTO {FTS_TABLE}(rowid, body) SELECT id, {body} FROM images"
+        ))
+        if result.rowcount:
+            logger.info(f"已为 {result.rowcount} 条图片记录建立检索索引")
+
+
+def _install_pg(conn: Connection) -> None:
+    try:
+        # 扩展需要相应权限，失败时检索仍可用（顺序扫描）
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_images_search_trgm ON images "
+                f"USING gin (({PG_SEARCH_EXPRESSION}) gin_trgm_ops)"
+            ))
+    except Exception as e:
+        logger.warning(f"无法创建 pg_trgm 检索索引，文件检索将使用顺序扫描: {str(e)}")
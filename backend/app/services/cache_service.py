@@ -1,8 +1,205 @@
+"""
+缓存管理：缩略图磁盘缓存的配额与淘汰。
+
+设计说明：
+  THUMBNAIL_DIR 以前没有容量上限，NAS 上的小容量 SSD 缓存卷会被写满。
+  thumbnail_cache 是按 THUMBNAIL_CACHE_MAX_MB 管理的 DiskCache（LRU / LFU，
+  见 THUMBNAIL_CACHE_POLICY），扫描生成缩略图时登记，/data/thumbnails 静态路由
+  命中时刷新访问记录。
+
+  被淘汰的缩略图需要把 Image.thumbnail_path 置空，下次访问时经
+  /api/images/{id}/thumbnail 重新生成。淘汰可能发生在扫描分片的事务中，
+  这里不直接写库，而是先记入待清理列表，由 flush_thumbnail_evictions()
+  在事务提交后（扫描分片提交、按需生成缩略图、应用退出时）批量更新。
+
+  sprite_cache 存放由缩略图拼成的分页雪碧图，rendition_cache 存放按需缩放的原图
+  （见 RenditionService），同样受配额管理。
+
+  THUMBNAIL_STORE=pack 时 thumbnail_cache 换成 PackStore（见 app/utils/pack_store.py），
+  接口与 DiskCache 相同，key 仍是原来的相对路径，数据库中的 thumbnail_path 无需迁移；
+  旧目录中已有的缩略图在第一次访问时导入。读取缩略图内容统一经 open_thumbnail()，
+  判断是否存在经 thumbnail_exists()，不直接拼 THUMBNAIL_DIR 下的路径。
+  段文件中被淘汰、删除的数据由 pack_compactor 在后台定期压缩回收。
+
+  listing_cache 缓存序列化好的图片列表页（见 app/utils/listing_cache.py）。
+  写入 Image 的路径（扫描分片、补偿验证、失败重试、缩略图重新生成 / 淘汰）
+  在提交后调用 listing_cache.bump(文件夹 ID)，按文件夹精确失效。
+
+  离线 CLI 在另一个进程中写库，写入期间定期更新 external_changes 标记文件；
+  Web 进程读取进程内缓存前调用 sync_external_changes()，发现标记变化时
+  使列表页缓存与相似度索引整体失效（见 app/utils/change_stamp.py）。
+  文件夹变更单独用 external_folder_changes 标记，CLI 只在确实改写了文件夹时更新；
+  文件夹树在后台线程中重新加载，完成前继续使用旧的树，不阻塞事件循环。
+"""
+import asyncio
 import os
+import threading
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import BinaryIO, Dict, List, Optional, Union
 
 from app.config import settings
+from app.database.database import SessionLocal
+from app.database.models import Image
+from app.services.conversion_service import converted_cache
+from app.services.folder_tree_service import folder_tree
+from app.services.render_service import rendition_cache
+from app.services.similarity_service import hash_index
+from app.utils.change_stamp import ChangeStamp
+from app.utils.disk_cache import DiskCache
+from app.utils.listing_cache import ListingCache
+from app.utils.logger import logger
+from app.utils.pack_store import PackStore
+
+# 被淘汰、尚未同步到数据库的缩略图相对路径
+_pending_evictions: List[str] = []
+_pending_lock = threading.Lock()
+
+# 单条 UPDATE 的 IN 列表上限
+_EVICTION_BATCH_SIZE = 500
+
+
+def _queue_thumbnail_eviction(key: str) -> None:
+    with _pending_lock:
+        _pending_evictions.append(key)
+
+
+def _create_thumbnail_cache() -> Union[DiskCache, PackStore]:
+    options = dict(
+        max_bytes=settings.THUMBNAIL_CACHE_MAX_MB * 1024 * 1024,
+        policy=settings.THUMBNAIL_CACHE_POLICY,
+        on_evict=_queue_thumbnail_eviction,
+    )
+    if settings.THUMBNAIL_STORE == "files":
+        return DiskCache("thumbnails", settings.THUMBNAIL_DIR, **options)
+    if settings.THUMBNAIL_STORE == "pack":
+        return PackStore(
+            "thumbnails",
+            settings.THUMBNAIL_PACK_DIR,
+            segment_bytes=settings.THUMBNAIL_PACK_SEGMENT_MB * 1024 * 1024,
+            legacy_root=settings.THUMBNAIL_DIR,
+            **options,
+        )
+    raise ValueError(f"不支持的缩略图存储方式: {settings.THUMBNAIL_STORE}")
+
+
+thumbnail_cache = _create_thumbnail_cache()
+
+# 分页缩略图雪碧图（见 SpriteService），内容可随时由缩略图重建，淘汰无需写库
+sprite_cache = DiskCache(
+    "sprites",
+    settings.CACHE_DIR / "sprites",
+    max_bytes=settings.SPRITE_CACHE_MAX_MB * 1024 * 1024,
+)
+
+listing_cache = ListingCache(maxsize=settings.LISTING_CACHE_SIZE)
+
+# 其他进程（离线 CLI）写库的变更标记：图片、文件夹
+external_changes = ChangeStamp(settings.CACHE_DIR / ".external_change")
+external_folder_changes = ChangeStamp(settings.CACHE_DIR / ".external_folder_change")
+
+
+def sync_external_changes() -> None:
+    """
+    其他进程写过库时，使本进程的列表页缓存、相似度索引失效，并在后台重新加载文件夹树
+    （节流检查，开销可忽略）
+    """
+    if external_changes.poll():
+        listing_cache.bump_all()
+        hash_index.invalidate()
+    if external_folder_changes.poll():
+        folder_tree.reload_in_background()
+
+
+def thumbnail_exists(key: str) -> bool:
+    """缩略图是否存在（只读检查，不记访问、不导入旧文件）"""
+    if isinstance(thumbnail_cache, PackStore):
+        return key in thumbnail_cache or os.path.isfile(os.path.join(settings.THUMBNAIL_DIR, key))
+    return os.path.isfile(thumbnail_cache.path_for(key))
+
+
+def open_thumbnail(key: str) -> Optional[BinaryIO]:
+    """以二进制文件对象读取缩略图，不存在时返回 None"""
+    if isinstance(thumbnail_cache, PackStore):
+        return thumbnail_cache.open(key)
+    try:
+        return open(thumbnail_cache.path_for(key), "rb")
+    except FileNotFoundError:
+        return None
+
+
+def flush_thumbnail_evictions() -> int:
+    """把已淘汰缩略图对应的 Image.thumbnail_path 置空，返回更新的行数"""
+    with _pending_lock:
+        if not _pending_evictions:
+            return 0
+        keys = list(_pending_evictions)
+        _pending_evictions.clear()
+
+    updated = 0
+    folder_ids = set()
+    db = SessionLocal()
+    try:
+        for i in range(0, len(keys), _EVICTION_BATCH_SIZE):
+            batch = keys[i: i + _EVICTION_BATCH_SIZE]
+            folder_ids.update(
+                folder_id for (folder_id,) in
+                db.query(Image.folder_id).filter(Image.thumbnail_path.in_(batch)).distinct()
+            )
+            updated += (
+                db.query(Image)
+                .filter(Image.thumbnail_path.in_(batch))
+                .update({Image.thumbnail_path: None}, synchronize_session=False)
+            )
+        db.commit()
+        # 这些文件夹的列表页里缩略图 URL 已变为按需生成接口
+        listing_cache.bump(folder_ids)
+        return updated
+    except Exception as e:
+        db.rollback()
+        # 放回队列，下次再试
+        with _pending_lock:
+            _pending_evictions.extend(keys)
+        logger.error(f"同步缩略图淘汰记录失败: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+
+class PackCompactor:
+    """打包存储的后台压缩协程（THUMBNAIL_STORE=pack 时启用）"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if (not isinstance(thumbnail_cache, PackStore)
+                or settings.THUMBNAIL_PACK_COMPACT_INTERVAL <= 0 or self._task is not None):
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("缩略图打包存储压缩任务已启动")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.THUMBNAIL_PACK_COMPACT_INTERVAL)
+            try:
+                await asyncio.to_thread(
+                    thumbnail_cache.compact, settings.THUMBNAIL_PACK_COMPACT_RATIO
+                )
+            except Exception as e:
+                logger.error(f"缩略图打包存储压缩失败: {str(e)}", exc_info=True)
+
+
+pack_compactor = PackCompactor()
 
 
 class CacheService:
@@ -35,15 +232,32 @@ class CacheService:
         self.cache[key] = (value, datetime.now() + expires_in)
 
     def clear_cache(self):
-        """清除所有缓存"""
+        """清除所有缓存（缩略图会在下次访问时重新生成）"""
         self.cache.clear()
 
-        # 清除缓存目录
-        for dir_path in [settings.THUMBNAIL_DIR, settings.CONVERTED_DIR]:
-            for file in os.listdir(dir_path):
-                file_path = os.path.join(dir_path, file)
-                try:
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting {file_path}: {e}")
+        for disk_cache in (thumbnail_cache, converted_cache, sprite_cache, rendition_cache):
+            disk_cache.clear()
+        flush_thumbnail_evictions()
+        listing_cache.bump_all()
+
+    @staticmethod
+    def stats() -> Dict[str, dict]:
+        """磁盘缓存占用与命中统计"""
+        return {
+            "thumbnails": thumbnail_cache.stats(),
+            "converted": converted_cache.stats(),
+            "sprites": sprite_cache.stats(),
+            "renditions": rendition_cache.stats(),
+        }
+
+    @staticmethod
+    def preload_indexes() -> None:
+        """加载全部缓存索引（启动时在线程中调用，首次重建索引不阻塞请求）"""
+        for disk_cache in (thumbnail_cache, converted_cache, sprite_cache, rendition_cache):
+            disk_cache.preload()
+
+    @staticmethod
+    def save_indexes() -> None:
+        """立即写回缓存索引（应用退出时调用）"""
+        for disk_cache in (thumbnail_cache, converted_cache, sprite_cache, rendition_cache):
+            disk_cache.save(force=True)
@@ -0,0 +1,144 @@
+"""
+ConversionService：HEIC → JPEG 按需转换。
+
+设计说明：
+  以前扫描时为每张 HEIC 生成全尺寸 JPEG，iPhone 为主的图库存储量接近翻倍，
+  而大多数原图从未被打开。现在（HEIC_LAZY_CONVERSION=true）扫描只生成缩略图，
+  第一次请求 /api/images/{id}/full 时才转换：
+
+    - 单飞：同一张图的并发请求只转换一次，其余请求等待同一结果。
+    - 转换结果放入 CONVERTED_DIR，由 DiskCache 按 CONVERTED_CACHE_MAX_MB
+      做 LRU 淘汰；被淘汰的图片下次打开时重新转换。
+    - 打开一张 HEIC 后，后台依次预转换同文件夹中后续的 HEIC_PRECONVERT_COUNT 张，
+      用户翻到下一张时直接命中缓存。预转换串行执行，不与前台请求争抢线程池。
+
+  旧版扫描生成的转换文件（Image.converted_path）同样纳入缓存索引与配额管理。
+
+  有内容指纹（Image.fingerprint）的图片按 (ID, 指纹) 命名转换结果，与源路径无关：
+  文件被移动 / 改名、记录被改指向新路径（见 FolderService）后仍命中原来的转换结果。
+  没有指纹的旧记录不会被改指向，沿用按源路径命名的旧格式。
+"""
+import asyncio
+import os
+from pathlib import Path
+from typing import List, Tuple
+
+from app.config import settings
+from app.database.models import Image
+from app.utils.disk_cache import DiskCache
+from app.utils.image_utils import ImageProcessor, run_in_media_pool
+from app.utils.logger import logger
+from app.utils.singleflight import SingleFlight
+from sqlalchemy.orm import Session
+
+converted_cache = DiskCache(
+    "converted",
+    settings.CONVERTED_DIR,
+    max_bytes=settings.CONVERTED_CACHE_MAX_MB * 1024 * 1024,
+)
+
+# 与源路径无关的转换结果所在目录、每个子目录的图片 ID 数、文件名中的指纹摘要长度
+_BY_ID_DIR = "_by_id"
+_BY_ID_BUCKET = 1000
+_KEY_DIGEST_LENGTH = 12
+
+_conversions = SingleFlight()
+# 预转换同一时间只跑一个批次
+_preconvert_semaphore = asyncio.Semaphore(1)
+# 持有后台任务引用，避免任务被垃圾回收
+_background_tasks: set = set()
+
+
+class ConversionService:
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def cache_key(image: Image) -> str:
+        """
+        按需转换的缓存路径（相对 CONVERTED_DIR）。有指纹时按 ID 分目录、文件名带指纹摘要，
+        与源路径无关；否则与原图目录结构一致。
+        """
+        if image.fingerprint:
+            digest = image.fingerprint.rsplit("-", 1)[-1][:_KEY_DIGEST_LENGTH]
+            return os.path.join(
+                _BY_ID_DIR, str(image.id // _BY_ID_BUCKET), f"{image.id}_{digest}.jpg"
+            )
+        rel_dir = os.path.dirname(image.file_path)
+        return os.path.join(rel_dir, f"{Path(image.file_path).stem}_{image.id}.jpg")
+
+    async def get_converted_path(self, image: Image) -> str:
+        """返回 HEIC 对应 JPEG 的绝对路径，缓存未命中时转换（单飞）"""
+        # 旧版扫描时生成的转换文件
+        if image.converted_path:
+            cached = converted_cache.get(image.converted_path)
+            if cached:
+                return cached
+
+        key = self.cache_key(image)
+        cached = converted_cache.get(key)
+        if cached:
+            return cached
+
+        return await _conversions.do(key, lambda: _convert(image.file_path, key))
+
+    def schedule_preconvert(self, image: Image) -> None:
+        """后台预转换同文件夹中排在该图之后的若干张 HEIC"""
+        if settings.HEIC_PRECONVERT_COUNT <= 0:
+            return
+
+        following = (
+            self.db.query(Image)
+            .filter(Image.folder_id == image.folder_id)
+            .filter(Image.id > image.id)
+            .filter(Image.is_heic.is_(True))
+            .order_by(Image.id.asc())
+            .limit(settings.HEIC_PRECONVERT_COUNT)
+            .all()
+        )
+        pending = [
+            (img.file_path, self.cache_key(img))
+            for img in following
+            if not (img.converted_path and img.converted_path in converted_cache)
+            and self.cache_key(img) not in converted_cache
+        ]
+        if not pending:
+            return
+
+        task = asyncio.create_task(_preconvert(pending))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def _convert(file_path: str, key: str) -> str:
+    """在媒体线程池中转换，先写临时文件再 rename，避免读到半个文件"""
+    source = os.path.join(settings.IMAGES_DIR, file_path)
+    if not os.path.isfile(source):
+        raise FileNotFoundError(source)
+
+    target = converted_cache.path_for(key)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.tmp"
+    try:
+        await run_in_media_pool(ImageProcessor.convert_heic_file, source, tmp_target)
+        os.replace(tmp_target, target)
+    except BaseException:
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        raise
+
+    converted_cache.put(key)
+    logger.info(f"HEIC 按需转换完成: {file_path}")
+    return target
+
+
+async def _preconvert(pending: List[Tuple[str, str]]) -> None:
+    async with _preconvert_semaphore:
+        for file_path, key in pending:
+            if key in converted_cache:
+                continue
+            try:
+                await _conversions.do(key, lambda: _convert(file_path, key))
+            except Exception as e:
+                logger.warning(f"HEIC 预转换失败 {file_path}: {str(e)}")
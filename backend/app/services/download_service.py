@@ -0,0 +1,71 @@
+"""
+DownloadService：打包下载文件夹或选中的图片。
+
+设计说明：
+  直接从 IMAGES_DIR 读取原文件，经 ZipStream（见 app/utils/zip_stream.py）边读边发，
+  不落临时文件。这里只负责确定条目列表：条目按归档内文件名排序，
+  同一批文件每次生成的归档逐字节相同，Range 续传才能接上。
+
+  文件夹下载按磁盘实际内容打包（与扫描相同的格式过滤与隐藏目录规则），
+  尚未入库的新文件也会包含在内；选中下载按数据库记录打包。
+"""
+import os
+from typing import List, Tuple
+from urllib.parse import quote
+
+from app.config import settings
+from app.database.models import Folder, Image
+from app.services.file_service import FileService
+from app.utils.logger import logger
+from app.utils.zip_stream import ZipEntry, ZipStream
+from sqlalchemy.orm import Session
+
+
+class DownloadService:
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def folder_archive(self, folder: Folder, recursive: bool) -> Tuple[ZipStream, str]:
+        """返回 (归档, 下载文件名)；归档内路径相对于该文件夹"""
+        top = os.path.normpath(os.path.join(settings.IMAGES_DIR, folder.folder_path))
+        _, files = FileService(self.db).collect_paths(top, recursive=recursive)
+        entries = self._entries(
+            (os.path.relpath(path, top), path) for path, _ in files
+        )
+
+        name = os.path.basename(top) if folder.folder_path != "." else "images"
+        return self._stream(entries), f"{name}.zip"
+
+    def selection_archive(self, image_ids: List[int]) -> Tuple[ZipStream, str]:
+        """选中图片的归档，归档内路径为相对 IMAGES_DIR 的路径"""
+        paths = self.db.query(Image.file_path).filter(Image.id.in_(image_ids)).all()
+        entries = self._entries(
+            (file_path, os.path.join(settings.IMAGES_DIR, file_path)) for (file_path,) in paths
+        )
+        return self._stream(entries), "images.zip"
+
+    @staticmethod
+    def _entries(items) -> List[ZipEntry]:
+        entries = []
+        for arcname, path in items:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"打包时跳过无法访问的文件 {path}: {str(e)}")
+                continue
+            # 归档内统一使用 "/" 分隔
+            entries.append(ZipEntry(arcname.replace(os.sep, "/"), path, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda entry: entry.arcname)
+        return entries
+
+    @staticmethod
+    def _stream(entries: List[ZipEntry]) -> ZipStream:
+        return ZipStream(entries, chunk_size=settings.DOWNLOAD_CHUNK_KB * 1024)
+
+
+def content_disposition(filename: str) -> str:
+    """attachment 头；非 ASCII 文件名按 RFC 6266 / 5987 另给 filename*"""
+    plain = filename.isascii() and not any(c in filename for c in '"\\')
+    fallback = filename if plain else "download.zip"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
@@ -1,13 +1,15 @@
 import mimetypes
 import os
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from app.config import settings
 from app.database.models import Folder, Image
 from app.models import FileInfo, FolderInfo
 from app.services.image_service import ImageService
 from app.utils.logger import logger
+from app.utils.metrics import SCAN_STAGE_SECONDS
 from sqlalchemy.orm import Session
 
 
@@ -26,9 +28,12 @@ class FileService:
         os.makedirs(settings.THUMBNAIL_DIR, exist_ok=True)
         os.makedirs(settings.CONVERTED_DIR, exist_ok=True)
 
-    def collect_paths(self) -> Tuple[List[str], List[Tuple[str, str]]]:
+    def collect_paths(
+        self, top: Optional[str] = None, recursive: bool = True
+    ) -> Tuple[List[str], List[Tuple[str, str]]]:
         """
-        遍历 IMAGES_DIR，收集所有文件夹和支持格式的文件路径。
+        遍历 top（默认 IMAGES_DIR），收集所有文件夹和支持格式的文件路径。
+        recursive=False 时只收集 top 本层的文件与直接子文件夹（分片扫描使用）。
         Returns:
             (all_folders, all_files)
             all_folders: List[str] - 文件夹的绝对路径列表
@@ -36,26 +41,38 @@ class FileService:
         """
         all_folders = []
         all_files = []
-        supported_formats = tuple(settings.SUPPORTED_FORMATS)
+        start = time.perf_counter()
+
+        for root, folders, files in self.walk(top, recursive):
+            all_folders.extend(folders)
+            all_files.extend((path, root) for path in files)
+
+        SCAN_STAGE_SECONDS.labels("walk").observe(time.perf_counter() - start)
+        return all_folders, all_files
 
-        for root, dirs, files in os.walk(settings.IMAGES_DIR):
+    @staticmethod
+    def walk(
+        top: Optional[str] = None, recursive: bool = True
+    ) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        惰性遍历，逐个目录返回 (目录路径, 子文件夹绝对路径, 支持格式的文件绝对路径)。
+        扫描流水线用它边遍历边处理，不必先把整个图库的路径收集到内存里。
+        """
+        supported_formats = tuple(settings.SUPPORTED_FORMATS)
+        for root, dirs, files in os.walk(top or settings.IMAGES_DIR):
             # 过滤系统/隐藏文件夹
             dirs[:] = [
                 d for d in dirs
                 if not d.startswith((".", "@", "$"))
                 and os.path.isdir(os.path.join(root, d))
             ]
-
-            for dir_name in dirs:
-                full_path = os.path.join(root, dir_name)
-                all_folders.append(full_path)
-
-            for file in files:
-                if file.lower().endswith(supported_formats):
-                    full_path = os.path.join(root, file)
-                    all_files.append((full_path, root))
-
-        return all_folders, all_files
+            yield (
+                root,
+                [os.path.join(root, d) for d in dirs],
+                [os.path.join(root, f) for f in files if f.lower().endswith(supported_formats)],
+            )
+            if not recursive:
+                break
 
     def get_folder_info(self, folder_path: str) -> FolderInfo:
         """获取文件夹信息（相对路径 + 父路径）"""
@@ -78,7 +95,8 @@ class FileService:
             rel_path = os.path.relpath(file_path, settings.IMAGES_DIR)
             folder_path = os.path.dirname(abs_path)
             mime_type = mimetypes.guess_type(file_path)[0]
-            file_stat = os.stat(file_path)
+            with SCAN_STAGE_SECONDS.labels("stat").time():
+                file_stat = os.stat(file_path)
 
             return FileInfo(
                 full_path=abs_path,
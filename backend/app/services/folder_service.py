@@ -19,22 +19,41 @@ FolderService：文件夹内容验证（补偿机制）。
     1. 启动时全量扫描
     2. 手动触发 /api/scan
     3. 本机制在用户浏览时发现并修复轻微的差异
+
+移动 / 改名：
+  NAS 上改名或移动文件夹后，旧路径的记录表现为"删除"、新路径的文件表现为"新增"。
+  新增文件先按内容指纹（Image.fingerprint，见 app/utils/fingerprint.py）查找
+  旧路径已不存在的记录，找到则把该记录改指向新路径，EXIF、缩略图原样沿用；
+  HEIC 转换结果与缩放副本对有指纹的记录按 (ID, 指纹) 取缓存 key，与源路径无关，
+  同样不再重新处理。
+  同一父文件夹下"消失一个、出现一个"的子文件夹，抽样比对其中文件的指纹，
+  一致则视为改名，整棵子树的文件夹与图片记录一次改写路径。
+  跨父文件夹移动整个文件夹时，若旧父文件夹先被验证，旧记录已被删除，只能重新处理。
 """
 import asyncio
 import os
 import threading
 from datetime import datetime
-from typing import Dict, Set, Tuple
+from typing import Dict, List, Set, Tuple
 
 from app.config import settings
+from app.database.database import SessionLocal
 from app.database.models import Folder, Image
 from app.models import FolderInfo
+from app.services.cache_service import flush_thumbnail_evictions, listing_cache
 from app.services.file_service import FileService
 from app.services.image_service import ImageService
+from app.utils.fingerprint import file_fingerprint
 from app.utils.logger import logger
+from app.utils.metrics import SCAN_RELINKED_TOTAL, VALIDATION_CACHE_TOTAL
+from app.utils.profiling import timing
 from cachetools import TTLCache
+from sqlalchemy import func, literal
 from sqlalchemy.orm import Session
 
+# 判断子文件夹是否被改名时，从旧文件夹中抽样比对指纹的文件数
+_RENAME_SAMPLE_SIZE = 3
+
 
 class FolderService:
 
@@ -50,6 +69,8 @@ class FolderService:
     # 保护 _validation_locks 字典本身的线程安全
     # （asyncio.Lock 只保护协程并发，字典操作需要 threading.Lock）
     _lock_registry_mutex = threading.Lock()
+    # TTLCache 不是线程安全的，离线 CLI 会在多个线程中并发验证文件夹
+    _cache_mutex = threading.Lock()
 
     def __init__(self, db: Session):
         self.db = db
@@ -69,8 +90,10 @@ class FolderService:
                    → 扫描文件系统 → 与 DB 对比 → 处理差异 → 写入缓存
         """
         # 快速路径：缓存命中，跳过扫描
-        if folder_id in self._validation_cache:
+        if self._is_validated(folder_id):
+            VALIDATION_CACHE_TOTAL.labels("hit").inc()
             return
+        VALIDATION_CACHE_TOTAL.labels("miss").inc()
 
         lock = self._get_or_create_lock(folder_id)
 
@@ -80,7 +103,7 @@ class FolderService:
 
         async with lock:
             # Double-check：可能在等锁期间缓存已被写入
-            if folder_id in self._validation_cache:
+            if self._is_validated(folder_id):
                 return
 
             try:
@@ -117,8 +140,17 @@ class FolderService:
                         f"+{len(new_folders)}文件夹 -{len(deleted_folders)}文件夹"
                     )
 
+                    # 先配对改名的子文件夹，整棵子树改指向新路径，不再按新增 + 删除处理
+                    for old_path, new_path in await self._match_renamed_folders(
+                        deleted_folders, new_folders
+                    ):
+                        if self._relink_folder(old_path, new_path):
+                            deleted_folders.discard(old_path)
+                            new_folders.discard(new_path)
+
                     for file_path in new_files:
-                        await self._process_new_file(file_path, folder_id)
+                        if not await self._relink_file(file_path, folder_id):
+                            await self._process_new_file(file_path, folder_id)
 
                     for subfolder_path in new_folders:
                         await self._process_new_folder(subfolder_path, folder_id)
@@ -128,11 +160,15 @@ class FolderService:
 
                     for subfolder_path in deleted_folders:
                         self._process_deleted_folder(subfolder_path)
+
+                    # 各处理步骤已分别提交，统一使该文件夹的列表页缓存失效
+                    listing_cache.bump([folder_id])
                 else:
                     logger.debug(f"文件夹验证通过（无变更）: {folder.folder_path}")
 
                 # 写入缓存（无论有无变更都写，避免频繁扫描）
-                self._validation_cache[folder_id] = datetime.now()
+                with self._cache_mutex:
+                    self._validation_cache[folder_id] = datetime.now()
 
             except Exception as e:
                 logger.error(f"验证文件夹内容失败 folder_id={folder_id}: {str(e)}", exc_info=True)
@@ -140,24 +176,43 @@ class FolderService:
                 # 验证完成后清理锁，释放内存
                 self._remove_lock(folder_id)
 
+    @classmethod
+    async def validate_in_background(cls, folder_id: int) -> None:
+        """
+        使用独立 Session 执行验证，供 asyncio.create_task 调用。
+        请求结束后 get_db 会关闭请求 Session，后台任务若继续复用它，
+        会重新检出一个无人归还的连接，并发稍高时连接池被耗尽。
+        """
+        db = SessionLocal()
+        try:
+            await cls(db).validate_folder_content(folder_id)
+        finally:
+            db.close()
+
     @classmethod
     def invalidate_cache(cls, folder_id: int) -> None:
         """
         手动使某个文件夹的缓存失效。
         在 /api/scan 全量扫描后应调用此方法清空所有缓存。
         """
-        cls._validation_cache.pop(folder_id, None)
+        with cls._cache_mutex:
+            cls._validation_cache.pop(folder_id, None)
 
     @classmethod
     def clear_all_cache(cls) -> None:
         """清空所有文件夹的验证缓存（全量扫描后调用）"""
-        cls._validation_cache.clear()
+        with cls._cache_mutex:
+            cls._validation_cache.clear()
         logger.info("已清空所有文件夹验证缓存")
 
     # ----------------------------------------------------------------
     # 内部工具方法
     # ----------------------------------------------------------------
 
+    def _is_validated(self, folder_id: int) -> bool:
+        with self._cache_mutex:
+            return folder_id in self._validation_cache
+
     def _get_or_create_lock(self, folder_id: int) -> asyncio.Lock:
         """线程安全地获取或创建 folder_id 对应的 asyncio.Lock"""
         with self._lock_registry_mutex:
@@ -179,7 +234,9 @@ class FolderService:
         real_folders: Set[str] = set()
 
         try:
-            for entry in os.scandir(abs_folder_path):
+            with timing("fs"):
+                entries = list(os.scandir(abs_folder_path))
+            for entry in entries:
                 rel = os.path.relpath(entry.path, settings.IMAGES_DIR)
                 if entry.is_file(follow_symlinks=False) and self._is_supported_file(entry.name):
                     real_files.add(rel)
@@ -210,6 +267,121 @@ class FolderService:
             )
         }
 
+    async def _relink_file(self, rel_path: str, folder_id: int) -> bool:
+        """
+        新增文件与某条旧路径已不存在的记录指纹一致（被移动 / 改名）时，
+        把该记录改指向新路径并返回 True；旧路径仍存在的是副本，照常作为新文件处理。
+        """
+        full_path = os.path.join(str(settings.IMAGES_DIR), rel_path)
+        try:
+            fingerprint = await asyncio.to_thread(file_fingerprint, full_path)
+            extension = os.path.splitext(rel_path)[1].lower()
+            candidates = self.db.query(Image).filter(
+                Image.fingerprint == fingerprint,
+                Image.file_path != rel_path,
+            ).all()
+            for image in candidates:
+                old_path = image.file_path
+                # 扩展名变了的不沿用（mime_type / image_type 由扩展名决定）
+                if os.path.splitext(old_path)[1].lower() != extension:
+                    continue
+                if os.path.exists(os.path.join(str(settings.IMAGES_DIR), old_path)):
+                    continue
+                old_folder_id = image.folder_id
+                image.file_path = rel_path
+                image.folder_id = folder_id
+                self.db.commit()
+                listing_cache.bump([old_folder_id, folder_id])
+                SCAN_RELINKED_TOTAL.labels("file").inc()
+                logger.info(f"补偿：{old_path} 移动到 {rel_path}，沿用原记录")
+                return True
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"按指纹匹配移动文件失败 {rel_path}: {str(e)}")
+        return False
+
+    async def _match_renamed_folders(
+        self, deleted_folders: Set[str], new_folders: Set[str]
+    ) -> List[Tuple[str, str]]:
+        """
+        配对同一父文件夹下消失与新出现的子文件夹：从旧文件夹子树中抽样几张有指纹的图片，
+        新文件夹中相同相对位置的文件指纹一致即视为改名。返回 [(旧路径, 新路径)]。
+        """
+        if not deleted_folders or not new_folders:
+            return []
+        pairs = []
+        unmatched = set(new_folders)
+        try:
+            for old_path in sorted(deleted_folders):
+                samples = self.db.query(Image.file_path, Image.fingerprint).filter(
+                    Image.file_path.startswith(old_path + os.sep, autoescape=True),
+                    Image.fingerprint.isnot(None),
+                ).limit(_RENAME_SAMPLE_SIZE).all()
+                if not samples:
+                    continue
+                for new_path in sorted(unmatched):
+                    if await asyncio.to_thread(self._contains_samples, new_path, old_path, samples):
+                        pairs.append((old_path, new_path))
+                        unmatched.discard(new_path)
+                        break
+        except Exception as e:
+            logger.error(f"匹配改名的文件夹失败: {str(e)}")
+        return pairs
+
+    @staticmethod
+    def _contains_samples(new_path: str, old_path: str, samples) -> bool:
+        for file_path, fingerprint in samples:
+            candidate = os.path.join(
+                str(settings.IMAGES_DIR), new_path, os.path.relpath(file_path, old_path)
+            )
+            try:
+                if file_fingerprint(candidate) == fingerprint:
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def _relink_folder(self, old_path: str, new_path: str) -> bool:
+        """
+        把改名的文件夹子树（文件夹与图片记录）改写到新路径。
+        文件夹逐条修改 ORM 对象（文件夹树经会话事件同步），图片记录用一条 UPDATE 改写前缀。
+        """
+        try:
+            folder = self.db.query(Folder).filter(Folder.folder_path == old_path).first()
+            if not folder or self.db.query(Folder.id).filter(
+                Folder.folder_path == new_path
+            ).first():
+                return False
+
+            old_prefix = old_path + os.sep
+            subfolders = self.db.query(Folder).filter(
+                Folder.folder_path.startswith(old_prefix, autoescape=True)
+            ).all()
+            folder.folder_path = new_path
+            folder.name = os.path.basename(new_path)
+            for subfolder in subfolders:
+                subfolder.folder_path = new_path + subfolder.folder_path[len(old_path):]
+            self.db.query(Image).filter(
+                Image.file_path.startswith(old_prefix, autoescape=True)
+            ).update(
+                {Image.file_path: literal(new_path) + func.substr(Image.file_path, len(old_path) + 1)},
+                synchronize_session=False,
+            )
+            self.db.commit()
+
+            folder_ids = [folder.id] + [subfolder.id for subfolder in subfolders]
+            listing_cache.bump(folder_ids)
+            # 改名期间子树内也可能有增删，下次打开时重新验证
+            for subfolder_id in folder_ids:
+                self.invalidate_cache(subfolder_id)
+            SCAN_RELINKED_TOTAL.labels("folder").inc()
+            logger.info(f"补偿：文件夹 {old_path} 改名为 {new_path}，沿用 {len(folder_ids)} 个文件夹的记录")
+            return True
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"文件夹改名处理失败 {old_path} → {new_path}: {str(e)}")
+            return False
+
     async def _process_new_file(self, rel_path: str, folder_id: int) -> None:
         """处理新增文件（相对路径）"""
         try:
@@ -218,6 +390,7 @@ class FolderService:
             image_service = ImageService(self.db)
             await image_service.process_image(file_info, folder_id)
             self.db.commit()
+            flush_thumbnail_evictions()
             logger.info(f"补偿：新增文件 {rel_path}")
         except Exception as e:
             self.db.rollback()
@@ -272,8 +445,10 @@ class FolderService:
             # 删 Folder 时 SQLAlchemy 会自动级联删 Image，
             # 但显式操作更清晰且避免 N+1 问题）
             self.db.query(Image).filter(Image.folder_id == folder.id).delete()
+            folder_id = folder.id
             self.db.delete(folder)
             self.db.commit()
+            listing_cache.bump([folder_id])
             logger.info(f"补偿：删除文件夹记录 {rel_path}")
         except Exception as e:
             self.db.rollback()
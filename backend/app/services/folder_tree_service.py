@@ -0,0 +1,82 @@
+"""
+folder_tree：文件夹树的进程内快照（见 app/utils/folder_tree.py）。
+
+设计说明：
+  子文件夹列表、面包屑、子树大小每次浏览都要查，以前每次都查 folders 表，
+  /api/folders 还要把全部行构造成 ORM 对象。这里启动时从数据库加载一次，
+  之后由 ORM 会话事件增量维护：
+
+    after_flush        记下本次 flush 新增 / 修改 / 删除的 Folder
+    after_commit       提交成功后应用到树上（扫描线程、补偿验证、重试都走这里）
+    after_transaction_end  事务未提交就结束（回滚、关闭会话）时丢弃记录
+
+  不经 ORM 对象的批量改写（全盘扫描清表、索引导入、其他进程写库）
+  由调用方在提交后调用 folder_tree.invalidate()，下次查询时重新加载。
+"""
+from typing import Iterator
+
+from app.database.database import SessionLocal
+from app.database.models import Folder
+from app.utils.folder_tree import FolderRow, FolderTree
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# 从数据库加载时每批读取的行数
+_LOAD_BATCH_SIZE = 10000
+# 会话上暂存未提交变更的 key（Session.info）
+_PENDING_KEY = "folder_tree_changes"
+
+
+def _load_folders() -> Iterator[FolderRow]:
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(Folder.id, Folder.parent_id, Folder.name, Folder.folder_path)
+            .order_by(Folder.id)
+            .yield_per(_LOAD_BATCH_SIZE)
+        )
+        for row in query:
+            yield tuple(row)
+    finally:
+        db.close()
+
+
+folder_tree = FolderTree(_load_folders)
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    upserts = [
+        (folder.id, folder.parent_id, folder.name, folder.folder_path)
+        for folder in list(session.new) + list(session.dirty)
+        if isinstance(folder, Folder)
+    ]
+    removals = [folder.id for folder in session.deleted if isinstance(folder, Folder)]
+    if upserts or removals:
+        pending = session.info.setdefault(_PENDING_KEY, ([], []))
+        pending[0].extend(upserts)
+        pending[1].extend(removals)
+
+
+def _after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        upserts, removals = pending
+        folder_tree.upsert(upserts)
+        folder_tree.remove(removals)
+
+
+def _after_transaction_end(session: Session, transaction) -> None:
+    # 提交时 after_commit 已先取走；剩下的属于回滚或未提交就关闭的事务
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def install_folder_tree_hooks() -> None:
+    """注册会话事件（所有 Session，包括扫描使用的独立 sessionmaker），幂等"""
+    for name, listener in (
+        ("after_flush", _after_flush),
+        ("after_commit", _after_commit),
+        ("after_transaction_end", _after_transaction_end),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -1,22 +1,34 @@
+import asyncio
 import mimetypes
 import os
 import uuid
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from app.config import settings
 from app.database.models import Image
 from app.models import FileInfo
-from app.utils.image_utils import ImageProcessor
+from app.services.cache_service import listing_cache, thumbnail_cache
+from app.services.conversion_service import converted_cache
+from app.services.similarity_service import hash_index
+from app.utils.fingerprint import file_fingerprint
+from app.utils.image_utils import ImageProcessor, run_in_media_pool
 from app.utils.logger import logger
+from app.utils.metrics import SCAN_STAGE_SECONDS, THUMBNAIL_SECONDS
+from app.utils.singleflight import SingleFlight
 from sqlalchemy.orm import Session
 
+# 按需重新生成缩略图的单飞（按 image id）
+_thumbnail_flights = SingleFlight()
+
 
 class ImageService:
 
     def __init__(self, db: Session):
         self.db = db
         self.processor = ImageProcessor()
+        # 最近一次 process_image 失败的异常，供调用方按错误类别统计
+        self.last_error: Optional[Exception] = None
         self._setup_cache_dirs()
 
     def _setup_cache_dirs(self):
@@ -28,8 +40,23 @@ class ImageService:
         """根据 ID 获取图片记录"""
         return self.db.query(Image).filter(Image.id == image_id).first()
 
+    def get_folder_page(self, folder_id: int, page: int) -> List[Image]:
+        """
+        文件夹一页图片。列表、雪碧图和预取都用这一查询：雪碧图坐标按页内顺序计算，
+        因此显式按 id 排序保证顺序稳定。
+        """
+        return (
+            self.db.query(Image)
+            .filter(Image.folder_id == folder_id)
+            .order_by(Image.id)
+            .offset((page - 1) * settings.PAGE_SIZE)
+            .limit(settings.PAGE_SIZE)
+            .all()
+        )
+
     async def process_image(self, file_info: FileInfo, folder_id: int) -> bool:
         """处理单个图片/视频文件，生成缩略图和 HEIC 转换文件"""
+        self.last_error = None
         try:
             # 幂等：文件已存在则跳过（使用相对路径去重）
             existing = self.db.query(Image).filter(
@@ -38,57 +65,74 @@ class ImageService:
             if existing:
                 return True
 
-            is_heic = file_info.full_path.lower().endswith((".heic", ".heif"))
-
-            image = Image(
-                folder_id=folder_id,
-                file_path=file_info.rel_path,  # 存相对路径，跨部署可移植
-                mime_type=file_info.mime_type,
-                image_type=self._get_image_type(file_info.full_path),
-                is_heic=is_heic,  # 正确设置 is_heic 字段
-                created_at=file_info.created_at,
-                exif_data=self.processor.get_exif_data(file_info.full_path),
-            )
+            # 先完成转换和缩略图，再写库：视频取帧在线程池中执行、期间会让出事件循环，
+            # 若先 flush 再等待，本事务持有的 SQLite 写锁会阻塞其他分片
+            image = await self.prepare_image(file_info, folder_id)
 
             self.db.add(image)
-            self.db.flush()  # 获取 image.id，不提交事务
-
-            is_media = file_info.mime_type and (
-                file_info.mime_type.startswith("image/")
-                or file_info.mime_type.startswith("video/")
-            )
-
-            if is_media:
-                # HEIC 转换为 JPEG
-                if is_heic:
-                    converted_path = await self._handle_heif_conversion(file_info)
-                    if converted_path:
-                        # 存相对于 CONVERTED_DIR 的路径
-                        image.converted_path = os.path.relpath(
-                            converted_path, settings.CONVERTED_DIR
-                        )
-
-                # 生成缩略图
-                thumb_path = await self._handle_thumbnail_creation(file_info)
-                if thumb_path:
-                    # 存相对于 THUMBNAIL_DIR 的路径
-                    image.thumbnail_path = os.path.relpath(
-                        thumb_path, settings.THUMBNAIL_DIR
-                    )
-
-            # flush 更新缩略图路径，由外层 chunk 来 commit，避免双重提交
-            self.db.flush()
+            # flush 获取 image.id，由外层 chunk 来 commit，避免双重提交
+            with SCAN_STAGE_SECONDS.labels("db_write").time():
+                self.db.flush()
+            if image.phash is not None:
+                hash_index.add(image.id, image.phash)
             return True
 
         except Exception as e:
+            self.last_error = e
             logger.error(f"处理图片失败 {file_info.full_path}: {str(e)}")
             self.db.rollback()
             return False
 
-    def _get_cache_path(self, file_info: FileInfo, base_dir: Path | str, suffix: str) -> str:
+    async def prepare_image(self, file_info: FileInfo, folder_id: int) -> Image:
+        """
+        读取 EXIF、生成缩略图（及非按需模式下的 HEIC 转换），返回尚未加入 Session 的
+        Image 对象。不访问数据库，扫描流水线在解码阶段调用，写库由单独的写入阶段完成。
+        """
+        is_heic = file_info.full_path.lower().endswith((".heic", ".heif"))
+
+        image = Image(
+            folder_id=folder_id,
+            file_path=file_info.rel_path,  # 存相对路径，跨部署可移植
+            mime_type=file_info.mime_type,
+            image_type=self._get_image_type(file_info.full_path),
+            is_heic=is_heic,  # 正确设置 is_heic 字段
+            created_at=file_info.created_at,
+            exif_data=await run_in_media_pool(self.processor.get_exif_data, file_info.full_path),
+            fingerprint=await run_in_media_pool(file_fingerprint, file_info.full_path, file_info.size),
+        )
+
+        is_media = file_info.mime_type and (
+            file_info.mime_type.startswith("image/")
+            or file_info.mime_type.startswith("video/")
+        )
+        if is_media:
+            # HEIC 转换为 JPEG（按需转换模式下推迟到首次打开原图时）
+            if is_heic and not settings.HEIC_LAZY_CONVERSION:
+                converted_path = await self._handle_heif_conversion(file_info)
+                if converted_path:
+                    # 存相对于 CONVERTED_DIR 的路径
+                    image.converted_path = os.path.relpath(
+                        converted_path, settings.CONVERTED_DIR
+                    )
+                    converted_cache.put(image.converted_path)
+
+            # 生成缩略图（视频同时返回时长/帧率/分辨率），存缓存 key（相对路径）
+            thumb_key, media_info = await self._handle_thumbnail_creation(file_info)
+            if thumb_key:
+                image.thumbnail_path = thumb_key
+            for key, value in media_info.items():
+                setattr(image, key, value)
+        return image
+
+    @staticmethod
+    def _cache_key(file_info: FileInfo, suffix: str) -> str:
+        """缓存文件的相对路径：保持原目录结构，文件名带随机后缀"""
         rel_dir = os.path.dirname(file_info.rel_path)
         file_name = f"{Path(file_info.full_path).stem}_{uuid.uuid4().hex[:8]}{suffix}"
-        full_path = os.path.join(base_dir, rel_dir, file_name)
+        return os.path.join(rel_dir, file_name)
+
+    def _get_cache_path(self, file_info: FileInfo, base_dir: Path | str, suffix: str) -> str:
+        full_path = os.path.join(base_dir, self._cache_key(file_info, suffix))
         os.makedirs(os.path.dirname(full_path), exist_ok=True)
         return full_path
 
@@ -96,21 +140,73 @@ class ImageService:
         """HEIC/HEIF → JPEG 转换，保持目录结构"""
         try:
             full_path = self._get_cache_path(file_info, settings.CONVERTED_DIR, ".jpg")
-            await self.processor.convert_heic(file_info.full_path, full_path)
+            await run_in_media_pool(self.processor.convert_heic_file, file_info.full_path, full_path)
             return full_path
         except Exception as e:
             logger.error(f"HEIF转换失败 {file_info.rel_path}: {str(e)}")
             return None
 
-    async def _handle_thumbnail_creation(self, file_info: FileInfo) -> Optional[str]:
-        """生成缩略图，保持目录结构"""
+    async def _handle_thumbnail_creation(self, file_info: FileInfo) -> Tuple[Optional[str], dict]:
+        """
+        生成缩略图，保持目录结构。
+        返回 (缩略图缓存 key, 媒体元数据)；视频受 VIDEO_TIME_BUDGET 限制，
+        单个损坏的视频超时后放弃，不会拖住整个扫描。
+        """
         try:
-            full_path = self._get_cache_path(file_info, settings.THUMBNAIL_DIR, "_thumb.jpg")
-            await self.processor.create_thumbnail(file_info.full_path, full_path)
-            return full_path
+            key = self._cache_key(file_info, "_thumb.jpg")
+            full_path = thumbnail_cache.path_for(key)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            media = self._get_image_type(file_info.full_path)
+            with THUMBNAIL_SECONDS.labels(media).time():
+                task = self.processor.create_thumbnail(file_info.full_path, full_path)
+                if media == "video":
+                    media_info = await asyncio.wait_for(task, timeout=settings.VIDEO_TIME_BUDGET)
+                else:
+                    media_info = await task
+            # 打包模式下 put 要把文件追加进段文件并可能触发淘汰，放到线程池执行
+            await asyncio.to_thread(thumbnail_cache.put, key)
+            return key, media_info or {}
+        except asyncio.TimeoutError:
+            logger.error(f"视频处理超时（>{settings.VIDEO_TIME_BUDGET}s），跳过 {file_info.rel_path}")
+            return None, {}
         except Exception as e:
             logger.error(f"缩略图生成失败 {file_info.rel_path}: {str(e)}")
-            return None
+            return None, {}
+
+    async def ensure_thumbnail(self, image: Image, force: bool = False) -> str:
+        """
+        返回缩略图缓存 key；缩略图已被缓存淘汰（或从未生成）时重新生成，
+        同一张图的并发请求只生成一次。force=True 时无论是否存在都重新生成。
+        """
+        if image.thumbnail_path and not force:
+            if await asyncio.to_thread(thumbnail_cache.get, image.thumbnail_path):
+                return image.thumbnail_path
+        return await _thumbnail_flights.do(image.id, lambda: self._regenerate_thumbnail(image))
+
+    async def _regenerate_thumbnail(self, image: Image) -> str:
+        full_path = os.path.join(settings.IMAGES_DIR, image.file_path)
+        if not os.path.isfile(full_path):
+            raise FileNotFoundError(full_path)
+
+        # FileService 依赖 ImageService，这里延迟导入避免循环引用
+        from app.services.file_service import FileService
+
+        file_info = FileService(self.db).get_file_info(full_path)
+        thumb_key, media_info = await self._handle_thumbnail_creation(file_info)
+        if not thumb_key:
+            raise RuntimeError(f"缩略图生成失败: {image.file_path}")
+
+        old_path = image.thumbnail_path
+        image.thumbnail_path = thumb_key
+        for key, value in media_info.items():
+            setattr(image, key, value)
+        self.db.commit()
+        listing_cache.bump([image.folder_id])
+
+        # 旧文件名带随机后缀，未被淘汰而是丢失索引时一并清理
+        if old_path and old_path != image.thumbnail_path:
+            await asyncio.to_thread(thumbnail_cache.discard, old_path)
+        return thumb_key
 
     def _get_image_type(self, file_path: str) -> str:
         """根据扩展名判断文件类型"""
@@ -0,0 +1,222 @@
+"""
+IndexTransferService：图库索引的流式导出 / 导入（NDJSON）。
+
+设计说明：
+  换主机时重新扫描要把每个文件再解码一遍、重新生成缩略图。索引本身
+  （folders / images 两张表：相对路径、EXIF、缓存路径、感知哈希等）只有几百 MB，
+  导出后在新主机导入，再把 CACHE_DIR 一起拷过去，几分钟即可恢复。
+
+  格式：每行一个 JSON 对象，按以下顺序：
+    {"type": "header", "format": "simplephotos-index", "version": 1, "folders": N, "images": M, ...}
+    {"type": "folder", "id": ..., "folder_path": ..., "parent_id": ..., ...}   按 id 升序
+    {"type": "image", "id": ..., "folder_id": ..., "file_path": ..., ...}      按 id 升序
+  字段即表的列，路径都是相对 IMAGES_DIR / 缓存目录的，跨部署可移植。
+
+  导出：按 id 顺序流式查询（yield_per，PostgreSQL 下为服务端游标），
+  逐行序列化输出，内存占用与表大小无关。
+
+  导入：保留原 ID（前端书签、列表页 URL 不变），按批 executemany 插入。
+  只能导入到空索引；replace=True 时先清空（与全盘扫描相同）。文件夹先以
+  parent_id 为空插入，全部插入后再批量补上父子关系，不依赖导出顺序满足外键。
+  缓存文件无需登记：拷过来的缩略图在第一次访问时由 DiskCache 自动收录。
+  文件夹按批直接插入，不经 ORM 会话事件，导入结束后使文件夹树整体重新加载。
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import orjson
+from app.database.models import Folder, Image
+from app.services.cache_service import listing_cache
+from app.services.folder_tree_service import folder_tree
+from app.services.init_service import clear_index_tables
+from app.services.similarity_service import hash_index
+from app.utils.logger import logger
+from sqlalchemy import DateTime, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+FORMAT = "simplephotos-index"
+VERSION = 1
+
+# 导出时每次从游标取的行数
+_EXPORT_BATCH_SIZE = 1000
+
+
+def _columns(model) -> Tuple[List[str], List[str]]:
+    """(全部列名, 其中 DateTime 类型的列名)"""
+    columns = list(model.__table__.columns)
+    return (
+        [column.name for column in columns],
+        [column.name for column in columns if isinstance(column.type, DateTime)],
+    )
+
+
+class IndexTransferService:
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # ----------------------------------------------------------------
+    # 导出
+    # ----------------------------------------------------------------
+
+    def export_lines(self) -> Iterator[bytes]:
+        """逐行生成 NDJSON（每行以换行结尾）"""
+        folder_count = self.db.query(func.count(Folder.id)).scalar()
+        image_count = self.db.query(func.count(Image.id)).scalar()
+        yield orjson.dumps({
+            "type": "header",
+            "format": FORMAT,
+            "version": VERSION,
+            "exported_at": datetime.utcnow(),
+            "folders": folder_count,
+            "images": image_count,
+        }, option=orjson.OPT_APPEND_NEWLINE)
+
+        for record_type, model in (("folder", Folder), ("image", Image)):
+            table = model.__table__
+            result = self.db.execute(
+                select(table).order_by(table.c.id)
+                .execution_options(yield_per=_EXPORT_BATCH_SIZE)
+            )
+            for row in result.mappings():
+                yield orjson.dumps(
+                    {"type": record_type, **row}, option=orjson.OPT_APPEND_NEWLINE
+                )
+
+    # ----------------------------------------------------------------
+    # 导入
+    # ----------------------------------------------------------------
+
+    def importer(self, replace: bool = False, batch_size: int = 1000) -> "IndexImporter":
+        return IndexImporter(self.db, replace, batch_size)
+
+
+class IndexImporter:
+    """
+    逐条接收导出记录并分批写库：add() / add_lines() 随读随写，finish() 收尾。
+    任一步出错时已写入的部分保留，可用 replace=True 重新导入。
+    """
+
+    def __init__(self, db: Session, replace: bool, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.counts = {"folders": 0, "images": 0}
+        self._header: Dict[str, Any] = {}
+        self._folders: List[dict] = []
+        self._images: List[dict] = []
+        # 文件夹父子关系，全部文件夹插入后统一更新
+        self._parents: List[dict] = []
+        self._folder_columns = _columns(Folder)
+        self._image_columns = _columns(Image)
+
+        self._replace = replace
+        if not replace and (self.db.query(Folder.id).first() or self.db.query(Image.id).first()):
+            raise ValueError("索引不为空，请使用 replace 清空后导入")
+
+    def add_lines(self, lines: Iterable[bytes]) -> None:
+        for line in lines:
+            line = line.strip()
+            if line:
+                self.add(orjson.loads(line))
+
+    def add(self, record: Dict[str, Any]) -> None:
+        record_type = record.pop("type", None)
+        if record_type == "header":
+            if self._header:
+                raise ValueError("重复的文件头")
+            if record.get("format") != FORMAT or record.get("version") != VERSION:
+                raise ValueError(
+                    f"不支持的导出格式: {record.get('format')} v{record.get('version')}"
+                )
+            self._header = record
+            if self._replace:
+                # 确认是有效的导出文件后才清空现有索引
+                clear_index_tables(self.db)
+                self.db.commit()
+                hash_index.invalidate()
+                listing_cache.bump_all()
+                folder_tree.invalidate()
+        elif not self._header:
+            raise ValueError("缺少文件头，不是索引导出文件")
+        elif record_type == "folder":
+            if self.counts["images"] or self._images:
+                raise ValueError("文件夹记录必须位于图片记录之前")
+            row = self._row(record, self._folder_columns)
+            if row.get("parent_id") is not None:
+                # 带上原 updated_at，避免 onupdate 改写为导入时间
+                self._parents.append({
+                    "id": row["id"], "parent_id": row["parent_id"], "updated_at": row["updated_at"],
+                })
+            row["parent_id"] = None
+            self._folders.append(row)
+            if len(self._folders) >= self.batch_size:
+                self._flush_folders()
+        elif record_type == "image":
+            if self._folders or self._parents:
+                self._finish_folders()
+            self._images.append(self._row(record, self._image_columns))
+            if len(self._images) >= self.batch_size:
+                self._flush_images()
+        else:
+            raise ValueError(f"未知的记录类型: {record_type}")
+
+    def finish(self) -> Dict[str, int]:
+        """写入剩余记录，校正自增序列；返回导入的文件夹 / 图片数"""
+        if not self._header:
+            raise ValueError("空的导入数据")
+        self._finish_folders()
+        self._flush_images()
+
+        if self.db.bind.dialect.name == "postgresql":
+            # 显式写入了 ID，自增序列需推进到当前最大值之后
+            for table in ("folders", "images"):
+                self.db.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+                ))
+            self.db.commit()
+
+        hash_index.invalidate()
+        listing_cache.bump_all()
+        folder_tree.invalidate()
+        expected = {name: self._header.get(name) for name in ("folders", "images")}
+        if expected != self.counts:
+            logger.warning(f"导入条数与文件头不一致: 文件头 {expected}，实际 {self.counts}")
+        logger.info(f"索引导入完成: {self.counts}")
+        return dict(self.counts)
+
+    # ----------------------------------------------------------------
+    # 内部
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _row(record: Dict[str, Any], columns: Tuple[List[str], List[str]]) -> dict:
+        names, datetime_names = columns
+        row = {name: record.get(name) for name in names}
+        for name in datetime_names:
+            if isinstance(row[name], str):
+                row[name] = datetime.fromisoformat(row[name])
+        return row
+
+    def _flush_folders(self) -> None:
+        if self._folders:
+            self.db.execute(insert(Folder.__table__), self._folders)
+            self.db.commit()
+            self.counts["folders"] += len(self._folders)
+            self._folders = []
+
+    def _finish_folders(self) -> None:
+        self._flush_folders()
+        for start in range(0, len(self._parents), self.batch_size):
+            # 按主键批量 UPDATE（ORM bulk update）
+            self.db.execute(update(Folder), self._parents[start:start + self.batch_size])
+        if self._parents:
+            self.db.commit()
+        self._parents = []
+
+    def _flush_images(self) -> None:
+        if self._images:
+            self.db.execute(insert(Image.__table__), self._images)
+            self.db.commit()
+            self.counts["images"] += len(self._images)
+            self._images = []
@@ -1,18 +1,129 @@
-import asyncio
 import os
 import threading
-from typing import Any, Dict, List, Tuple
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
 
 from app.config import settings
-from app.database.database import engine
-from app.database.models import Base, FailedImage, Folder, Image
+from app.database.database import create_tables, engine
+from app.database.models import FailedImage, Folder, Image
 from app.models import FileInfo, FolderInfo
+from app.services.cache_service import flush_thumbnail_evictions, listing_cache
+from app.services.folder_tree_service import folder_tree
 from app.services.file_service import FileService
 from app.services.image_service import ImageService
+from app.services.retry_service import classify_error, next_retry_time
+from app.services.scan_pipeline import ScanPipeline
+from app.services.similarity_service import hash_index
 from app.utils.logger import logger
+from app.utils.metrics import (SCAN_FILES_PER_SECOND, SCAN_LAST_DURATION_SECONDS,
+                               SCAN_STAGE_SECONDS)
 from sqlalchemy import text
 from sqlalchemy.orm import Session, sessionmaker
 
+def clear_index_tables(session: Session) -> None:
+    """清空图片、失败记录与文件夹表（调用方负责提交）"""
+    if settings.DB_TYPE == "postgresql":
+        # PostgreSQL：一条语句完成，RESTART IDENTITY 重置自增序列
+        # CASCADE 自动处理外键依赖（images, failed_images）
+        session.execute(text(
+            "TRUNCATE TABLE images, failed_images, folders "
+            "RESTART IDENTITY CASCADE"
+        ))
+    else:
+        # SQLite：临时关闭外键约束，逐表清空
+        session.execute(text("PRAGMA foreign_keys=OFF"))
+        session.execute(text("DELETE FROM images"))
+        session.execute(text("DELETE FROM failed_images"))
+        session.execute(text("DELETE FROM folders"))
+        session.execute(text("PRAGMA foreign_keys=ON"))
+
+
+class ScanState:
+    """
+    扫描进度（进程内单例 scan_state），供就绪检查接口查询。
+
+    phase:
+      pending   服务已启动，初始化任务尚未开始
+      scanning  正在扫描（首次启动的初始扫描或手动全盘扫描）
+      ready     扫描完成或数据库已有数据无需扫描
+      failed    扫描失败，error 为原因
+      stopped   服务关闭时扫描被中止（下次启动由文件夹补偿验证按需补齐）
+    """
+
+    def __init__(self):
+        self.phase = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.files_total = 0
+        self.files_done = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # 扫描流水线运行期间返回各队列深度
+        self._queue_probe: Optional[Callable[[], Dict[str, int]]] = None
+
+    def begin(self) -> None:
+        with self._lock:
+            self.phase = "scanning"
+            self.error = None
+            self.started_at = time.time()
+            self.finished_at = None
+            self.files_total = 0
+            self.files_done = 0
+        self._stop.clear()
+
+    def finish(self, success: bool, error: Optional[str] = None) -> None:
+        with self._lock:
+            if self._stop.is_set():
+                self.phase = "stopped"
+            else:
+                self.phase = "ready" if success else "failed"
+            self.error = None if success else error
+            self.finished_at = time.time()
+
+    def request_stop(self) -> None:
+        """请求中止扫描：分片在处理完当前文件后退出（扫描可能运行在其他线程中）"""
+        self._stop.set()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop.is_set()
+
+    def set_total(self, total: int) -> None:
+        with self._lock:
+            self.files_total = total
+
+    def add_total(self, count: int) -> None:
+        """流水线边遍历边处理，总数随遍历进度增长"""
+        with self._lock:
+            self.files_total += count
+
+    def advance(self, count: int = 1) -> None:
+        with self._lock:
+            self.files_done += count
+
+    def set_queue_probe(self, probe: Optional[Callable[[], Dict[str, int]]]) -> None:
+        self._queue_probe = probe
+
+    @property
+    def scanning(self) -> bool:
+        return self.phase == "scanning"
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "phase": self.phase,
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "queues": self._queue_probe() if self._queue_probe else None,
+            }
+
+
+scan_state = ScanState()
+
 
 class InitializationService:
 
@@ -24,16 +135,21 @@ class InitializationService:
         self.image_service = ImageService(db)
         self.folders_map: Dict[str, int] = {}
         self.folder_lock = threading.Lock()
+        # 中止本实例的扫描（分片租约丢失时由 ShardService 设置）
+        self.abort = threading.Event()
 
     async def initialize_database(self) -> bool:
-        """数据库初始化入口：若已有数据则跳过扫描"""
+        """数据库初始化入口：若已有数据则跳过扫描（调用前须已执行 create_tables）"""
+        scan_state.begin()
+        success = await self._initialize_database()
+        scan_state.finish(success, None if success else "数据库初始化失败，详见日志")
+        return success
+
+    async def _initialize_database(self) -> bool:
         try:
             logger.info("开始检查数据库初始化状态...")
 
             try:
-                Base.metadata.create_all(bind=engine)
-                logger.info("数据库表创建完成")
-
                 folder_count = self.db.query(Folder).count()
                 logger.info(f"当前文件夹数量: {folder_count}")
 
@@ -59,6 +175,10 @@ class InitializationService:
                 logger.error("文件处理失败")
                 return False
 
+            if scan_state.stop_requested:
+                logger.warning("初始扫描已中止，未入库的文件将在浏览时由文件夹验证补齐")
+                return True
+
             logger.info("数据库初始化完成")
             return True
 
@@ -71,9 +191,15 @@ class InitializationService:
         Returns:
             Tuple[bool, str]: (是否成功, 结果信息)
         """
+        scan_state.begin()
+        success, message = await self._full_scan()
+        scan_state.finish(success, message)
+        return success, message
+
+    async def _full_scan(self) -> Tuple[bool, str]:
         try:
             logger.info("开始执行全盘扫描...")
-            Base.metadata.create_all(bind=engine)
+            create_tables()
 
             if not os.path.exists(settings.IMAGES_DIR):
                 error_msg = f"图片目录不存在: {settings.IMAGES_DIR}"
@@ -82,6 +208,9 @@ class InitializationService:
 
             logger.info(f"开始全盘扫描图片目录: {settings.IMAGES_DIR}")
             self.folders_map = {}
+            # 全盘扫描会清空并重建图片 ID，相似度索引与列表页缓存需整体失效
+            hash_index.invalidate()
+            listing_cache.bump_all()
 
             if not await self.process_folders(force_rescan=True):
                 return False, "文件夹处理失败"
@@ -89,6 +218,7 @@ class InitializationService:
             if not await self.process_files(force_rescan=True):
                 return False, "文件处理失败"
 
+            listing_cache.bump_all()
             logger.info("全盘扫描完成")
             return True, "扫描完成"
 
@@ -105,22 +235,9 @@ class InitializationService:
             if force_rescan:
                 with self.Session() as session:
                     try:
-                        if settings.DB_TYPE == "postgresql":
-                            # PostgreSQL：一条语句完成，RESTART IDENTITY 重置自增序列
-                            # CASCADE 自动处理外键依赖（images, failed_images）
-                            session.execute(text(
-                                "TRUNCATE TABLE images, failed_images, folders "
-                                "RESTART IDENTITY CASCADE"
-                            ))
-                        else:
-                            # SQLite：临时关闭外键约束，逐表清空
-                            session.execute(text("PRAGMA foreign_keys=OFF"))
-                            session.execute(text("DELETE FROM images"))
-                            session.execute(text("DELETE FROM failed_images"))
-                            session.execute(text("DELETE FROM folders"))
-                            session.execute(text("PRAGMA foreign_keys=ON"))
-
+                        clear_index_tables(session)
                         session.commit()
+                        folder_tree.invalidate()
                         logger.info("已清空相关表，准备重新扫描")
                     except Exception as e:
                         session.rollback()
@@ -145,12 +262,14 @@ class InitializationService:
                 self.folders_map["."] = root.id
                 self.folders_map[str(settings.IMAGES_DIR)] = root.id
 
-                all_folders, _ = self.file_service.collect_paths()
-                for folder_path in all_folders:
-                    folder_info = self.file_service.get_folder_info(folder_path)
-                    folder = self.file_service.save_folder(folder_info, session)
-                    if folder:
-                        self.folders_map[os.path.abspath(folder_path)] = folder.id
+                # 逐个目录惰性遍历、只处理子文件夹，不把整个图库的文件路径收集到内存里
+                # （os.walk 自上而下，父文件夹总是先于子文件夹建立）
+                for _, folders, _ in self.file_service.walk():
+                    for folder_path in folders:
+                        folder_info = self.file_service.get_folder_info(folder_path)
+                        folder = self.file_service.save_folder(folder_info, session)
+                        if folder:
+                            self.folders_map[os.path.abspath(folder_path)] = folder.id
 
                 session.commit()
                 logger.info(f"文件夹处理完成，共处理 {len(self.folders_map)} 个文件夹")
@@ -161,26 +280,16 @@ class InitializationService:
             logger.error(f"处理文件夹失败: {str(e)}", exc_info=True)
             return False
 
-    async def process_files(self, force_rescan: bool = False) -> bool:
-        """处理文件（分片 + 并发）"""
+    async def process_files(self, force_rescan: bool = False, workers: Optional[int] = None) -> bool:
+        """处理文件（扫描流水线，见 ScanPipeline）；workers 为并发解码任务数，默认 SCAN_WORKERS"""
         try:
             logger.info("开始处理文件...")
-            _, all_files = self.file_service.collect_paths()
-
-            chunk_size = settings.SCAN_CHUNK_SIZE
-            file_chunks = [
-                all_files[i: i + chunk_size]
-                for i in range(0, len(all_files), chunk_size)
-            ]
-
-            tasks = [
-                self._process_files_chunk(i, chunk)
-                for i, chunk in enumerate(file_chunks)
-            ]
-            results = await asyncio.gather(*tasks)
-
-            completed = sum(s for s, f in results)
-            failed = sum(f for s, f in results)
+            start = time.perf_counter()
+            completed, failed = await ScanPipeline(self, workers).run()
+
+            elapsed = time.perf_counter() - start
+            SCAN_LAST_DURATION_SECONDS.set(elapsed)
+            SCAN_FILES_PER_SECOND.set((completed + failed) / elapsed if elapsed > 0 else 0)
             logger.info(f"文件处理完成: 成功 {completed}, 失败 {failed}")
             return True
 
@@ -188,74 +297,44 @@ class InitializationService:
             logger.error(f"处理文件失败: {str(e)}", exc_info=True)
             return False
 
-    async def _process_files_chunk(
-        self, chunk_id: int, files: List[Tuple[str, str]]
+    async def process_shard(
+        self, rel_path: str, recursive: bool, workers: Optional[int] = None
     ) -> Tuple[int, int]:
-        """处理一组文件，每个 chunk 使用独立 Session，避免长事务"""
-        success_count = 0
-        failed_count = 0
-        session = self.Session()
-
-        try:
-            for idx, (file_path, folder_path) in enumerate(files, 1):
-                if await self._process_one_file_in_chunk(session, file_path, folder_path):
-                    success_count += 1
-                    if success_count % 10 == 0:
-                        session.commit()
-                        logger.info(f"分片 {chunk_id}: 已处理 {success_count}/{len(files)} 个文件")
-                else:
-                    failed_count += 1
-
-                if idx % 10 == 0:
-                    session.commit()
+        """
+        分片扫描（见 ShardService）：只处理 rel_path 子树，recursive=False 时只处理本层文件。
+        分片之间互不重叠，遍历时补建本分片内的文件夹不会与其他节点冲突
+        （父文件夹由 ShardService.plan 预先建好，os.walk 自上而下保证子文件夹在父之后）。
+        返回 (成功数, 失败数)
+        """
+        top = os.path.normpath(os.path.join(settings.IMAGES_DIR, rel_path))
+        return await ScanPipeline(self, workers).run(top, recursive, create_folders=True)
 
+    @staticmethod
+    def _commit(session: Session, folder_ids: Set[int]) -> None:
+        """提交事务并记录 DB 写入耗时；folder_ids 为本次提交涉及的文件夹，失效后清空"""
+        with SCAN_STAGE_SECONDS.labels("db_write").time():
             session.commit()
-            return success_count, failed_count
-
-        except Exception as e:
-            logger.error(f"分片 {chunk_id} 处理失败: {str(e)}", exc_info=True)
-            session.rollback()
-            return success_count, failed_count
-        finally:
-            session.close()
-
-    async def _process_one_file_in_chunk(
-        self, session: Session, file_path: str, folder_path: str
-    ) -> bool:
-        """抽取单个文件的处理逻辑，避免大段嵌套"""
-        try:
-            file_info = self.file_service.get_file_info(file_path)
-            abs_folder_path = os.path.abspath(folder_path)
-
-            with self.folder_lock:
-                folder_id = self.folders_map.get(abs_folder_path)
-
-            if not folder_id:
-                error_msg = f"找不到文件夹ID: {abs_folder_path}"
-                logger.warning(f"{error_msg} / {file_info.rel_path}")
-                self._record_failed_image(session, file_info.rel_path, folder_path, error_msg)
-                return False
-
-            image_service = ImageService(session)
-            if await image_service.process_image(file_info, folder_id):
-                return True
-            else:
-                self._record_failed_image(session, file_info.rel_path, folder_path, "图片处理失败")
-                return False
-
-        except Exception as e:
-            error_msg = f"处理文件异常: {str(e)}"
-            logger.error(f"{error_msg} - {file_path}")
-            rel_file_path = os.path.relpath(file_path, settings.IMAGES_DIR)
-            self._record_failed_image(session, rel_file_path, folder_path, error_msg)
-            return False
-
-    def _record_failed_image(self, session: Session, rel_file_path: str, folder_path: str, error_msg: str):
-        """记录失败图片"""
+        listing_cache.bump(folder_ids)
+        folder_ids.clear()
+        # 生成缩略图可能触发缓存淘汰，在事务提交后同步到数据库
+        flush_thumbnail_evictions()
+
+    def _record_failed_image(
+        self,
+        session: Session,
+        rel_file_path: str,
+        folder_path: str,
+        error_msg: str,
+        error: Optional[BaseException] = None,
+    ):
+        """记录失败图片，并按错误类别安排首次重试时间"""
         session.add(FailedImage(
             file_path=rel_file_path,
             folder_path=os.path.relpath(folder_path, settings.IMAGES_DIR),
             error_message=error_msg,
+            error_class=classify_error(error, error_msg),
+            retry_count=0,
+            next_retry_at=next_retry_time(0),
         ))
 
     async def process_single_file(
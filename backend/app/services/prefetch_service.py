@@ -0,0 +1,178 @@
+"""
+Prefetcher：浏览文件夹时预热后续内容。
+
+设计说明：
+  get_folder_images 只处理请求的那一页。缩略图被缓存淘汰后需要按需重新生成，
+  NAS 上 OS 页缓存冷的时候读缩略图文件也要等磁盘，用户滚动到下一页时会明显卡顿。
+
+  返回第 N 页后，后台预热：
+    - 第 N+1 … N+PREFETCH_PAGES 页：缺失的缩略图重新生成，已有的缩略图文件
+      （打包存储下为段文件中的对应区间）通过 posix_fadvise(WILLNEED) 让内核预读进页缓存；启用雪碧图时顺带生成该页雪碧图
+    - 返回子文件夹列表后：每个子文件夹第一页的前 PREFETCH_SUBFOLDER_IMAGES 张（点进去首屏可见）
+
+预算与取消：
+  所有预取任务共用 PREFETCH_CONCURRENCY 个并发名额（默认 1），不与前台请求争抢
+  media 线程池；单个任务最多运行 PREFETCH_TIME_BUDGET 秒。
+  同一客户端（IP + User-Agent）发起同类列表请求时（翻页、进入其他文件夹、返回上级），
+  之前的同类预取任务被取消，只为用户当前所在的位置预热。
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.database.models import Image
+from app.services.cache_service import thumbnail_cache
+from app.services.image_service import ImageService
+from app.services.sprite_service import SpriteService
+from app.utils.logger import logger
+from app.utils.metrics import PREFETCH_ITEMS_TOTAL
+from app.utils.pack_store import PackStore
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+# 预取任务类型：后续分页 / 子文件夹首屏
+PAGES = "pages"
+SUBFOLDERS = "subfolders"
+
+
+def client_key(request: Request) -> str:
+    """区分客户端：同一浏览器的列表请求依次取代之前的预取任务"""
+    host = request.client.host if request.client else ""
+    return f"{host}|{request.headers.get('user-agent', '')}"
+
+
+def _readahead(paths: List[str]) -> None:
+    """提示内核预读缩略图文件（不支持 posix_fadvise 的平台直接读一遍）"""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while os.read(fd, 1 << 16):
+                    pass
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class Prefetcher:
+    """进程内预取调度：{(客户端, 任务类型): 任务}"""
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def after_images_page(self, client: str, folder_id: int, page: int, total_pages: int) -> None:
+        """返回第 page 页图片后，预热后续 PREFETCH_PAGES 页"""
+        pages = list(range(page + 1, min(page + settings.PREFETCH_PAGES, total_pages) + 1))
+        self._schedule((client, PAGES), pages and (lambda: self._warm_pages(folder_id, pages)))
+
+    def after_subfolders_page(self, client: str, folder_ids: List[int]) -> None:
+        """返回子文件夹列表后，预热各子文件夹的首屏缩略图"""
+        self._schedule((client, SUBFOLDERS), folder_ids and (lambda: self._warm_subfolders(folder_ids)))
+
+    async def stop(self) -> None:
+        """取消全部预取任务（应用退出时调用）"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    # ----------------------------------------------------------------
+    # 内部实现
+    # ----------------------------------------------------------------
+
+    def _schedule(self, key: Tuple[str, str], factory: Optional[Callable[[], Awaitable]]) -> None:
+        """取消同一客户端的同类旧任务；factory 为空（没有可预取的内容）时只取消"""
+        previous = self._tasks.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        if not factory or not settings.PREFETCH_ENABLED:
+            return
+
+        task = asyncio.create_task(self._run_with_budget(factory()))
+        self._tasks[key] = task
+
+        def _forget(done: asyncio.Task) -> None:
+            if self._tasks.get(key) is done:
+                del self._tasks[key]
+
+        task.add_done_callback(_forget)
+
+    async def _run_with_budget(self, coro: Awaitable) -> None:
+        try:
+            async with asyncio.timeout(settings.PREFETCH_TIME_BUDGET):
+                await coro
+        except TimeoutError:
+            logger.debug("预取超出时间预算，已停止")
+        except asyncio.CancelledError:
+            PREFETCH_ITEMS_TOTAL.labels("cancelled").inc()
+            raise
+        except Exception as e:
+            logger.warning(f"预取失败: {str(e)}")
+
+    async def _warm_pages(self, folder_id: int, pages: List[int]) -> None:
+        for page in pages:
+            db = SessionLocal()
+            try:
+                images = ImageService(db).get_folder_page(folder_id, page)
+                await self._warm_images(db, images)
+                if settings.SPRITE_ENABLED and images:
+                    sprite_service = SpriteService()
+                    if any(sprite_service.has_thumbnail(img) for img in images):
+                        async with self._slot():
+                            await sprite_service.get_sprite_path(folder_id, page, images)
+            finally:
+                db.close()
+
+    async def _warm_subfolders(self, folder_ids: List[int]) -> None:
+        for folder_id in folder_ids:
+            db = SessionLocal()
+            try:
+                images = ImageService(db).get_folder_page(folder_id, 1)
+                await self._warm_images(db, images[: settings.PREFETCH_SUBFOLDER_IMAGES])
+            finally:
+                db.close()
+
+    async def _warm_images(self, db: Session, images: List[Image]) -> None:
+        """缺失的缩略图重新生成，已有的预读进页缓存"""
+        image_service = ImageService(db)
+        cached_keys = []
+        for image in images:
+            if image.thumbnail_path and image.thumbnail_path in thumbnail_cache:
+                cached_keys.append(image.thumbnail_path)
+                continue
+            async with self._slot():
+                try:
+                    await image_service.ensure_thumbnail(image)
+                    PREFETCH_ITEMS_TOTAL.labels("generated").inc()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    PREFETCH_ITEMS_TOTAL.labels("failed").inc()
+
+        if cached_keys:
+            async with self._slot():
+                if isinstance(thumbnail_cache, PackStore):
+                    await asyncio.to_thread(thumbnail_cache.readahead, cached_keys)
+                else:
+                    await asyncio.to_thread(
+                        _readahead, [thumbnail_cache.path_for(key) for key in cached_keys]
+                    )
+            PREFETCH_ITEMS_TOTAL.labels("readahead").inc(len(cached_keys))
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.PREFETCH_CONCURRENCY)
+        return self._semaphore
+
+
+prefetcher = Prefetcher()
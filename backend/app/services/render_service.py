@@ -0,0 +1,155 @@
+"""
+RenditionService：按需缩放/变换原图（GET /api/images/{id}/render）。
+
+设计说明：
+  前端看大图时只需要屏幕尺寸的图，直接下发 4000 万像素的原图（HEIC 还要先整张转换）
+  浪费带宽也拖慢首帧。这里按请求参数生成缩放后的副本（rendition）：
+
+    - 尺寸白名单：w / h 只接受 RENDITION_SIZES 中的值，参数组合有限，
+      缓存不会被任意尺寸撑爆。
+    - 草稿解码：JPEG 用 Image.draft() 让解码器直接按 1/2、1/4、1/8 缩小解码，
+      大图解码耗时与内存成倍下降；其余格式完整解码后缩放。
+    - 方向校正：按 EXIF Orientation 旋转后再缩放，输出不再携带方向标记。
+    - 缓存：结果放入 rendition_cache（DiskCache，RENDITION_CACHE_MAX_MB 配额，LRU 淘汰），
+      键包含参数与原文件的 (mtime, size)，原文件被替换后自动生成新版本；
+      有内容指纹时键与源路径无关，文件被移动 / 改名后仍命中。
+    - 单飞：同一参数的并发请求只生成一次。
+
+  fit=contain 等比缩放到 w×h 以内（不放大），fit=cover 居中裁剪为正好 w×h。
+"""
+import hashlib
+import math
+import os
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.database.models import Image
+from app.utils.disk_cache import DiskCache
+from app.utils.image_utils import _register_heif, run_in_media_pool
+from app.utils.singleflight import SingleFlight
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+rendition_cache = DiskCache(
+    "renditions",
+    settings.CACHE_DIR / "renditions",
+    max_bytes=settings.RENDITION_CACHE_MAX_MB * 1024 * 1024,
+)
+
+FITS = ("contain", "cover")
+# fmt 参数 → (Pillow 格式, 扩展名, MIME)
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "png": ("PNG", "png", "image/png"),
+}
+
+# EXIF Orientation 为这些值时图像需要旋转 90°，草稿解码的目标宽高要对调
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+_ORIENTATION_TAG = 0x0112
+
+_renders = SingleFlight()
+
+
+class RenditionService:
+
+    def __init__(self, width: Optional[int], height: Optional[int], fit: str, fmt: str):
+        """参数须已通过 validate() 校验"""
+        self.width = width
+        self.height = height
+        self.fit = fit
+        self.fmt = fmt
+
+    @staticmethod
+    def validate(width: Optional[int], height: Optional[int], fit: str, fmt: str) -> Optional[str]:
+        """检查请求参数，不合法时返回错误说明"""
+        if width is None and height is None:
+            return "w or h is required"
+        sizes = settings.RENDITION_SIZE_LIST
+        for name, value in (("w", width), ("h", height)):
+            if value is not None and value not in sizes:
+                return f"{name} must be one of {sizes}"
+        if fit not in FITS:
+            return f"fit must be one of {list(FITS)}"
+        if fit == "cover" and (width is None or height is None):
+            return "fit=cover requires both w and h"
+        if fmt not in FORMATS:
+            return f"fmt must be one of {list(FORMATS)}"
+        return None
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.fmt][2]
+
+    async def get_rendition_path(self, image: Image) -> str:
+        """返回缩放结果的文件路径，缓存未命中时生成（同一参数只生成一次）"""
+        source = os.path.join(settings.IMAGES_DIR, image.file_path)
+        stat = os.stat(source)
+
+        # 有指纹时不用路径区分版本：移动 / 改名后记录被改指向新路径，缓存照常命中
+        source_id = image.fingerprint or image.file_path
+        key = self._cache_key(image.id, source_id, stat.st_mtime_ns, stat.st_size)
+        cached = rendition_cache.get(key)
+        if cached:
+            return cached
+        return await _renders.do(key, lambda: self._build(source, key))
+
+    def _cache_key(self, image_id: int, source_id: str, mtime_ns: int, size: int) -> str:
+        version = hashlib.sha1(f"{source_id}:{mtime_ns}:{size}".encode("utf-8")).hexdigest()[:12]
+        extension = FORMATS[self.fmt][1]
+        return os.path.join(
+            str(image_id),
+            f"{self.width or 0}x{self.height or 0}_{self.fit}_{version}.{extension}",
+        )
+
+    async def _build(self, source: str, key: str) -> str:
+        target = rendition_cache.path_for(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.tmp"
+        try:
+            await run_in_media_pool(self._render, source, tmp_target)
+            os.replace(tmp_target, target)
+        except BaseException:
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
+            raise
+        rendition_cache.put(key)
+        return target
+
+    def _render(self, source: str, target: str) -> None:
+        if source.lower().endswith((".heic", ".heif")):
+            _register_heif()
+
+        with PILImage.open(source) as img:
+            transposed = img.getexif().get(_ORIENTATION_TAG) in _TRANSPOSED_ORIENTATIONS
+            box = self._box(img.size[::-1] if transposed else img.size)
+            if img.format == "JPEG":
+                img.draft("RGB", box[::-1] if transposed else box)
+            # GIF 等多帧图只取第一帧
+            img.seek(0)
+            result = ImageOps.exif_transpose(img)
+
+            if self.fit == "cover":
+                result = ImageOps.fit(result, box, method=PILImage.LANCZOS)
+            else:
+                result.thumbnail(box, PILImage.LANCZOS)
+
+        pil_format = FORMATS[self.fmt][0]
+        if pil_format == "JPEG" and result.mode != "RGB":
+            result = result.convert("RGB")
+        elif result.mode not in ("RGB", "RGBA", "L", "LA"):
+            result = result.convert("RGBA")
+
+        if pil_format == "PNG":
+            result.save(target, pil_format, optimize=True)
+        else:
+            result.save(target, pil_format, quality=settings.RENDITION_QUALITY)
+
+    def _box(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """目标边框（size 为方向校正后的原图尺寸）；只给出一边时另一边按原图比例计算"""
+        width, height = size
+        if self.height is None:
+            return self.width, max(1, math.ceil(self.width * height / width))
+        if self.width is None:
+            return max(1, math.ceil(self.height * width / height)), self.height
+        return self.width, self.height
@@ -0,0 +1,304 @@
+"""
+RetryService：失败文件的后台重试。
+
+设计说明：
+  扫描时处理失败的文件写入 failed_images，之前只能靠全盘扫描重试，
+  代价是所有文件重新处理一遍。这里按错误类别区别对待：
+
+    transient  IO 错误、数据库被锁、NAS 挂载抖动、超时等，
+               按指数退避（RETRY_BASE_SECONDS * 2^retry_count，封顶
+               RETRY_MAX_BACKOFF_SECONDS）自动重试，直到 RETRY_MAX_ATTEMPTS。
+    permanent  文件损坏、无法识别的格式、不支持的编码、文件已被删除 / 移走（所在目录仍可访问），
+               重试也不会成功，不再自动重试（可通过 API 手动强制重试）。
+
+  RetryWorker 是进程内的后台协程，在 lifespan 中启动/停止；
+  API 批量重试时通过 wake() 立即唤醒，不必等到下一个轮询周期。
+"""
+import asyncio
+import errno
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.database.models import FailedImage, Folder
+from app.services.cache_service import flush_thumbnail_evictions, listing_cache
+from app.services.file_service import FileService
+from app.services.image_service import ImageService
+from app.utils.logger import logger
+from app.utils.metrics import RETRY_ATTEMPTS_TOTAL
+from sqlalchemy import or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# 视为临时性故障的 errno：IO 错误、挂载断开、资源忙、超时等
+# （ENOENT 单独判断，见 _is_missing_mount）
+_TRANSIENT_ERRNOS = {
+    errno.EIO, errno.EAGAIN, errno.EBUSY, errno.ETIMEDOUT, errno.ESTALE,
+    errno.ENOTCONN, errno.EHOSTDOWN, errno.EHOSTUNREACH,
+    errno.ECONNRESET, errno.EINTR, errno.ENOMEM, errno.ENFILE, errno.EMFILE,
+}
+
+# 按错误信息判定（process_image 失败时只留下字符串的情况）
+_PERMANENT_MARKERS = (
+    "cannot identify image file",
+    "image file is truncated",
+    "not a valid",
+    "unsupported",
+    "decompression bomb",
+    "无法打开视频文件",
+    "无法读取视频帧",
+)
+_TRANSIENT_MARKERS = (
+    "database is locked",
+    "timed out",
+    "timeout",
+    "input/output error",
+    "stale file handle",
+    "no such file or directory",
+    "找不到文件夹id",
+)
+
+
+def _is_missing_mount(path: Optional[str]) -> bool:
+    """
+    文件不存在时区分两种情况：所在目录还能访问，说明文件已被删除 / 移走（permanent）；
+    目录也访问不到，可能是 NAS 挂载暂时断开（transient）。
+    """
+    if not path:
+        return True
+    parent = os.path.dirname(os.path.join(str(settings.IMAGES_DIR), os.fspath(path)))
+    return not os.path.isdir(parent)
+
+
+def classify_error(error: Optional[BaseException] = None, message: Optional[str] = None) -> str:
+    """把异常（或错误信息）归类为 transient / permanent，无法判断时按 transient 处理"""
+    if error is not None:
+        if isinstance(error, OperationalError):
+            return TRANSIENT
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return TRANSIENT
+        if isinstance(error, OSError) and error.errno in _TRANSIENT_ERRNOS:
+            return TRANSIENT
+        if isinstance(error, OSError) and error.errno == errno.ENOENT:
+            return TRANSIENT if _is_missing_mount(error.filename) else PERMANENT
+        # PIL.UnidentifiedImageError 继承自 OSError 但没有 errno，属于文件本身的问题
+        if type(error).__name__ in ("UnidentifiedImageError", "DecompressionBombError"):
+            return PERMANENT
+        if isinstance(error, (ValueError, SyntaxError, NotImplementedError)):
+            return PERMANENT
+        message = message or str(error)
+
+    text = (message or "").lower()
+    if any(marker in text for marker in _PERMANENT_MARKERS):
+        return PERMANENT
+    if any(marker in text for marker in _TRANSIENT_MARKERS):
+        return TRANSIENT
+    return TRANSIENT
+
+
+def next_retry_time(retry_count: int, now: Optional[datetime] = None) -> datetime:
+    """指数退避：第 n 次失败后等待 base * 2^n 秒，封顶 RETRY_MAX_BACKOFF_SECONDS"""
+    delay = min(
+        settings.RETRY_BASE_SECONDS * (2 ** retry_count),
+        settings.RETRY_MAX_BACKOFF_SECONDS,
+    )
+    return (now or datetime.utcnow()) + timedelta(seconds=delay)
+
+
+class RetryService:
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.file_service = FileService(db)
+
+    # ----------------------------------------------------------------
+    # 查询与批量操作（供 API 使用）
+    # ----------------------------------------------------------------
+
+    def list_failures(self, error_class: Optional[str] = None):
+        """失败记录查询（按最近失败时间倒序），由调用方分页"""
+        query = self.db.query(FailedImage)
+        if error_class:
+            query = query.filter(FailedImage.error_class == error_class)
+        return query.order_by(FailedImage.id.desc())
+
+    def schedule_retry(self, ids: Optional[Sequence[int]] = None) -> int:
+        """
+        把指定（或全部）失败记录标记为立即重试。
+        手动重试会覆盖 permanent 分类并重置次数，用户明确要求时仍然尝试一次。
+        """
+        query = self.db.query(FailedImage)
+        if ids:
+            query = query.filter(FailedImage.id.in_(ids))
+        count = query.update(
+            {
+                FailedImage.next_retry_at: None,
+                FailedImage.error_class: TRANSIENT,
+                FailedImage.retry_count: 0,
+            },
+            synchronize_session=False,
+        )
+        self.db.commit()
+        return count
+
+    def clear(self, ids: Optional[Sequence[int]] = None) -> int:
+        """删除指定（或全部）失败记录"""
+        query = self.db.query(FailedImage)
+        if ids:
+            query = query.filter(FailedImage.id.in_(ids))
+        count = query.delete(synchronize_session=False)
+        self.db.commit()
+        return count
+
+    # ----------------------------------------------------------------
+    # 重试
+    # ----------------------------------------------------------------
+
+    def due_failures(self, limit: int) -> List[FailedImage]:
+        """到期且可重试的失败记录"""
+        now = datetime.utcnow()
+        return (
+            self.db.query(FailedImage)
+            .filter(or_(FailedImage.error_class.is_(None), FailedImage.error_class != PERMANENT))
+            .filter(FailedImage.retry_count < settings.RETRY_MAX_ATTEMPTS)
+            .filter(or_(FailedImage.next_retry_at.is_(None), FailedImage.next_retry_at <= now))
+            .order_by(FailedImage.next_retry_at.asc(), FailedImage.id.asc())
+            .limit(limit)
+            .all()
+        )
+
+    async def retry_due(self, limit: int) -> Tuple[int, int]:
+        """重试一批到期记录，返回 (成功数, 失败数)"""
+        succeeded = failed = 0
+        records = self.due_failures(limit)
+        retried_paths = set()
+        for record in records:
+            # 同一文件可能有多条失败记录，成功一次即全部删除
+            if record.file_path in retried_paths:
+                continue
+            retried_paths.add(record.file_path)
+            if await self.retry_one(record):
+                succeeded += 1
+            else:
+                failed += 1
+        return succeeded, failed
+
+    async def retry_one(self, record: FailedImage) -> bool:
+        """重试单条记录：成功则删除该文件的所有失败记录，失败则按分类退避"""
+        # 先取出字段：处理过程中的 commit/rollback 会使 ORM 对象过期
+        record_id, file_path = record.id, record.file_path
+        folder_path = record.folder_path or os.path.dirname(file_path) or "."
+
+        error: Optional[BaseException] = None
+        try:
+            folder = self.db.query(Folder).filter(Folder.folder_path == folder_path).first()
+            if folder is None:
+                # 文件夹尚未入库（扫描 / 补偿验证稍后会建立），按信息归为 transient
+                raise FileNotFoundError(f"找不到文件夹ID: {folder_path}")
+
+            full_path = os.path.join(str(settings.IMAGES_DIR), file_path)
+            file_info = self.file_service.get_file_info(full_path)
+
+            image_service = ImageService(self.db)
+            if await image_service.process_image(file_info, folder.id):
+                self.db.query(FailedImage).filter(
+                    FailedImage.file_path == file_path
+                ).delete(synchronize_session=False)
+                self.db.commit()
+                listing_cache.bump([folder.id])
+                flush_thumbnail_evictions()
+                RETRY_ATTEMPTS_TOTAL.labels("success").inc()
+                logger.info(f"重试成功: {file_path}")
+                return True
+
+            error = image_service.last_error
+        except Exception as e:
+            self.db.rollback()
+            error = e
+
+        self._record_attempt(record_id, error)
+        return False
+
+    def _record_attempt(self, record_id: int, error: Optional[BaseException]) -> None:
+        """记录一次失败的重试：更新分类、次数和下次重试时间"""
+        record = self.db.query(FailedImage).filter(FailedImage.id == record_id).first()
+        if record is None:
+            return
+
+        now = datetime.utcnow()
+        record.error_class = classify_error(error)
+        if error is not None:
+            record.error_message = str(error)
+        record.retry_count = (record.retry_count or 0) + 1
+        record.last_attempt_at = now
+        record.next_retry_at = next_retry_time(record.retry_count, now)
+        self.db.commit()
+
+        result = "permanent" if record.error_class == PERMANENT else "retry_later"
+        if record.retry_count >= settings.RETRY_MAX_ATTEMPTS:
+            result = "exhausted"
+        RETRY_ATTEMPTS_TOTAL.labels(result).inc()
+        logger.warning(
+            f"重试失败 ({record.error_class}, 第 {record.retry_count} 次): "
+            f"{record.file_path} - {record.error_message}"
+        )
+
+
+class RetryWorker:
+    """进程内后台重试协程"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wake_event: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if not settings.RETRY_ENABLED or self._task is not None:
+            return
+        self._wake_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("失败文件重试任务已启动")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def wake(self) -> None:
+        """立即触发一轮重试（API 批量重试后调用）"""
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wake_event.wait(), timeout=settings.RETRY_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
+
+            db = SessionLocal()
+            try:
+                succeeded, failed = await RetryService(db).retry_due(settings.RETRY_BATCH_SIZE)
+                if succeeded or failed:
+                    logger.info(f"失败文件重试完成: 成功 {succeeded}, 失败 {failed}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"失败文件重试异常: {str(e)}", exc_info=True)
+            finally:
+                db.close()
+
+
+retry_worker = RetryWorker()
@@ -0,0 +1,564 @@
+"""
+ScanPipeline：有界队列连接的分阶段扫描流水线。
+
+设计说明：
+  以前 process_files 先把整个图库的路径收集成列表，切片后一次性为所有分片创建
+  协程交给 asyncio.gather，内存与任务数随图库线性增长；每个分片各自写库，
+  多个分片争抢 SQLite 写锁。现在拆成四个阶段，阶段之间用有界队列连接：
+
+    walk    os.walk 惰性遍历（线程中逐个目录推进），每个目录的文件按
+            SCAN_CHUNK_SIZE 分批放入 walk 队列。
+    stat    取文件信息，并按批查询数据库，已入库的文件直接计为完成（续传很快）。
+    decode  workers 个任务并发：读 EXIF、生成缩略图。解码 / 编码在媒体线程池中执行，
+            Pillow 释放 GIL，可以利用多核。产出尚未写库的 Image 对象。
+    write   单个写入任务：攒够 SCAN_CHUNK_SIZE 条或队列暂时为空时批量提交，
+            写库只有一个事务，不再互相等待写锁。
+
+  队列容量为 SCAN_QUEUE_SIZE，上游比下游快时 put 阻塞（背压），任何时刻在途的
+  文件数有上限，内存占用与图库规模无关。
+
+  瓶颈定位：各队列深度通过 simplephotos_scan_queue_depth{queue=...} 指标与
+  /api/health/ready 的 scan.queues 暴露。某个队列长期接近满，说明它下游的阶段
+  是瓶颈（例如 decode 队列满而 write 队列空：解码跟不上，可增加 SCAN_WORKERS）；
+  所有队列都接近空，说明瓶颈在 walk（磁盘 / 网络存储遍历）。
+
+  插队：首次导入大图库时，用户打开的文件夹可能要等到最后才轮到。decode 队列是
+  优先级队列，路由通过 scan_priority.boost() 把正在浏览的文件夹提前：
+    - 打开的文件夹（get_folder_images / get_subfolders 的父文件夹）：其全部待处理文件
+    - 可见子文件夹（get_subfolders 返回的这一页）：各自前 PAGE_SIZE 个文件，即点进去的首页
+  尚未遍历到的文件直接列出该目录加入队列，遍历到时跳过；已在队列中的文件以高优先级
+  再放入一份，先取到的一份生效。插队的文件不占用 decode 队列容量，批量遍历照常进行。
+
+  停止（scan_state.request_stop / 分片租约丢失）时 walk 不再产出，
+  下游阶段丢弃队列中尚未处理的文件，已写入的结果保留。
+"""
+import asyncio
+import itertools
+import os
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from app.config import settings
+from app.database.models import Folder, Image
+from app.models import FileInfo
+from app.services.file_service import FileService
+from app.services.image_service import ImageService
+from app.services.similarity_service import hash_index
+from app.utils.logger import logger
+from app.utils.metrics import (SCAN_BOOSTED_FILES_TOTAL, SCAN_FAILURES_TOTAL,
+                               SCAN_FILES_TOTAL, SCAN_QUEUE_DEPTH,
+                               SCAN_STAGE_SECONDS, classify_exception)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+if TYPE_CHECKING:
+    from app.services.init_service import InitializationService
+
+# 队列结束标记
+_DONE = None
+
+# decode 队列优先级，数值小的先处理；结束标记排在所有文件之后
+_PRIORITY_OPENED = 0
+_PRIORITY_CHILDREN = 1
+_PRIORITY_NORMAL = 2
+_PRIORITY_DONE = 3
+_PRIORITY_LABELS = {_PRIORITY_OPENED: "opened", _PRIORITY_CHILDREN: "children"}
+
+
+class _Result:
+    """decode 阶段的产出：成功时 image 为待写入的 Image，失败时带错误信息"""
+    __slots__ = ("file_info", "folder_path", "folder_id", "image", "error_msg", "error")
+
+    def __init__(self, file_info: FileInfo, folder_path: str, folder_id: Optional[int],
+                 image: Optional[Image] = None, error_msg: Optional[str] = None,
+                 error: Optional[BaseException] = None):
+        self.file_info = file_info
+        self.folder_path = folder_path
+        self.folder_id = folder_id
+        self.image = image
+        self.error_msg = error_msg
+        self.error = error
+
+
+class ScanPipeline:
+
+    def __init__(self, service: "InitializationService", workers: Optional[int] = None):
+        self.service = service
+        self.workers = max(1, workers or settings.SCAN_WORKERS)
+        self.batch_size = max(1, settings.SCAN_CHUNK_SIZE)
+        self.walk_queue: asyncio.Queue = asyncio.Queue(
+            maxsize=max(1, settings.SCAN_QUEUE_SIZE // self.batch_size)
+        )
+        # decode 队列本身不限长，遍历产出的文件通过 _decode_slots 限制在 SCAN_QUEUE_SIZE 以内，
+        # 插队的文件不受限（数量取决于用户打开的文件夹）
+        self.decode_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._decode_slots = asyncio.Semaphore(settings.SCAN_QUEUE_SIZE)
+        self._sequence = itertools.count()
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.SCAN_QUEUE_SIZE)
+        self.completed = 0
+        self.failed = 0
+
+        # 插队状态（均为文件绝对路径，只在事件循环线程中读写）：
+        #   _queued   在 decode 队列中、尚未被取走的文件 → 其最高优先级
+        #   _taken    已被 decode 取走、尚未写库的文件
+        #   _boosted  遍历到之前就插队的文件，遍历到时跳过
+        #   _failed   本次处理失败的文件，再次打开文件夹时不重复插队
+        self._queued: Dict[str, int] = {}
+        self._taken: Set[str] = set()
+        self._boosted: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._walked = False
+        # 插队查询数据库期间写入的文件（查询结果可能已过时）
+        self._written_meanwhile: Optional[Set[str]] = None
+        self._top = os.path.abspath(settings.IMAGES_DIR)
+        self._recursive = True
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._boost_requests: asyncio.Queue = asyncio.Queue()
+
+    def queue_depths(self) -> Dict[str, int]:
+        """各队列当前深度（walk 队列按文件数估算）"""
+        return {
+            "walk": self.walk_queue.qsize() * self.batch_size,
+            "decode": self.decode_queue.qsize(),
+            "write": self.write_queue.qsize(),
+        }
+
+    async def run(
+        self, top: Optional[str] = None, recursive: bool = True, create_folders: bool = False
+    ) -> Tuple[int, int]:
+        """
+        扫描 top（默认 IMAGES_DIR）下的文件，返回 (成功数, 失败数)。
+        create_folders=True 时 walk 阶段顺带建立遇到的文件夹记录（分片扫描使用）。
+        """
+        from app.services.init_service import scan_state
+
+        self._top = os.path.abspath(top or settings.IMAGES_DIR)
+        self._recursive = recursive
+        self._loop = asyncio.get_running_loop()
+        for name, queue in (("walk", self.walk_queue), ("decode", self.decode_queue),
+                            ("write", self.write_queue)):
+            SCAN_QUEUE_DEPTH.labels(name).set_function(queue.qsize)
+        scan_state.set_queue_probe(self.queue_depths)
+        scan_priority.attach(self)
+
+        # 插队任务一直等待请求，不参与 gather，流水线结束时取消
+        booster = asyncio.create_task(self._boost())
+        tasks = [
+            asyncio.create_task(self._walk(top, recursive, create_folders)),
+            asyncio.create_task(self._stat()),
+            *(asyncio.create_task(self._decode()) for _ in range(self.workers)),
+            asyncio.create_task(self._write()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            scan_priority.detach(self)
+            for task in (*tasks, booster):
+                task.cancel()
+            await asyncio.gather(*tasks, booster, return_exceptions=True)
+            scan_state.set_queue_probe(None)
+            for name in ("walk", "decode", "write"):
+                SCAN_QUEUE_DEPTH.labels(name).set_function(lambda: 0)
+        return self.completed, self.failed
+
+    def _stopping(self) -> bool:
+        from app.services.init_service import scan_state
+        return scan_state.stop_requested or self.service.abort.is_set()
+
+    # ----------------------------------------------------------------
+    # walk
+    # ----------------------------------------------------------------
+
+    async def _walk(self, top: Optional[str], recursive: bool, create_folders: bool) -> None:
+        from app.services.init_service import scan_state
+
+        directories = FileService.walk(top, recursive)
+        session = self.service.Session() if create_folders else None
+        try:
+            while not self._stopping():
+                entry = await asyncio.to_thread(self._next_directory, directories, session)
+                if entry is None:
+                    break
+                root, files = entry
+                if not files:
+                    continue
+                scan_state.add_total(len(files))
+                for i in range(0, len(files), self.batch_size):
+                    await self.walk_queue.put((root, files[i:i + self.batch_size]))
+        finally:
+            if session is not None:
+                session.close()
+            await self.walk_queue.put(_DONE)
+
+    def _next_directory(
+        self, directories: Iterator[Tuple[str, List[str], List[str]]], session: Optional[Session]
+    ) -> Optional[Tuple[str, List[str]]]:
+        """在线程中推进一个目录；需要时先建好该目录的文件夹记录，保证其中的文件能找到文件夹 ID"""
+        with SCAN_STAGE_SECONDS.labels("walk").time():
+            entry = next(directories, None)
+        if entry is None:
+            return None
+        root, _, files = entry
+        if session is not None:
+            service = self.service
+            folder = service.file_service.save_folder(
+                service.file_service.get_folder_info(root), session
+            )
+            session.commit()
+            if folder:
+                with service.folder_lock:
+                    service.folders_map[os.path.abspath(root)] = folder.id
+        return root, files
+
+    # ----------------------------------------------------------------
+    # stat
+    # ----------------------------------------------------------------
+
+    async def _stat(self) -> None:
+        from app.services.init_service import scan_state
+
+        session = self.service.Session()
+        try:
+            while True:
+                batch = await self.walk_queue.get()
+                if batch is _DONE:
+                    break
+                if self._stopping():
+                    continue
+                folder_path, files = batch
+                infos = await asyncio.to_thread(self._stat_batch, session, files)
+                # 查询结束后再排除插队的文件：查询期间插队的也不会重复处理
+                boosted = self._take_boosted(files) if self._boosted else set()
+                if boosted:
+                    infos = [info for info in infos if info.full_path not in boosted]
+                skipped = len(files) - len(boosted) - len(infos)
+                if skipped:
+                    # 已入库（续传 / 非全量扫描）或遍历后已被删除的文件，与以前一样计为成功
+                    self.completed += skipped
+                    SCAN_FILES_TOTAL.labels("success").inc(skipped)
+                    scan_state.advance(skipped)
+                # 先全部登记，等待队列容量期间被插队的文件不会再以插队身份重复放入
+                for info in infos:
+                    self._queued[info.full_path] = _PRIORITY_NORMAL
+                for info in infos:
+                    await self._decode_slots.acquire()
+                    self._put_decode(_PRIORITY_NORMAL, (info, folder_path))
+        finally:
+            session.close()
+            self._walked = True
+            for _ in range(self.workers):
+                self._put_decode(_PRIORITY_DONE, _DONE)
+
+    def _take_boosted(self, files: List[str]) -> Set[str]:
+        """遍历到之前已插队的文件（它们在插队时已计入总数），返回其绝对路径"""
+        from app.services.init_service import scan_state
+
+        boosted = {os.path.abspath(file_path) for file_path in files} & self._boosted
+        if boosted:
+            self._boosted -= boosted
+            scan_state.add_total(-len(boosted))
+        return boosted
+
+    def _put_decode(self, priority: int, item) -> None:
+        # 序号保证同一优先级内先进先出，也避免比较 item 本身
+        self.decode_queue.put_nowait((priority, next(self._sequence), item))
+
+    def _stat_batch(self, session: Session, files: List[str]) -> List[FileInfo]:
+        infos = []
+        for file_path in files:
+            try:
+                infos.append(self.service.file_service.get_file_info(file_path))
+            except OSError:
+                # 遍历后被删除：跳过，下次验证时自然消失
+                continue
+        if not infos:
+            return infos
+        existing = {
+            path for (path,) in session.query(Image.file_path)
+            .filter(Image.file_path.in_([info.rel_path for info in infos]))
+        }
+        # 只读查询，结束本次读事务，避免长期持有 WAL 快照
+        session.rollback()
+        return [info for info in infos if info.rel_path not in existing]
+
+    # ----------------------------------------------------------------
+    # decode
+    # ----------------------------------------------------------------
+
+    async def _decode(self) -> None:
+        image_service = ImageService(self.service.db)
+        try:
+            while True:
+                priority, _, item = await self.decode_queue.get()
+                if item is _DONE:
+                    break
+                if priority == _PRIORITY_NORMAL:
+                    self._decode_slots.release()
+                if self._stopping():
+                    continue
+                file_info, folder_path = item
+                if file_info.full_path not in self._queued:
+                    # 插队的副本已先被取走
+                    continue
+                del self._queued[file_info.full_path]
+                self._taken.add(file_info.full_path)
+                await self.write_queue.put(
+                    await self._prepare(image_service, file_info, folder_path)
+                )
+        finally:
+            await self.write_queue.put(_DONE)
+
+    async def _prepare(self, image_service: ImageService, file_info: FileInfo,
+                       folder_path: str) -> _Result:
+        service = self.service
+        with service.folder_lock:
+            folder_id = service.folders_map.get(os.path.abspath(folder_path))
+        if not folder_id:
+            error_msg = f"找不到文件夹ID: {os.path.abspath(folder_path)}"
+            logger.warning(f"{error_msg} / {file_info.rel_path}")
+            SCAN_FAILURES_TOTAL.labels("FolderNotFound").inc()
+            return _Result(file_info, folder_path, None, error_msg=error_msg)
+        try:
+            image = await image_service.prepare_image(file_info, folder_id)
+            return _Result(file_info, folder_path, folder_id, image=image)
+        except Exception as e:
+            SCAN_FAILURES_TOTAL.labels(classify_exception(e)).inc()
+            logger.error(f"处理图片失败 {file_info.full_path}: {str(e)}")
+            return _Result(file_info, folder_path, folder_id,
+                           error_msg=f"图片处理失败: {str(e)}", error=e)
+
+    # ----------------------------------------------------------------
+    # 插队
+    # ----------------------------------------------------------------
+
+    def boost(self, folder_ids: Sequence[int], priority: int, limit: Optional[int]) -> None:
+        """请求把这些文件夹的待处理文件（每个最多 limit 个）提前；可在任意线程调用"""
+        if self._loop is not None and folder_ids:
+            self._loop.call_soon_threadsafe(
+                self._boost_requests.put_nowait, (list(folder_ids), priority, limit)
+            )
+
+    async def _boost(self) -> None:
+        from app.services.init_service import scan_state
+
+        session = self.service.Session()
+        try:
+            while True:
+                folder_ids, priority, limit = await self._boost_requests.get()
+                if self._stopping():
+                    continue
+                self._written_meanwhile = set()
+                try:
+                    candidates = await asyncio.to_thread(
+                        self._boost_candidates, session, folder_ids, limit
+                    )
+                except Exception as e:
+                    logger.warning(f"扫描插队失败 folder_ids={folder_ids}: {str(e)}")
+                    continue
+                finally:
+                    written_meanwhile, self._written_meanwhile = self._written_meanwhile, None
+
+                boosted = 0
+                for info, folder_path in candidates:
+                    full_path = info.full_path
+                    if (full_path in self._taken or full_path in self._failed
+                            or full_path in written_meanwhile):
+                        continue
+                    queued = self._queued.get(full_path)
+                    if queued is None:
+                        if full_path in self._boosted or self._walked:
+                            # 已插队处理过；或遍历结束后才出现的文件，留给文件夹补偿验证
+                            continue
+                        self._boosted.add(full_path)
+                        scan_state.add_total(1)
+                    elif queued <= priority:
+                        # 反复打开同一文件夹时不重复放入
+                        continue
+                    self._queued[full_path] = priority
+                    self._put_decode(priority, (info, folder_path))
+                    boosted += 1
+                if boosted:
+                    SCAN_BOOSTED_FILES_TOTAL.labels(_PRIORITY_LABELS[priority]).inc(boosted)
+                    logger.debug(f"扫描插队 {boosted} 个文件 folder_ids={folder_ids}")
+        finally:
+            session.close()
+
+    def _boost_candidates(
+        self, session: Session, folder_ids: List[int], limit: Optional[int]
+    ) -> List[Tuple[FileInfo, str]]:
+        """在线程中列出各文件夹本层尚未入库的文件，返回 (文件信息, 文件夹绝对路径)"""
+        folders = (
+            session.query(Folder.id, Folder.folder_path)
+            .filter(Folder.id.in_(folder_ids))
+            .all()
+        )
+        session.rollback()
+
+        candidates = []
+        service = self.service
+        for _, folder_path in folders:
+            root = os.path.abspath(os.path.join(settings.IMAGES_DIR, folder_path))
+            if not self._in_scope(root):
+                continue
+            with service.folder_lock:
+                if root not in service.folders_map:
+                    continue
+            entry = next(FileService.walk(root, recursive=False), None)
+            if entry is None:
+                continue
+            files = entry[2][:limit] if limit else entry[2]
+            candidates.extend((info, root) for info in self._stat_batch(session, files))
+        return candidates
+
+    def _in_scope(self, root: str) -> bool:
+        """文件夹是否在本次扫描范围内（分片扫描只处理分到的子树）"""
+        if root == self._top:
+            return True
+        return self._recursive and root.startswith(self._top.rstrip(os.sep) + os.sep)
+
+    # ----------------------------------------------------------------
+    # write
+    # ----------------------------------------------------------------
+
+    async def _write(self) -> None:
+        session = self.service.Session()
+        pending: List[_Result] = []
+        remaining = self.workers
+        try:
+            while remaining:
+                result = await self.write_queue.get()
+                if result is _DONE:
+                    remaining -= 1
+                    continue
+                pending.append(result)
+                # 攒够一批，或上游暂时没有产出时提交，浏览中的用户尽快看到新文件
+                if len(pending) >= self.batch_size or self.write_queue.empty():
+                    self._flush(session, pending)
+                    pending = []
+        finally:
+            if pending:
+                self._flush(session, pending)
+            session.close()
+
+    def _flush(self, session: Session, results: List[_Result]) -> None:
+        from app.services.init_service import scan_state
+
+        touched = {result.folder_id for result in results if result.folder_id}
+        failed: List[_Result] = []
+        try:
+            self._add_all(session, results)
+            self.service._commit(session, touched)
+            written = [result for result in results if result.image is not None]
+        except Exception as e:
+            # 同一文件刚被文件夹验证等其他路径写入（IntegrityError），或个别行写不进去：
+            # 逐条重试，已存在的跳过，仍失败的记入 failed_images 交给重试服务
+            session.rollback()
+            if not isinstance(e, IntegrityError):
+                logger.warning(f"扫描结果批量写库失败，逐条重试 {len(results)} 个文件: {str(e)}")
+            written, failed = self._add_one_by_one(session, results)
+            try:
+                self.service._commit(session, touched)
+            except Exception as e:
+                logger.error(
+                    f"扫描结果写库失败，丢弃本批 {len(results)} 个文件: {str(e)}", exc_info=True
+                )
+                session.rollback()
+                written = []
+                failed = [result for result in results if result.image is not None]
+
+        # 已被其他路径写入的文件与以前一样计为成功
+        succeeded = sum(1 for result in results if result.image is not None) - len(failed)
+        for result in written:
+            if result.image.phash is not None:
+                hash_index.add(result.image.id, result.image.phash)
+        failed_paths = {result.file_info.full_path for result in failed}
+        for result in results:
+            self._taken.discard(result.file_info.full_path)
+            if self._written_meanwhile is not None:
+                self._written_meanwhile.add(result.file_info.full_path)
+            if result.image is None or result.file_info.full_path in failed_paths:
+                self._failed.add(result.file_info.full_path)
+        self.completed += succeeded
+        self.failed += len(results) - succeeded
+        SCAN_FILES_TOTAL.labels("success").inc(succeeded)
+        SCAN_FILES_TOTAL.labels("failed").inc(len(results) - succeeded)
+        scan_state.advance(len(results))
+
+    def _add_all(self, session: Session, results: List[_Result]) -> None:
+        for result in results:
+            if result.image is not None:
+                session.add(result.image)
+            else:
+                self.service._record_failed_image(
+                    session, result.file_info.rel_path, result.folder_path,
+                    result.error_msg, result.error,
+                )
+
+    def _add_one_by_one(
+        self, session: Session, results: List[_Result]
+    ) -> Tuple[List[_Result], List[_Result]]:
+        """每行一个 savepoint 逐条写入，返回 (写入的图片, 写库失败的图片)"""
+        written, failed = [], []
+        for result in results:
+            savepoint = session.begin_nested()
+            try:
+                self._add_all(session, [result])
+                session.flush()
+                savepoint.commit()
+                if result.image is not None:
+                    written.append(result)
+            except IntegrityError:
+                # 已被其他路径写入
+                savepoint.rollback()
+            except Exception as e:
+                savepoint.rollback()
+                logger.error(f"扫描结果写库失败 {result.file_info.rel_path}: {str(e)}")
+                if result.image is not None:
+                    failed.append(result)
+                    self._record_write_failure(session, result, e)
+        return written, failed
+
+    def _record_write_failure(self, session: Session, result: _Result, error: Exception) -> None:
+        savepoint = session.begin_nested()
+        try:
+            self.service._record_failed_image(
+                session, result.file_info.rel_path, result.folder_path,
+                f"写库失败: {str(error)}", error,
+            )
+            session.flush()
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            logger.error(f"记录失败文件失败 {result.file_info.rel_path}: {str(e)}")
+
+
+class ScanPriority:
+    """
+    扫描插队入口（进程内单例 scan_priority）。正在运行的流水线登记在这里，
+    路由在用户打开文件夹时调用 boost()；没有扫描在运行时什么也不做。
+    """
+
+    def __init__(self):
+        self._pipeline: Optional[ScanPipeline] = None
+
+    def attach(self, pipeline: ScanPipeline) -> None:
+        self._pipeline = pipeline
+
+    def detach(self, pipeline: ScanPipeline) -> None:
+        if self._pipeline is pipeline:
+            self._pipeline = None
+
+    def boost(self, folder_id: Optional[int], child_ids: Sequence[int] = ()) -> bool:
+        """
+        打开的文件夹 folder_id 的全部待处理文件，以及可见子文件夹 child_ids
+        各自首页（前 PAGE_SIZE 个）的文件插队；返回是否已交给正在运行的扫描处理。
+        """
+        pipeline = self._pipeline
+        if pipeline is None or not settings.SCAN_PRIORITY_ENABLED:
+            return False
+        if folder_id:
+            pipeline.boost([folder_id], _PRIORITY_OPENED, None)
+        pipeline.boost(child_ids, _PRIORITY_CHILDREN, settings.PAGE_SIZE)
+        return True
+
+
+scan_priority = ScanPriority()
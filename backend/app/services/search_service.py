@@ -0,0 +1,105 @@
+"""
+SearchService：文件名 / 文件夹路径 / 相机型号检索。
+
+索引见 app/database/search_index.py。查询按空白拆成多个词，所有词都须命中
+（子串匹配、不区分大小写）。结果按 Image.id 升序，用 after=<上一页最后一个 id>
+做 keyset 分页：翻到多深都只扫描一页的数据，不受 OFFSET 影响。
+
+SQLite trigram 分词只能索引 3 个字符及以上的词；更短的词（如两个汉字的文件夹名）
+在 FTS 表上用 LIKE 过滤，由其他长词缩小范围，全部是短词时退化为扫描 FTS 表。
+"""
+from typing import List, Optional, Tuple
+
+from app.database.models import Image
+from app.database.search_index import FTS_TABLE, PG_SEARCH_EXPRESSION, sqlite_fts_available
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# trigram 分词可索引的最短词长
+_TRIGRAM_MIN_LENGTH = 3
+
+# SQLite 是否建立了 FTS 表（进程内只检查一次）
+_fts_available: Optional[bool] = None
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SearchService:
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def search(self, query: str, after: int, limit: int) -> Tuple[List[Image], Optional[int]]:
+        """返回 (按 id 升序的图片, 下一页游标)；没有更多结果时游标为 None"""
+        terms = query.split()
+        if not terms:
+            return [], None
+
+        dialect = self.db.bind.dialect.name
+        if dialect == "postgresql":
+            ids = self._search_pg(terms, after, limit + 1)
+        elif self._fts_available():
+            ids = self._search_fts(terms, after, limit + 1)
+        else:
+            ids = self._search_like(terms, after, limit + 1)
+
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        images = {
+            image.id: image
+            for image in self.db.query(Image).filter(Image.id.in_(ids))
+        } if ids else {}
+        results = [images[image_id] for image_id in ids if image_id in images]
+        return results, (ids[-1] if has_more else None)
+
+    # ----------------------------------------------------------------
+    # 各后端实现：只查 id，图片对象统一在 search() 中加载
+    # ----------------------------------------------------------------
+
+    def _fts_available(self) -> bool:
+        global _fts_available
+        if _fts_available is None:
+            _fts_available = sqlite_fts_available(self.db.connection())
+        return _fts_available
+
+    def _search_fts(self, terms: List[str], after: int, limit: int) -> List[int]:
+        params = {"after": after, "limit": limit}
+        conditions = ["rowid > :after"]
+
+        phrases = [t for t in terms if len(t) >= _TRIGRAM_MIN_LENGTH]
+        if phrases:
+            # 每个词作为短语加引号，避免被解析为 FTS5 查询语法
+            params["match"] = " AND ".join('"' + t.replace('"', '""') + '"' for t in phrases)
+            conditions.append(f"{FTS_TABLE} MATCH :match")
+        for i, term in enumerate(t for t in terms if len(t) < _TRIGRAM_MIN_LENGTH):
+            params[f"like{i}"] = _like_pattern(term)
+            conditions.append(f"body LIKE :like{i} ESCAPE '\\'")
+
+        rows = self.db.execute(text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {' AND '.join(conditions)} "
+            "ORDER BY rowid LIMIT :limit"
+        ), params)
+        return [row[0] for row in rows]
+
+    def _search_pg(self, terms: List[str], after: int, limit: int) -> List[int]:
+        params = {"after": after, "limit": limit}
+        conditions = ["id > :after"]
+        for i, term in enumerate(terms):
+            params[f"like{i}"] = _like_pattern(term.lower())
+            conditions.append(f"{PG_SEARCH_EXPRESSION} LIKE :like{i} ESCAPE '\\'")
+
+        rows = self.db.execute(text(
+            f"SELECT id FROM images WHERE {' AND '.join(conditions)} "
+            "ORDER BY id LIMIT :limit"
+        ), params)
+        return [row[0] for row in rows]
+
+    def _search_like(self, terms: List[str], after: int, limit: int) -> List[int]:
+        """无检索索引时的兜底：只匹配文件路径"""
+        query = self.db.query(Image.id).filter(Image.id > after)
+        for term in terms:
+            query = query.filter(Image.file_path.ilike(_like_pattern(term), escape="\\"))
+        return [row[0] for row in query.order_by(Image.id).limit(limit)]
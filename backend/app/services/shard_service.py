@@ -0,0 +1,307 @@
+"""
+ShardService：多节点分片扫描。
+
+设计说明：
+  首次导入超大图库时，单机 CPU 跟不上 HEIC 解码。多个索引进程（可以在不同机器上，
+  共享同一个 PostgreSQL 与 CACHE_DIR）通过租约表 scan_shards 分工：
+
+  plan   由一个节点执行一次：建好全部文件夹记录，按 SHARD_DEPTH 切分分片。
+         深度等于 SHARD_DEPTH 的文件夹各成一个子树分片（recursive），
+         更浅的文件夹（含根目录）各成一个只处理本层文件的分片。分片之间互不重叠。
+  claim  条件 UPDATE 领取一个 pending 或租约已过期的分片：
+         WHERE 条件中重新检查状态，并发领取时数据库保证只有一个节点更新成功。
+  heartbeat
+         处理期间后台线程每 SHARD_HEARTBEAT_SECONDS 续约；续约失败说明租约已过期
+         并被其他节点接管，立即中止本分片（已提交的结果保留，入库是幂等的）。
+  reclaim
+         节点崩溃后租约不再续期，过期后其他节点即可领取。同一分片领取次数超过
+         SHARD_MAX_ATTEMPTS 时标记为 failed，避免一个会拖垮进程的分片反复被领取。
+         处理出错（数据库、NAS 暂时不可用）的分片同样放回 pending，次数用完才标记为 failed。
+
+  租约时间使用各节点的本地 UTC 时间，节点之间需要时钟同步（NTP），
+  时钟偏差应远小于 SHARD_LEASE_SECONDS。
+"""
+import asyncio
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.database.database import SessionLocal
+from app.database.models import Folder, ScanShard
+from app.services.init_service import InitializationService, scan_state
+from app.utils.logger import logger
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# 一次领取时尝试的候选分片数（前面的候选被其他节点抢先时依次尝试下一个）
+_CLAIM_CANDIDATES = 8
+# 暂无可领取分片时的轮询间隔（秒）
+_IDLE_POLL_SECONDS = 5
+
+
+def default_node_id() -> str:
+    return settings.SCAN_NODE_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable(now: datetime):
+    return or_(
+        ScanShard.status == PENDING,
+        and_(ScanShard.status == LEASED, ScanShard.lease_expires_at < now),
+    )
+
+
+class ShardService:
+
+    def __init__(self, db: Session, node_id: Optional[str] = None):
+        self.db = db
+        self.node_id = node_id or default_node_id()
+
+    # ----------------------------------------------------------------
+    # 规划
+    # ----------------------------------------------------------------
+
+    async def plan(self, depth: int, reset: bool = False) -> int:
+        """建立全部文件夹记录并切分分片（已存在的分片保持原状态），返回新增的分片数"""
+        if reset:
+            self.db.query(ScanShard).delete()
+            self.db.commit()
+
+        if not await InitializationService(self.db).process_folders():
+            raise RuntimeError("文件夹处理失败")
+
+        existing = {path for (path,) in self.db.query(ScanShard.folder_path)}
+        created = 0
+        for (folder_path,) in self.db.query(Folder.folder_path).order_by(Folder.folder_path):
+            level = 0 if folder_path == "." else len(folder_path.split(os.sep))
+            if level > depth or folder_path in existing:
+                continue
+            self.db.add(ScanShard(folder_path=folder_path, recursive=level == depth))
+            created += 1
+        self.db.commit()
+        logger.info(f"分片规划完成: 新增 {created} 个分片（深度 {depth}）")
+        return created
+
+    # ----------------------------------------------------------------
+    # 租约
+    # ----------------------------------------------------------------
+
+    def claim(self) -> Optional[ScanShard]:
+        """领取一个待处理或租约已过期的分片，没有可领取的分片时返回 None"""
+        now = datetime.utcnow()
+        # 反复被领取仍未完成的分片不再发放
+        exhausted = (
+            self.db.query(ScanShard)
+            .filter(_claimable(now), ScanShard.attempts >= settings.SHARD_MAX_ATTEMPTS)
+            .update({
+                ScanShard.status: FAILED,
+                ScanShard.finished_at: now,
+                ScanShard.error_message: f"超过最大领取次数 {settings.SHARD_MAX_ATTEMPTS}",
+            }, synchronize_session=False)
+        )
+        self.db.commit()
+        if exhausted:
+            logger.warning(f"{exhausted} 个分片超过最大领取次数，已标记为失败")
+
+        candidates = (
+            self.db.query(ScanShard.id)
+            .filter(_claimable(now))
+            .order_by(ScanShard.id)
+            .limit(_CLAIM_CANDIDATES)
+            .all()
+        )
+        for (shard_id,) in candidates:
+            claimed = (
+                self.db.query(ScanShard)
+                .filter(ScanShard.id == shard_id, _claimable(now))
+                .update({
+                    ScanShard.status: LEASED,
+                    ScanShard.owner: self.node_id,
+                    ScanShard.lease_expires_at: now + timedelta(seconds=settings.SHARD_LEASE_SECONDS),
+                    ScanShard.heartbeat_at: now,
+                    ScanShard.attempts: ScanShard.attempts + 1,
+                    ScanShard.started_at: now,
+                    ScanShard.error_message: None,
+                }, synchronize_session=False)
+            )
+            self.db.commit()
+            if claimed:
+                return self.db.query(ScanShard).filter(ScanShard.id == shard_id).first()
+        return None
+
+    def heartbeat(self, shard_id: int) -> bool:
+        """续约（在心跳线程中调用，使用独立 Session）；租约已被接管时返回 False"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            renewed = (
+                db.query(ScanShard)
+                .filter(ScanShard.id == shard_id, ScanShard.owner == self.node_id,
+                        ScanShard.status == LEASED)
+                .update({
+                    ScanShard.lease_expires_at: now + timedelta(seconds=settings.SHARD_LEASE_SECONDS),
+                    ScanShard.heartbeat_at: now,
+                }, synchronize_session=False)
+            )
+            db.commit()
+            return bool(renewed)
+        except Exception as e:
+            db.rollback()
+            # 数据库暂时不可用：视为续约成功，租约到期前还有重试机会
+            logger.warning(f"分片续约失败 shard={shard_id}: {str(e)}")
+            return True
+        finally:
+            db.close()
+
+    def complete(self, shard_id: int, files_done: int, files_failed: int,
+                 error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        self.db.query(ScanShard).filter(
+            ScanShard.id == shard_id, ScanShard.owner == self.node_id
+        ).update({
+            ScanShard.status: FAILED if error else DONE,
+            ScanShard.lease_expires_at: None,
+            ScanShard.files_done: files_done,
+            ScanShard.files_failed: files_failed,
+            ScanShard.error_message: error,
+            ScanShard.finished_at: now,
+        }, synchronize_session=False)
+        self.db.commit()
+
+    def release(self, shard_id: int, error: Optional[str] = None) -> None:
+        """
+        主动放弃租约（节点正常停止、或处理出错但还有领取次数时），分片立即可被其他节点领取。
+        error 记录本次出错的原因，下次领取时清除。
+        """
+        self.db.query(ScanShard).filter(
+            ScanShard.id == shard_id, ScanShard.owner == self.node_id
+        ).update({
+            ScanShard.status: PENDING,
+            ScanShard.owner: None,
+            ScanShard.lease_expires_at: None,
+            ScanShard.error_message: error,
+        }, synchronize_session=False)
+        self.db.commit()
+
+    def has_unfinished(self) -> bool:
+        return self.db.query(ScanShard.id).filter(
+            ScanShard.status.in_((PENDING, LEASED))
+        ).first() is not None
+
+    def status(self) -> Dict:
+        counts = dict(
+            self.db.query(ScanShard.status, func.count(ScanShard.id)).group_by(ScanShard.status)
+        )
+        leased = [
+            {
+                "folder_path": shard.folder_path,
+                "owner": shard.owner,
+                "heartbeat_at": shard.heartbeat_at,
+                "lease_expires_at": shard.lease_expires_at,
+                "attempts": shard.attempts,
+            }
+            for shard in self.db.query(ScanShard).filter(ScanShard.status == LEASED)
+            .order_by(ScanShard.id)
+        ]
+        failed = [
+            {"folder_path": path, "error": error}
+            for path, error in self.db.query(ScanShard.folder_path, ScanShard.error_message)
+            .filter(ScanShard.status == FAILED).order_by(ScanShard.id)
+        ]
+        files = self.db.query(
+            func.coalesce(func.sum(ScanShard.files_done), 0),
+            func.coalesce(func.sum(ScanShard.files_failed), 0),
+        ).one()
+        return {
+            "counts": {s: counts.get(s, 0) for s in (PENDING, LEASED, DONE, FAILED)},
+            "files_done": int(files[0]),
+            "files_failed": int(files[1]),
+            "leased": leased,
+            "failed": failed,
+        }
+
+    # ----------------------------------------------------------------
+    # 工作循环
+    # ----------------------------------------------------------------
+
+    async def run(self, workers: int) -> Tuple[int, int]:
+        """
+        循环领取并处理分片，直到全部完成（或收到停止请求）。
+        暂时没有可领取的分片、但还有其他节点持有的租约时继续等待：
+        那些节点若崩溃，租约过期后由本节点接管。返回本节点处理的 (分片数, 文件数)。
+        """
+        shards = files = 0
+        while not scan_state.stop_requested:
+            shard = self.claim()
+            if shard is None:
+                if not self.has_unfinished():
+                    break
+                await asyncio.sleep(_IDLE_POLL_SECONDS)
+                continue
+
+            done = await self._process(shard, workers)
+            if done is not None:
+                shards += 1
+                files += done
+        return shards, files
+
+    async def _process(self, shard: ScanShard, workers: int) -> Optional[int]:
+        """处理一个分片，成功完成时返回处理的文件数"""
+        shard_id, folder_path, attempts = shard.id, shard.folder_path, shard.attempts
+        logger.info(f"领取分片 {folder_path}（第 {attempts} 次）")
+        service = InitializationService(self.db)
+        stopped = threading.Event()
+
+        def beat() -> None:
+            while not stopped.wait(settings.SHARD_HEARTBEAT_SECONDS):
+                if not self.heartbeat(shard_id):
+                    logger.warning(f"分片 {folder_path} 的租约已被其他节点接管，中止处理")
+                    service.abort.set()
+                    return
+
+        heartbeat = threading.Thread(target=beat, name=f"shard-heartbeat-{shard_id}", daemon=True)
+        heartbeat.start()
+        try:
+            done, failed = await service.process_shard(folder_path, shard.recursive, workers)
+        except Exception as e:
+            logger.error(f"分片 {folder_path} 处理失败: {str(e)}", exc_info=True)
+            self._fail(shard_id, folder_path, attempts, str(e))
+            return None
+        finally:
+            stopped.set()
+            heartbeat.join()
+
+        if service.abort.is_set():
+            return None
+        if scan_state.stop_requested:
+            self.release(shard_id)
+            return None
+        self.complete(shard_id, done, failed)
+        logger.info(f"分片 {folder_path} 完成: 成功 {done}, 失败 {failed}")
+        return done + failed
+
+    def _fail(self, shard_id: int, folder_path: str, attempts: int, error: str) -> None:
+        """
+        处理出错：数据库、NAS 暂时不可用等错误可能下次就好，领取次数未用完时放回 pending
+        重试，用完才标记为 failed。放回失败（数据库仍不可用）时等租约过期后被重新领取。
+        """
+        try:
+            self.db.rollback()
+            if attempts < settings.SHARD_MAX_ATTEMPTS:
+                logger.warning(
+                    f"分片 {folder_path} 放回待处理，稍后重试"
+                    f"（已领取 {attempts}/{settings.SHARD_MAX_ATTEMPTS} 次）"
+                )
+                self.release(shard_id, error=error)
+            else:
+                self.complete(shard_id, 0, 0, error=error)
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"分片 {folder_path} 状态更新失败，等待租约过期: {str(e)}")
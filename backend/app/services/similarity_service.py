@@ -0,0 +1,105 @@
+"""
+SimilarityService：基于感知哈希的相似图片检索与重复分组。
+
+设计说明：
+  扫描生成缩略图时顺带计算 dHash 存入 Image.phash（见 app/utils/phash.py），
+  hash_index 是进程内的 NumPy 指纹索引：首次查询时从数据库加载，
+  之后新入库的图片由 ImageService 追加；全盘扫描会重建 ID，开始时整体失效。
+
+  索引里可能残留已删除或已回滚的 ID，返回结果前统一按数据库过滤，
+  因此不需要在每个删除路径上同步维护索引。
+"""
+import asyncio
+from typing import Dict, Iterator, List, Tuple
+
+from app.database.database import SessionLocal
+from app.database.models import Image
+from app.utils.phash import HashIndex
+from app.utils.singleflight import SingleFlight
+from sqlalchemy.orm import Session
+
+# 从数据库加载指纹时每批读取的行数
+_LOAD_BATCH_SIZE = 10000
+
+
+def _load_hashes() -> Iterator[Tuple[int, int]]:
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(Image.id, Image.phash)
+            .filter(Image.phash.isnot(None))
+            .yield_per(_LOAD_BATCH_SIZE)
+        )
+        for image_id, phash in query:
+            yield image_id, phash
+    finally:
+        db.close()
+
+
+hash_index = HashIndex(_load_hashes)
+
+# 重复分组结果缓存：{max_distance: (索引版本, 分组)}
+_group_cache: Dict[int, Tuple[int, List[List[int]]]] = {}
+# 同一 (max_distance, 索引版本) 的并发请求共用一次计算
+_group_flights = SingleFlight()
+
+
+class SimilarityService:
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def find_similar(
+        self, image: Image, max_distance: int, limit: int
+    ) -> List[Tuple[Image, int]]:
+        """与指定图片汉明距离 <= max_distance 的图片，按距离升序"""
+        if image.phash is None:
+            return []
+        matches = hash_index.search(image.phash, max_distance, exclude_id=image.id)[: limit * 2]
+        images = self._fetch([image_id for image_id, _ in matches])
+        results = [
+            (images[image_id], distance)
+            for image_id, distance in matches
+            if image_id in images
+        ]
+        return results[:limit]
+
+    async def duplicate_groups(self, max_distance: int) -> List[List[int]]:
+        """
+        重复分组（每组为 image_id 列表），按组大小降序。
+        百万级指纹需要数秒：在线程中计算，结果按索引版本缓存，翻页和重复请求不重新计算；
+        计算期间到达的相同请求等待同一次计算。
+        """
+        version = hash_index.version
+        cached = _group_cache.get(max_distance)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return await _group_flights.do(
+            (max_distance, version),
+            lambda: asyncio.to_thread(self._compute_groups, max_distance, version),
+        )
+
+    @staticmethod
+    def _compute_groups(max_distance: int, version: int) -> List[List[int]]:
+        groups = hash_index.duplicate_groups(max_distance)
+        groups.sort(key=lambda g: (-len(g), g[0]))
+        _group_cache[max_distance] = (version, groups)
+        return groups
+
+    def load_groups(self, groups: List[List[int]]) -> List[List[Image]]:
+        """把一页分组的 ID 换成 Image 对象，过滤掉已不存在的图片"""
+        images = self._fetch([image_id for group in groups for image_id in group])
+        loaded = []
+        for group in groups:
+            members = [images[image_id] for image_id in group if image_id in images]
+            if len(members) > 1:
+                loaded.append(members)
+        return loaded
+
+    def _fetch(self, ids: List[int]) -> dict:
+        if not ids:
+            return {}
+        return {
+            image.id: image
+            for image in self.db.query(Image).filter(Image.id.in_(ids))
+        }
@@ -0,0 +1,154 @@
+"""
+SpriteService：按分页拼接缩略图雪碧图。
+
+设计说明：
+  文件夹每页 PAGE_SIZE 张图，浏览器要发 20 多个缩略图请求，移动网络下
+  请求往返主导了首屏时间。这里把一页的缩略图居中裁剪成正方形格子
+  （与前端 aspect-square + object-cover 的显示效果一致），拼成一张 JPEG，
+  列表接口返回每张图在雪碧图中的坐标，前端一次请求即可画满整页。
+
+  布局只取决于页内顺序，坐标无需打开任何文件即可算出：
+    第 i 张 → x = (i % SPRITE_COLUMNS) * cell, y = (i // SPRITE_COLUMNS) * cell
+  缩略图已被缓存淘汰的格子留空，对应条目不返回坐标，前端回退到单张请求。
+
+缓存与失效：
+  缓存键 = (folder_id, page, cell, 页内容摘要)。摘要由页内 (id, thumbnail_path)
+  计算，文件夹内容变化（新增/删除/缩略图重新生成）导致页内容变化时摘要随之改变，
+  旧版本在生成新版本时删除，残留文件由 DiskCache 配额淘汰。
+"""
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database.models import Image
+from app.services.cache_service import open_thumbnail, sprite_cache, thumbnail_cache
+from app.utils.image_utils import run_in_media_pool
+from app.utils.logger import logger
+from app.utils.singleflight import SingleFlight
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+_builds = SingleFlight()
+# (folder_id, page, cell) → 当前版本的缓存键，生成新版本时删除旧文件
+_current_keys: Dict[Tuple[int, int, int], str] = {}
+
+# 空格子的底色（与前端加载占位色接近）
+_BACKGROUND = (229, 231, 235)
+
+
+class SpriteService:
+
+    def __init__(self, cell: Optional[int] = None):
+        self.cell = cell or settings.SPRITE_CELL_SIZE_LIST[-1]
+        self.columns = settings.SPRITE_COLUMNS
+
+    @staticmethod
+    def has_thumbnail(image: Image) -> bool:
+        return bool(image.thumbnail_path) and image.thumbnail_path in thumbnail_cache
+
+    def layout(self, folder_id: int, page: int, images: List[Image]) -> Optional[dict]:
+        """
+        计算一页的雪碧图信息：{"sheet": {...}, "positions": {image_id: {"x", "y"}}}；
+        页内没有可用缩略图时返回 None。
+        """
+        positions = {}
+        for index, image in enumerate(images):
+            if self.has_thumbnail(image):
+                positions[image.id] = {
+                    "x": (index % self.columns) * self.cell,
+                    "y": (index // self.columns) * self.cell,
+                }
+        if not positions:
+            return None
+
+        width, height = self._sheet_size(len(images))
+        version = self._digest(images)
+        return {
+            "sheet": {
+                "url": (
+                    f"/api/folders/{folder_id}/images/sprite"
+                    f"?page={page}&cell={self.cell}&v={version}"
+                ),
+                "cell": self.cell,
+                "columns": self.columns,
+                "width": width,
+                "height": height,
+            },
+            "positions": positions,
+        }
+
+    async def get_sprite_path(self, folder_id: int, page: int, images: List[Image]) -> str:
+        """返回雪碧图文件路径，缓存未命中时生成（同一版本只生成一次）"""
+        version = self._digest(images)
+        key = os.path.join(str(folder_id), f"p{page}_c{self.cell}_{version}.jpg")
+
+        cached = sprite_cache.get(key)
+        if cached:
+            return cached
+
+        # 只把可序列化的数据传入线程池，不跨线程使用 ORM 对象
+        tiles = [
+            (index, image.thumbnail_path)
+            for index, image in enumerate(images)
+            if self.has_thumbnail(image)
+        ]
+        size = self._sheet_size(len(images))
+        return await _builds.do(
+            key, lambda: self._build(key, (folder_id, page, self.cell), tiles, size)
+        )
+
+    async def _build(
+        self,
+        key: str,
+        slot: Tuple[int, int, int],
+        tiles: List[Tuple[int, str]],
+        size: Tuple[int, int],
+    ) -> str:
+        target = sprite_cache.path_for(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        await run_in_media_pool(self._render, tiles, size, target)
+        sprite_cache.put(key)
+
+        previous = _current_keys.get(slot)
+        _current_keys[slot] = key
+        if previous and previous != key:
+            sprite_cache.discard(previous)
+        return target
+
+    def _render(self, tiles: List[Tuple[int, str]], size: Tuple[int, int], target: str) -> None:
+        sheet = PILImage.new("RGB", size, _BACKGROUND)
+        for index, thumb_key in tiles:
+            try:
+                thumb_file = open_thumbnail(thumb_key)
+                if thumb_file is None:
+                    raise FileNotFoundError(thumb_key)
+                with thumb_file, PILImage.open(thumb_file) as thumb:
+                    tile = ImageOps.fit(thumb.convert("RGB"), (self.cell, self.cell))
+            except Exception as e:
+                logger.warning(f"雪碧图跳过缩略图 {thumb_key}: {str(e)}")
+                continue
+            sheet.paste(
+                tile,
+                ((index % self.columns) * self.cell, (index // self.columns) * self.cell),
+            )
+
+        tmp_target = f"{target}.tmp"
+        sheet.save(tmp_target, "JPEG", quality=settings.SPRITE_QUALITY, optimize=True)
+        os.replace(tmp_target, target)
+
+    def _sheet_size(self, count: int) -> Tuple[int, int]:
+        columns = min(self.columns, max(count, 1))
+        rows = (count + self.columns - 1) // self.columns
+        return columns * self.cell, max(rows, 1) * self.cell
+
+    def version(self, images: List[Image]) -> str:
+        """一页雪碧图的当前版本（雪碧图 URL 中的 v）"""
+        return self._digest(images)
+
+    def _digest(self, images: List[Image]) -> str:
+        content = "|".join(
+            f"{image.id}:{image.thumbnail_path if self.has_thumbnail(image) else ''}"
+            for image in images
+        )
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,49 @@
+"""
+跨进程变更标记。
+
+列表页缓存、相似度索引等都是进程内状态，写入方在同一进程内提交后直接使其失效；
+离线 CLI（python -m app.cli）在另一个进程中写库，Web 服务无从得知。
+这里用一个标记文件的 mtime 传递"数据已变更"：CLI 写库期间定期 touch()，
+Web 进程在读取进程内缓存前调用 poll()，发现 mtime 变化即整体失效。
+poll() 按 check_interval 节流，一秒最多 stat 一次，读路径几乎没有额外开销。
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+
+class ChangeStamp:
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = str(path)
+        self.check_interval = check_interval
+        self._last_check = 0.0
+        self._last_mtime: Optional[int] = self._mtime()
+        self._lock = threading.Lock()
+
+    def touch(self) -> None:
+        """标记数据已变更（写入方调用）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a"):
+            pass
+        os.utime(self.path)
+
+    def poll(self) -> bool:
+        """自上次检查以来标记是否被其他进程更新过"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+            mtime = self._mtime()
+            if mtime == self._last_mtime:
+                return False
+            self._last_mtime = mtime
+            return True
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
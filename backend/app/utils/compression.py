@@ -0,0 +1,96 @@
+"""
+JSON 响应压缩中间件。
+
+只压缩 application/json 响应：缩略图、原图、视频本身已经是压缩格式，
+再压一遍只浪费 CPU（Starlette 自带的 GZipMiddleware 不区分类型）。
+列表接口的 JSON 一次性生成，这里整体缓冲后按客户端 Accept-Encoding 选择
+brotli（可选依赖，未安装时跳过）或 gzip；小于 COMPRESSION_MIN_BYTES 的响应原样返回。
+"""
+import gzip
+import time
+
+from app.config import settings
+from app.utils.profiling import record_timing
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：pip install brotli
+    brotli = None
+
+
+def _accepted_encodings(scope) -> set:
+    for name, value in scope.get("headers", []):
+        if name == b"accept-encoding":
+            return {
+                token.split(";")[0].strip()
+                for token in value.decode("latin-1").lower().split(",")
+            }
+    return set()
+
+
+def _compress(body: bytes, encodings: set):
+    """返回 (编码名, 压缩后内容)；客户端不支持任何编码时返回 (None, body)"""
+    if brotli is not None and "br" in encodings:
+        return "br", brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if "gzip" in encodings:
+        return "gzip", gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+    return None, body
+
+
+class CompressionMiddleware:
+    """纯 ASGI 中间件：按大小阈值压缩 JSON 响应"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        encodings = _accepted_encodings(scope)
+        if not encodings & {"br", "gzip"}:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                if content_type.startswith(b"application/json") and b"content-encoding" not in headers:
+                    # 先缓冲，拿到完整响应体后再决定是否压缩
+                    start_message = message
+                    return
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = [
+                (name, value) for name, value in start_message.get("headers", [])
+                if name != b"content-length"
+            ]
+            if len(body) >= settings.COMPRESSION_MIN_BYTES:
+                started = time.perf_counter()
+                encoding, body = _compress(body, encodings)
+                record_timing("compress", time.perf_counter() - started)
+                if encoding:
+                    headers.append((b"content-encoding", encoding.encode()))
+                    headers.append((b"vary", b"Accept-Encoding"))
+            headers.append((b"content-length", str(len(body)).encode()))
+
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
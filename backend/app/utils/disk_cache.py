@@ -0,0 +1,393 @@
+"""
+按字节配额管理的磁盘缓存索引。
+
+缓存文件本身由调用方写入 root 目录，这里只维护索引：
+  key（相对 root 的路径）→ 文件大小、命中次数、最近访问时间。
+写入新文件后调用 put() 登记，总大小超过 max_bytes 时淘汰文件，
+直到降到 max_bytes * LOW_WATERMARK 以下（批量淘汰，避免每次写入都触发）：
+  lru  淘汰最久未访问的文件
+  lfu  淘汰命中次数最少的文件（次数相同时淘汰较久未访问的）
+
+索引常驻内存（OrderedDict，访问时移到末尾），原子写回 index_path（默认放在
+root 的上级目录，避免被静态文件路由暴露），最多每 SAVE_INTERVAL 秒写一次，
+save(force=True) 立即写回；重启时直接加载，索引文件缺失或损坏时扫描目录重建
+（按 mtime 近似访问顺序）。读路径只更新内存，不产生磁盘 IO。
+
+写回时只在锁内取条目快照，序列化与写文件在锁外进行，百万级条目的索引写回
+不会阻塞查询。Web 进程与离线 CLI 共用同一个索引文件：写回前发现文件被其他进程
+改写过时先合并，补登记对方新增的条目（本进程删除过的除外），不会互相覆盖；
+对方删除的条目在下次访问发现文件不存在时移除。
+on_evict 在文件被淘汰或删除后回调，参数为 key，供调用方清理数据库中的引用。
+"""
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from app.utils.logger import logger
+from app.utils.metrics import DISK_CACHE_REQUESTS_TOTAL
+
+INDEX_FILE_NAME = ".index.json"
+# 超出配额时淘汰到配额的该比例以下
+LOW_WATERMARK = 0.9
+# 索引写回的最小间隔（秒）
+SAVE_INTERVAL = 30
+
+LRU = "lru"
+LFU = "lfu"
+
+
+@dataclass
+class CacheEntry:
+    size: int
+    hits: int = 0
+    last_access: float = 0.0
+
+
+class DiskCache:
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        max_bytes: int,
+        policy: str = LRU,
+        on_evict: Optional[Callable[[str], None]] = None,
+        index_path: Optional[str] = None,
+    ):
+        if policy not in (LRU, LFU):
+            raise ValueError(f"不支持的淘汰策略: {policy}")
+        self.name = name
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_evict = on_evict
+        self.index_path = index_path or os.path.join(
+            os.path.dirname(os.path.abspath(self.root)), f".{name}{INDEX_FILE_NAME}"
+        )
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._last_save = 0.0
+        # 上次加载 / 写回后索引文件的 mtime，不一致说明被其他进程改写过
+        self._index_mtime: Optional[int] = None
+        # 上次写回以来本进程删除的 key，合并其他进程的索引时不再补回
+        self._removed: Set[str] = set()
+        self._save_lock = threading.Lock()
+
+    # ----------------------------------------------------------------
+    # 公共接口
+    # ----------------------------------------------------------------
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def preload(self) -> None:
+        """
+        立即加载索引。索引缺失时要遍历整个缓存目录，期间持有锁；
+        服务启动时在线程中调用，避免第一个请求在事件循环上等待。
+        """
+        with self._lock:
+            self._ensure_loaded()
+        self.save(force=True)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        命中返回文件绝对路径并刷新访问顺序；文件已不存在返回 None。
+        未登记但文件存在（由其他进程写入，例如离线 CLI）时补登记后返回。
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            path = self.path_for(key)
+            if entry is None and os.path.isfile(path):
+                self._register(key)
+                entry = self._entries.get(key)
+            if entry is None or not os.path.isfile(path):
+                if entry is not None:
+                    self._remove(key)
+                self.record_miss()
+                return None
+
+            self._touch(key, entry)
+            return path
+
+    def touch(self, key: str) -> bool:
+        """
+        记录一次命中（文件已由调用方确认存在，例如静态文件路由已成功响应），
+        不做文件系统检查；key 未登记时记为未命中并返回 False。
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.record_miss()
+                return False
+            self._touch(key, entry)
+            return True
+
+    def record_miss(self) -> None:
+        self.misses += 1
+        DISK_CACHE_REQUESTS_TOTAL.labels(self.name, "miss").inc()
+
+    def put(self, key: str) -> None:
+        """登记 root 下已写好的文件，必要时淘汰旧文件"""
+        with self._lock:
+            self._ensure_loaded()
+            self._register(key)
+        self.save()
+
+    def discard(self, key: str) -> None:
+        """删除指定缓存文件及其索引"""
+        with self._lock:
+            self._ensure_loaded()
+            if key not in self._entries:
+                return
+            self._remove(key)
+            self._delete_file(key)
+        self.save()
+
+    def clear(self) -> int:
+        """删除全部缓存文件，返回删除的文件数"""
+        with self._lock:
+            self._ensure_loaded()
+            keys = list(self._entries)
+            for key in keys:
+                self._remove(key)
+                self._delete_file(key)
+        self.save(force=True)
+        return len(keys)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return self._total_bytes
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._ensure_loaded()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def save(self, force: bool = False) -> None:
+        """
+        把索引原子写回磁盘（先写临时文件再 rename），未强制时按 SAVE_INTERVAL 节流。
+        锁内只取快照，合并、序列化与写文件都在锁外；同一时间只有一个线程写回，
+        未强制的写回遇到正在进行的写回时直接跳过。
+        """
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            with self._lock:
+                if not self._loaded or not self._dirty:
+                    return
+                if not force and time.monotonic() - self._last_save < SAVE_INTERVAL:
+                    return
+                # 先清除标记：写回期间的修改会重新标记，由下一次写回保存
+                self._dirty = False
+                self._last_save = time.monotonic()
+                removed, self._removed = self._removed, set()
+
+            self._merge_external(removed)
+            with self._lock:
+                # 只复制 (key, 条目) 引用；字段在锁外读取，与并发访问交错时最多记下稍旧的访问时间
+                items = list(self._entries.items())
+            data = {key: [entry.size, entry.hits, entry.last_access] for key, entry in items}
+
+            index_path = self.index_path
+            # 多个节点可能共享同一缓存目录（分片扫描），临时文件名需各不相同
+            tmp_path = f"{index_path}.{socket.gethostname()}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, index_path)
+                self._index_mtime = os.stat(index_path).st_mtime_ns
+            except OSError as e:
+                logger.error(f"保存缓存索引失败 [{self.name}]: {str(e)}")
+                with self._lock:
+                    self._dirty = True
+                    self._removed |= removed
+        finally:
+            self._save_lock.release()
+
+    # ----------------------------------------------------------------
+    # 内部实现
+    # ----------------------------------------------------------------
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self._index_mtime = os.fstat(f.fileno()).st_mtime_ns
+                data = json.load(f)
+            # JSON 对象保持写入顺序，即 LRU 顺序
+            for key, (size, hits, last_access) in data.items():
+                self._entries[key] = CacheEntry(size=size, hits=hits, last_access=last_access)
+                self._total_bytes += size
+        except FileNotFoundError:
+            self._rebuild()
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"缓存索引损坏，重新扫描目录 [{self.name}]: {str(e)}")
+            self._entries.clear()
+            self._total_bytes = 0
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        """扫描缓存目录重建索引，按 mtime 升序近似 LRU 顺序"""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for file_name in filenames:
+                # 旧版放在缓存目录内的索引文件、未完成的临时文件
+                if file_name.startswith(INDEX_FILE_NAME) or file_name.endswith(".tmp"):
+                    continue
+                full_path = os.path.join(dirpath, file_name)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, os.path.relpath(full_path, self.root), st.st_size))
+
+        for mtime, key, size in sorted(found):
+            self._entries[key] = CacheEntry(size=size, last_access=mtime)
+            self._total_bytes += size
+
+        if found:
+            self._dirty = True
+            logger.info(f"已重建缓存索引 [{self.name}]: {len(found)} 个文件，{self._total_bytes} 字节")
+            self._evict_over_quota()
+            # 持锁中不写回（写回要在锁外进行），清零节流时间让下一次 save() 立即写回
+            self._last_save = 0.0
+
+    def _merge_external(self, removed: Set[str]) -> None:
+        """索引文件被其他进程改写过时，补登记其中本进程没有、也没有删除过的条目（锁外调用）"""
+        try:
+            if os.stat(self.index_path).st_mtime_ns == self._index_mtime:
+                return
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取其他进程写入的缓存索引失败 [{self.name}]: {str(e)}")
+            return
+
+        # 先在锁外粗筛，锁内只复核候选条目
+        candidates = [key for key in data if key not in self._entries and key not in removed]
+        if not candidates:
+            return
+        with self._lock:
+            added = 0
+            for key in candidates:
+                if key in self._entries or key in self._removed:
+                    continue
+                try:
+                    size, hits, last_access = data[key]
+                except (TypeError, ValueError):
+                    continue
+                self._entries[key] = CacheEntry(size=size, hits=hits, last_access=last_access)
+                self._total_bytes += size
+                added += 1
+        if added:
+            logger.info(f"已合并其他进程登记的缓存条目 [{self.name}]: {added} 个")
+
+    def _register(self, key: str) -> None:
+        """登记文件并按配额淘汰（持锁调用）"""
+        try:
+            size = os.path.getsize(self.path_for(key))
+        except OSError:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old.size
+        self._entries[key] = CacheEntry(size=size, last_access=time.time())
+        self._total_bytes += size
+        self._removed.discard(key)
+        self._dirty = True
+
+        self._evict_over_quota(keep=key)
+
+    def _touch(self, key: str, entry: CacheEntry) -> None:
+        entry.hits += 1
+        entry.last_access = time.time()
+        self._entries.move_to_end(key)
+        self._dirty = True
+        self.hits += 1
+        DISK_CACHE_REQUESTS_TOTAL.labels(self.name, "hit").inc()
+
+    def _eviction_order(self) -> Iterator[str]:
+        if self.policy == LFU:
+            # 一次排序后批量淘汰；OrderedDict 顺序即访问先后，sorted 稳定保证同次数时先淘汰旧的
+            return iter(sorted(self._entries, key=lambda k: self._entries[k].hits))
+        return iter(list(self._entries))
+
+    def _evict_over_quota(self, keep: Optional[str] = None) -> None:
+        if self.max_bytes <= 0 or self._total_bytes <= self.max_bytes:
+            return
+
+        target = self.max_bytes * LOW_WATERMARK
+        evicted = 0
+        for victim in self._eviction_order():
+            if self._total_bytes <= target:
+                break
+            # 刚写入的文件保留，只淘汰其余文件
+            if victim == keep:
+                continue
+            self._remove(victim)
+            self._delete_file(victim)
+            evicted += 1
+
+        self.evictions += evicted
+        if evicted:
+            logger.info(
+                f"缓存超出配额，已淘汰 {evicted} 个文件 [{self.name}]，当前 {self._total_bytes} 字节"
+            )
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+            self._removed.add(key)
+            self._dirty = True
+
+    def _delete_file(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除缓存文件失败 [{self.name}] {key}: {str(e)}")
+        if self.on_evict is not None:
+            try:
+                self.on_evict(key)
+            except Exception as e:
+                logger.error(f"缓存淘汰回调失败 [{self.name}] {key}: {str(e)}")
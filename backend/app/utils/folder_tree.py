@@ -0,0 +1,405 @@
+"""
+进程内文件夹树：子文件夹列表、面包屑与子树大小不查数据库。
+
+结构（CSR，压缩稀疏行）：
+  每个文件夹是一个节点（下标），各属性存在平行数组里：
+    _ids[i]          文件夹 ID
+    _parents[i]      父节点下标，-1 表示顶层
+    _names[i]        名称（sys.intern，同名只存一份）
+    _descendants[i]  子树中的文件夹数（不含自身）
+  子节点按父节点分组、组内按名称排序后连续存放在 _order 中，
+  节点 i 的子节点为 _order[_offsets[i + 1]:_offsets[i + 2]]，顶层节点为第 -1 组。
+  folder_path 不逐个保存，由祖先名称拼出；与数据库不一致的（例如根目录 "."）
+  记在 _path_overrides 中。10 万个文件夹约占几 MB。
+
+增量更新：
+  新增、删除、移动、改名只修改涉及的父节点：第一次修改时把该父节点的子节点区间
+  复制成有序列表放入 _patched，之后在列表上二分插入 / 删除；子树大小沿祖先链增减。
+  修改累计超过节点数的 1/4 时按当前内容重新生成紧凑的数组。
+
+查询（子节点分页、祖先链、子树大小）都是数组下标访问与切片，
+与文件夹总数无关。loader 返回 (id, parent_id, name, folder_path)，
+首次查询或 invalidate() 后调用。
+
+reload_in_background() 在后台线程中重新加载并生成新数组，完成后一次性替换，
+期间查询继续使用旧的树（用于其他进程改写了文件夹表时，不在事件循环上重建）。
+generation 在每次修改（包括未加载时被忽略的增量更新）后加一，
+供离线 CLI 判断本进程是否改写过文件夹。
+"""
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.utils.logger import logger
+
+FolderRow = Tuple[int, Optional[int], str, str]
+
+# reload 时替换的全部状态（即 _clear 中初始化的属性）
+_STATE = (
+    "_ids", "_parents", "_names", "_descendants", "_index", "_path_overrides",
+    "_order", "_offsets", "_patched", "_built", "_changes",
+)
+# 后台重新加载期间树又被修改时最多重试的次数，仍不一致则退回下次查询时同步加载
+_RELOAD_ATTEMPTS = 3
+
+# 增量修改累计超过 max(该值, 节点数 / 4) 时重新生成数组
+_MIN_REBUILD_CHANGES = 1024
+
+
+class FolderNode(NamedTuple):
+    id: int
+    name: str
+    folder_path: str
+    parent_id: Optional[int]
+    # 直接子文件夹数
+    subfolder_count: int
+    # 子树中的文件夹总数（不含自身）
+    descendant_count: int
+
+
+class FolderTree:
+
+    def __init__(self, loader: Callable[[], Iterable[FolderRow]]):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reloading = False
+        self._reload_again = False
+        self.generation = 0
+        self._clear()
+
+    def load(self) -> int:
+        """立即加载（服务启动时调用，避免第一个浏览请求等待），返回文件夹数"""
+        return len(self)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_ready()
+            return len(self._index)
+
+    # ----------------------------------------------------------------
+    # 查询
+    # ----------------------------------------------------------------
+
+    def get(self, folder_id: int) -> Optional[FolderNode]:
+        with self._lock:
+            self._ensure_ready()
+            node = self._index.get(folder_id)
+            return self._node(node) if node is not None else None
+
+    def children(
+        self, parent_id: Optional[int], offset: int = 0, limit: Optional[int] = None
+    ) -> Tuple[int, List[FolderNode]]:
+        """按名称排序的子文件夹 (总数, 本页)；parent_id 为 None 时返回顶层文件夹"""
+        with self._lock:
+            self._ensure_ready()
+            if parent_id is None:
+                parent = -1
+            else:
+                parent = self._index.get(parent_id)
+                if parent is None:
+                    return 0, []
+            children = self._children(parent)
+            end = len(children) if limit is None else offset + limit
+            return len(children), [self._node(child) for child in children[offset:end]]
+
+    def ancestors(self, folder_id: int) -> List[FolderNode]:
+        """从顶层到该文件夹（含自身）的路径，用于面包屑；不存在时返回空列表"""
+        with self._lock:
+            self._ensure_ready()
+            node = self._index.get(folder_id)
+            chain = []
+            while node is not None and node >= 0 and len(chain) <= len(self._ids):
+                chain.append(self._node(node))
+                node = self._parents[node]
+            chain.reverse()
+            return chain
+
+    def nodes(self) -> List[FolderNode]:
+        """全部文件夹（按 ID 升序）"""
+        with self._lock:
+            self._ensure_ready()
+            return [self._node(self._index[folder_id]) for folder_id in sorted(self._index)]
+
+    # ----------------------------------------------------------------
+    # 增量更新
+    # ----------------------------------------------------------------
+
+    def upsert(self, rows: Iterable[FolderRow]) -> None:
+        """登记新增或变更（移动 / 改名）的文件夹；未加载时忽略，首次查询会完整加载"""
+        rows = sorted(rows, key=lambda row: row[0])
+        if not rows:
+            return
+        with self._lock:
+            self.generation += 1
+            if not self._loaded:
+                return
+            # 父文件夹一般先入库、ID 较小，按 ID 顺序处理同一批中的父子
+            for row in rows:
+                self._upsert(*row)
+            self._maybe_rebuild()
+
+    def remove(self, folder_ids: Iterable[int]) -> None:
+        """删除文件夹；其子文件夹成为顶层（与外键 ON DELETE SET NULL 一致）"""
+        folder_ids = list(folder_ids)
+        if not folder_ids:
+            return
+        with self._lock:
+            self.generation += 1
+            if not self._loaded:
+                return
+            for folder_id in folder_ids:
+                node = self._index.pop(folder_id, None)
+                if node is None:
+                    continue
+                for child in list(self._children(node)):
+                    self._move(child, -1)
+                self._detach(node)
+                self._patched.pop(node, None)
+                self._path_overrides.pop(node, None)
+                self._changes += 1
+            self._maybe_rebuild()
+
+    def invalidate(self) -> None:
+        """丢弃内存中的树（批量改写文件夹表后调用），下次查询时重新加载"""
+        with self._lock:
+            self.generation += 1
+            self._loaded = False
+            self._clear()
+
+    def reload_in_background(self) -> None:
+        """
+        在后台线程中重新加载，完成前查询继续使用当前的树；未加载时无需重建，
+        已在重新加载时记下再来一次（加载开始后的变更也要包含进去）。
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            if self._reloading:
+                self._reload_again = True
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name="folder-tree-reload", daemon=True).start()
+
+    def _reload(self) -> None:
+        conflicts = 0
+        while conflicts < _RELOAD_ATTEMPTS:
+            with self._lock:
+                self._reload_again = False
+                generation = self.generation
+            try:
+                fresh = FolderTree(self._loader)
+                fresh._build(list(self._loader()))
+            except Exception as e:
+                logger.error(f"重新加载文件夹树失败: {str(e)}")
+                break
+            with self._lock:
+                if self.generation != generation:
+                    # 加载期间本进程提交了文件夹变更，新树可能不含这些变更，重新加载
+                    conflicts += 1
+                    continue
+                for name in _STATE:
+                    setattr(self, name, getattr(fresh, name))
+                self._loaded = True
+                if not self._reload_again:
+                    self._reloading = False
+                    return
+        # 加载失败或一直有并发修改：丢弃旧树，下次查询时同步加载
+        with self._lock:
+            self._loaded = False
+            self._clear()
+            self._reloading = False
+
+    # ----------------------------------------------------------------
+    # 内部
+    # ----------------------------------------------------------------
+
+    def _clear(self) -> None:
+        self._ids = array("q")
+        self._parents = array("q")
+        self._names: List[str] = []
+        self._descendants = array("q")
+        self._index: Dict[int, int] = {}
+        self._path_overrides: Dict[int, str] = {}
+        self._order = array("q")
+        self._offsets = array("q", [0, 0])
+        self._patched: Dict[int, List[int]] = {}
+        # 生成数组时的节点数：之后追加的节点没有 CSR 区间，子节点都在 _patched 中
+        self._built = 0
+        self._changes = 0
+
+    def _ensure_ready(self) -> None:
+        if not self._loaded:
+            self._build(list(self._loader()))
+            self._loaded = True
+
+    def _build(self, rows: Sequence[FolderRow]) -> None:
+        self._clear()
+        count = len(rows)
+        self._index = {row[0]: i for i, row in enumerate(rows)}
+        self._ids = array("q", (row[0] for row in rows))
+        self._names = [sys.intern(row[2]) for row in rows]
+        self._parents = array("q", (
+            self._index.get(row[1], -1) if row[1] is not None and row[1] != row[0] else -1
+            for row in rows
+        ))
+        self._descendants = array("q", bytes(8 * count))
+        self._built = count
+
+        self._layout()
+        # 父指针成环（数据异常）的节点从顶层遍历不到，改为顶层后重新排布
+        reached = self._breadth_first()
+        if len(reached) < count:
+            seen = bytearray(count)
+            for node in reached:
+                seen[node] = 1
+            for node in range(count):
+                if not seen[node]:
+                    self._parents[node] = -1
+            self._layout()
+            reached = self._breadth_first()
+
+        for node in reversed(reached):
+            parent = self._parents[node]
+            if parent >= 0:
+                self._descendants[parent] += self._descendants[node] + 1
+
+        # 按遍历顺序拼出路径，与数据库不同的记为例外
+        paths: List[str] = [""] * count
+        for node in reached:
+            parent = self._parents[node]
+            derived = self._join(paths[parent] if parent >= 0 else None, self._names[node])
+            paths[node] = rows[node][3]
+            if derived != paths[node]:
+                self._path_overrides[node] = paths[node]
+
+    def _layout(self) -> None:
+        """按 (父节点, 名称) 排序生成 _order / _offsets"""
+        count = len(self._ids)
+        parents, names = self._parents, self._names
+        order = sorted(range(count), key=lambda node: (parents[node], names[node]))
+        offsets = array("q", bytes(8 * (count + 2)))
+        for node in range(count):
+            offsets[parents[node] + 2] += 1
+        for i in range(1, count + 2):
+            offsets[i] += offsets[i - 1]
+        self._order = array("q", order)
+        self._offsets = offsets
+
+    def _breadth_first(self) -> List[int]:
+        reached = list(self._children(-1))
+        i = 0
+        while i < len(reached):
+            reached.extend(self._children(reached[i]))
+            i += 1
+        return reached
+
+    def _rows(self) -> List[FolderRow]:
+        return [
+            (folder_id, self._parent_id(node), self._names[node], self._path(node))
+            for folder_id, node in sorted(self._index.items())
+        ]
+
+    def _maybe_rebuild(self) -> None:
+        if self._changes > max(_MIN_REBUILD_CHANGES, len(self._index) // 4):
+            self._build(self._rows())
+
+    def _children(self, parent: int) -> Sequence[int]:
+        patched = self._patched.get(parent)
+        if patched is not None:
+            return patched
+        if parent >= self._built:
+            return ()
+        return self._order[self._offsets[parent + 1]:self._offsets[parent + 2]]
+
+    def _patch(self, parent: int) -> List[int]:
+        patched = self._patched.get(parent)
+        if patched is None:
+            patched = self._patched[parent] = list(self._children(parent))
+        return patched
+
+    def _node(self, node: int) -> FolderNode:
+        return FolderNode(
+            self._ids[node], self._names[node], self._path(node), self._parent_id(node),
+            len(self._children(node)), self._descendants[node],
+        )
+
+    def _parent_id(self, node: int) -> Optional[int]:
+        parent = self._parents[node]
+        return self._ids[parent] if parent >= 0 else None
+
+    def _path(self, node: int) -> str:
+        names = []
+        path = None
+        while node >= 0:
+            path = self._path_overrides.get(node)
+            if path is not None:
+                break
+            names.append(self._names[node])
+            node = self._parents[node]
+        for name in reversed(names):
+            path = self._join(path, name)
+        return path
+
+    @staticmethod
+    def _join(parent_path: Optional[str], name: str) -> str:
+        if parent_path is None or parent_path == ".":
+            return name
+        return os.path.join(parent_path, name)
+
+    def _upsert(self, folder_id: int, parent_id: Optional[int], name: str, folder_path: str) -> None:
+        parent = self._index.get(parent_id, -1) if parent_id is not None else -1
+        name = sys.intern(name)
+        node = self._index.get(folder_id)
+        if node is None:
+            node = len(self._ids)
+            self._index[folder_id] = node
+            self._ids.append(folder_id)
+            self._parents.append(-1)
+            self._names.append(name)
+            self._descendants.append(0)
+            self._attach(node, parent)
+        elif parent != self._parents[node] or name != self._names[node]:
+            self._move(node, parent, name)
+        self._changes += 1
+
+        self._path_overrides.pop(node, None)
+        if self._path(node) != folder_path:
+            self._path_overrides[node] = folder_path
+
+    def _move(self, node: int, parent: int, name: Optional[str] = None) -> None:
+        self._detach(node)
+        if name is not None:
+            self._names[node] = name
+        # 新父节点在自身子树中会成环（数据异常），改为顶层
+        ancestor = parent
+        while ancestor >= 0:
+            if ancestor == node:
+                parent = -1
+                break
+            ancestor = self._parents[ancestor]
+        self._attach(node, parent)
+
+    def _attach(self, node: int, parent: int) -> None:
+        self._parents[node] = parent
+        names = self._names
+        insort(self._patch(parent), node, key=lambda child: names[child])
+        self._adjust_ancestors(parent, self._descendants[node] + 1)
+
+    def _detach(self, node: int) -> None:
+        parent = self._parents[node]
+        siblings = self._patch(parent)
+        names = self._names
+        position = bisect_left(siblings, names[node], key=lambda child: names[child])
+        while siblings[position] != node:
+            position += 1
+        del siblings[position]
+        self._adjust_ancestors(parent, -(self._descendants[node] + 1))
+
+    def _adjust_ancestors(self, node: int, delta: int) -> None:
+        while node >= 0:
+            self._descendants[node] += delta
+            node = self._parents[node]
@@ -1,105 +1,284 @@
+import asyncio
+import functools
+import io
 import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-import cv2
-import numpy as np
 from app.config import settings
 from app.utils.logger import logger
-from PIL import Image
+from app.utils.metrics import SCAN_STAGE_SECONDS
+from app.utils import thumbhash
+from app.utils.phash import dhash, to_signed
+from PIL import Image, ImageStat
 from PIL.ExifTags import TAGS
-from pillow_heif import register_heif_opener
 
-# 注册 HEIF 打开器
-register_heif_opener()
+# 媒体处理线程池：视频取帧等阻塞操作放到这里执行，不占用事件循环
+_media_executor = ThreadPoolExecutor(
+    max_workers=settings.SCAN_WORKERS, thread_name_prefix="media"
+)
+
+# 视频封面候选位置（占总时长的比例），依次尝试直到取到非黑场画面
+_POSTER_POSITIONS = (0.1, 0.25, 0.5)
+# 取帧时先缩小到该宽度以内，避免 4K 视频整帧经管道传输
+_POSTER_MAX_WIDTH = 800
+# 平均亮度低于该值视为黑场
+_DARK_FRAME_THRESHOLD = 16
+
+_FFMPEG_PATH = shutil.which("ffmpeg")
+
+
+async def run_in_media_pool(func, *args):
+    """在媒体线程池中执行阻塞函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_media_executor, functools.partial(func, *args))
+
+
+@functools.lru_cache(maxsize=None)
+def _register_heif() -> None:
+    """
+    注册 HEIF 打开器。pillow_heif 与 OpenCV 都是较重的编解码依赖，
+    不在导入时加载，而是推迟到第一次媒体处理，缩短服务启动时间。
+    """
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+
+
+def _is_dark_frame(img: Image.Image) -> bool:
+    return ImageStat.Stat(img.convert("L")).mean[0] < _DARK_FRAME_THRESHOLD
 
 
 class ImageProcessor:
 
     @staticmethod
-    async def create_thumbnail(image_path: str, thumb_path: str):
-        """创建缩略图"""
+    async def create_thumbnail(image_path: str, thumb_path: str) -> dict:
+        """
+        创建缩略图，返回媒体元数据：
+        所有类型都带基于缩略图计算的感知哈希 phash 和占位图 thumbhash，
+        视频额外带 duration / fps / width / height。
+        """
+        _register_heif()
         try:
             # 修正 endswith 方法的使用，使用元组作为参数
             if image_path.lower().endswith(('.mp4', '.mov')):
-                # 处理视频文件
-                await ImageProcessor._create_video_thumbnail(
+                # 处理视频文件：返回时长/帧率/分辨率等元数据
+                return await ImageProcessor._create_video_thumbnail(
                     image_path, thumb_path)
             elif image_path.lower().endswith('.gif'):
                 # 处理 GIF 文件
-                await ImageProcessor._create_gif_thumbnail(
-                    image_path, thumb_path)
-            elif image_path.lower().endswith(('.heic', '.heif')):
-                # 处理 HEIC/HEIF 文件 - 注意这里不需要转换，因为转换已经在 image_service 中完成
-                await ImageProcessor._create_image_thumbnail(
-                    image_path, thumb_path)
+                return await run_in_media_pool(
+                    ImageProcessor._create_gif_thumbnail, image_path, thumb_path)
             else:
-                # 处理普通图片
-                await ImageProcessor._create_image_thumbnail(
-                    image_path, thumb_path)
+                # 普通图片与 HEIC/HEIF（转换已在 image_service 中按需完成）。
+                # 解码与缩放在媒体线程池中执行：Pillow 在其中释放 GIL，
+                # 扫描流水线的多个解码任务可以真正并行，也不阻塞事件循环
+                return await run_in_media_pool(
+                    ImageProcessor._create_image_thumbnail, image_path, thumb_path)
         except Exception as e:
             logger.error(f"创建缩略图失败 {image_path}: {str(e)}")
             raise
 
+    @staticmethod
+    def _fingerprints(img: Image.Image) -> dict:
+        """基于已缩小的缩略图计算感知哈希与 ThumbHash 占位图"""
+        return {"phash": to_signed(dhash(img)), "thumbhash": thumbhash.encode(img)}
+
     @staticmethod
     async def _create_video_thumbnail(video_path: str, thumb_path: str):
-        """从视频创建缩略图"""
-        try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("无法打开视频文件")
+        """从视频创建缩略图（代表帧），返回视频元数据"""
+        return await run_in_media_pool(
+            ImageProcessor._process_video_sync, video_path, thumb_path
+        )
 
-            ret, frame = cap.read()
-            if not ret:
-                raise Exception("无法读取视频帧")
+    @staticmethod
+    def _process_video_sync(video_path: str, thumb_path: str) -> dict:
+        """
+        读取视频元数据并生成代表帧缩略图（在 media 线程池中执行）。
+        调用方的 asyncio.wait_for 超时只是不再等待，线程仍在运行；
+        因此 VIDEO_TIME_BUDGET 在这里作为截止时间传给每一步，损坏的视频不会长期占住线程。
+        """
+        deadline = time.monotonic() + settings.VIDEO_TIME_BUDGET
+        try:
+            metadata = ImageProcessor.get_video_metadata(video_path, deadline)
 
-            # 转换 BGR 到 RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # 转换为PIL图像
-            img = Image.fromarray(frame_rgb)
-            img.thumbnail(settings.THUMBNAIL_SIZE)
+            with SCAN_STAGE_SECONDS.labels("decode").time():
+                img = ImageProcessor._extract_video_poster(
+                    video_path, metadata.get("duration"), deadline
+                )
+                img.thumbnail(settings.THUMBNAIL_SIZE)
+                metadata.update(ImageProcessor._fingerprints(img))
 
             # 确保目标目录存在
             os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-            img.save(thumb_path, "JPEG", quality=95)
-            cap.release()
+            with SCAN_STAGE_SECONDS.labels("encode").time():
+                img.save(thumb_path, "JPEG", quality=95)
+            return metadata
 
         except Exception as e:
             logger.error(f"创建视频缩略图失败: {str(e)}")
             raise
 
     @staticmethod
-    async def _create_gif_thumbnail(gif_path: str, thumb_path: str):
+    def _remaining(deadline: Optional[float]) -> float:
+        """距截止时间的剩余秒数，已超时则抛出 TimeoutError"""
+        if deadline is None:
+            return float(settings.VIDEO_TIME_BUDGET)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"视频处理超时（>{settings.VIDEO_TIME_BUDGET}s）")
+        return remaining
+
+    @staticmethod
+    def _open_capture(video_path: str, deadline: Optional[float]):
+        """打开 VideoCapture，打开与每次读取都限制在剩余时间内（FFMPEG 后端的中断回调）"""
+        import cv2
+        timeout_ms = max(1, int(ImageProcessor._remaining(deadline) * 1000))
+        return cv2.VideoCapture(video_path, cv2.CAP_ANY, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+        ])
+
+    @staticmethod
+    def get_video_metadata(video_path: str, deadline: Optional[float] = None) -> dict:
+        """读取视频时长、帧率与分辨率（只读容器头，不解码画面）"""
+        import cv2
+        cap = ImageProcessor._open_capture(video_path, deadline)
+        try:
+            if not cap.isOpened():
+                raise Exception("无法打开视频文件")
+
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+            frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+            return {
+                "duration": round(frame_count / fps, 3) if fps > 0 and frame_count > 0 else None,
+                "fps": round(fps, 3) if fps > 0 else None,
+                "width": width or None,
+                "height": height or None,
+            }
+        finally:
+            cap.release()
+
+    @staticmethod
+    def _extract_video_poster(
+        video_path: str, duration: Optional[float], deadline: Optional[float] = None
+    ) -> Image.Image:
+        """
+        按 _POSTER_POSITIONS 依次尝试取帧，跳过接近全黑的画面
+        （很多视频开头是黑场，首帧作为封面没有意义）。
+        到截止时间时已取到的黑场帧直接作为封面，一帧都没有则抛出 TimeoutError。
+        """
+        positions = [duration * p for p in _POSTER_POSITIONS] if duration else [0.0]
+        fallback = None
+        for seconds in positions:
+            if fallback is not None and deadline is not None and time.monotonic() >= deadline:
+                break
+            if _FFMPEG_PATH:
+                frame = ImageProcessor._grab_frame_ffmpeg(video_path, seconds, deadline)
+            else:
+                frame = ImageProcessor._grab_frame_cv2(video_path, seconds, deadline)
+            if frame is None:
+                continue
+            if not _is_dark_frame(frame):
+                return frame
+            fallback = fallback or frame
+
+        if fallback is None:
+            raise Exception("无法读取视频帧")
+        return fallback
+
+    @staticmethod
+    def _grab_frame_ffmpeg(
+        video_path: str, seconds: float, deadline: Optional[float] = None
+    ) -> Optional[Image.Image]:
+        """
+        ffmpeg 输入端 seek（-ss 放在 -i 之前）+ -noaccurate_seek：
+        直接跳到目标位置之前最近的关键帧并输出该帧，不解码前面的帧。
+        """
+        cmd = [
+            _FFMPEG_PATH, "-v", "error", "-nostdin",
+            "-noaccurate_seek", "-ss", f"{seconds:.3f}", "-i", video_path,
+            "-frames:v", "1", "-vf", f"scale='min(iw,{_POSTER_MAX_WIDTH})':-2",
+            "-f", "image2pipe", "-c:v", "png", "-",
+        ]
+        try:
+            result = subprocess.run(
+                cmd, capture_output=True, timeout=ImageProcessor._remaining(deadline), check=False
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"ffmpeg 取帧超时（>{settings.VIDEO_TIME_BUDGET}s）")
+        if result.returncode != 0 or not result.stdout:
+            return None
+        img = Image.open(io.BytesIO(result.stdout))
+        return img.convert("RGB")
+
+    @staticmethod
+    def _grab_frame_cv2(
+        video_path: str, seconds: float, deadline: Optional[float] = None
+    ) -> Optional[Image.Image]:
+        """未安装 ffmpeg 时的回退方案：OpenCV 按时间定位后读取一帧"""
+        import cv2
+        cap = ImageProcessor._open_capture(video_path, deadline)
+        try:
+            if not cap.isOpened():
+                raise Exception("无法打开视频文件")
+            if seconds > 0:
+                cap.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+                ImageProcessor._remaining(deadline)
+            ret, frame = cap.read()
+            if not ret:
+                return None
+            # 转换 BGR 到 RGB
+            return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        finally:
+            cap.release()
+
+    @staticmethod
+    def _create_gif_thumbnail(gif_path: str, thumb_path: str):
         """从GIF创建缩略图"""
         try:
             with Image.open(gif_path) as img:
-                # 获取第一帧
-                img.seek(0)
-                # 转换为RGB模式
-                if img.mode in ('RGBA', 'P'):
-                    first_frame = img.convert('RGB')
-                else:
-                    first_frame = img.copy()
+                with SCAN_STAGE_SECONDS.labels("decode").time():
+                    # 获取第一帧
+                    img.seek(0)
+                    # 转换为RGB模式
+                    if img.mode in ('RGBA', 'P'):
+                        first_frame = img.convert('RGB')
+                    else:
+                        first_frame = img.copy()
 
-                first_frame.thumbnail(settings.THUMBNAIL_SIZE)
+                    first_frame.thumbnail(settings.THUMBNAIL_SIZE)
+                    fingerprints = ImageProcessor._fingerprints(first_frame)
 
                 # 确保目标目录存在
                 os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-                first_frame.save(thumb_path, "JPEG", quality=95)
+                with SCAN_STAGE_SECONDS.labels("encode").time():
+                    first_frame.save(thumb_path, "JPEG", quality=95)
+                return fingerprints
         except Exception as e:
             logger.error(f"创建GIF缩略图失败: {str(e)}")
             raise
 
     @staticmethod
-    async def _create_image_thumbnail(image_path: str, thumb_path: str):
+    def _create_image_thumbnail(image_path: str, thumb_path: str):
         """创建普通图片缩略图"""
         try:
             with Image.open(image_path) as img:
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                img.thumbnail(settings.THUMBNAIL_SIZE)
+                with SCAN_STAGE_SECONDS.labels("decode").time():
+                    if img.mode in ('RGBA', 'P'):
+                        img = img.convert('RGB')
+                    img.thumbnail(settings.THUMBNAIL_SIZE)
+                    fingerprints = ImageProcessor._fingerprints(img)
 
                 # 确保目标目录存在
                 os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-                img.save(thumb_path, "JPEG", quality=95)
+                with SCAN_STAGE_SECONDS.labels("encode").time():
+                    img.save(thumb_path, "JPEG", quality=95)
+                return fingerprints
         except Exception as e:
             logger.error(f"创建图片缩略图失败: {str(e)}")
             raise
@@ -107,16 +286,26 @@ class ImageProcessor:
     @staticmethod
     async def convert_heic(heic_path: str, jpg_path: str):
         """转换HEIC为JPEG"""
+        ImageProcessor.convert_heic_file(heic_path, jpg_path)
+
+    @staticmethod
+    def convert_heic_file(heic_path: str, jpg_path: str):
+        """转换HEIC为JPEG（同步版本，供线程池调用）"""
+        _register_heif()
         with Image.open(heic_path) as img:
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            img.save(jpg_path, "JPEG")
+            with SCAN_STAGE_SECONDS.labels("decode").time():
+                img.load()
+                if img.mode == 'RGBA':
+                    img = img.convert('RGB')
+            with SCAN_STAGE_SECONDS.labels("encode").time():
+                img.save(jpg_path, "JPEG")
 
     @staticmethod
     def get_exif_data(image_path: str) -> dict:
         """读取EXIF数据"""
+        _register_heif()
         try:
-            with Image.open(image_path) as img:
+            with SCAN_STAGE_SECONDS.labels("exif").time(), Image.open(image_path) as img:
                 exif = img.getexif()
                 if not exif:
                     return {}
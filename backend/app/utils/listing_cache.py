@@ -0,0 +1,69 @@
+"""
+进程内列表页缓存：按文件夹代数（generation）精确失效。
+
+设计说明：
+  热门文件夹每次打开都要 COUNT + OFFSET 查询 + ORM 构造 + 序列化，
+  而 NAS 上的内容很少变化。这里缓存序列化好的响应体（及调用方需要的少量元数据），
+  命中时直接返回，不再访问数据库。
+
+  每个文件夹有一个代数，写入方在事务提交后调用 bump() 递增；
+  缓存条目记录写入时的代数，读取时代数不一致即视为过期。
+  读请求必须在查询数据库之前取代数（generation()），
+  这样查询期间发生的提交会让这次写入的条目立即过期，不会缓存旧数据。
+  全盘扫描等批量变更调用 bump_all()，使所有条目失效。
+"""
+import threading
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from cachetools import LRUCache
+
+
+class ListingCache:
+
+    def __init__(self, maxsize: int):
+        self._entries: LRUCache = LRUCache(maxsize=maxsize)
+        self._generations: Dict[int, int] = {}
+        # bump_all 递增的全局代数，与文件夹代数一起组成条目的有效性标记
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def generation(self, folder_id: int) -> Tuple[int, int]:
+        """当前代数，读请求在查询数据库之前获取，写入缓存时原样传回"""
+        with self._lock:
+            return self._epoch, self._generations.get(folder_id, 0)
+
+    def get(self, folder_id: int, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get((folder_id, key))
+            if entry is None:
+                return None
+            generation, value = entry
+            if generation != (self._epoch, self._generations.get(folder_id, 0)):
+                del self._entries[(folder_id, key)]
+                return None
+            return value
+
+    def put(self, folder_id: int, key: Hashable, generation: Tuple[int, int], value: Any) -> None:
+        with self._lock:
+            # 查询期间文件夹已变更，结果可能是旧数据，不缓存
+            if generation != (self._epoch, self._generations.get(folder_id, 0)):
+                return
+            self._entries[(folder_id, key)] = (generation, value)
+
+    def bump(self, folder_ids: Iterable[int]) -> None:
+        """使指定文件夹的缓存失效（在写入事务提交之后调用）"""
+        with self._lock:
+            for folder_id in folder_ids:
+                if folder_id is not None:
+                    self._generations[folder_id] = self._generations.get(folder_id, 0) + 1
+
+    def bump_all(self) -> None:
+        """使所有缓存失效（全盘扫描、清空缓存时调用）"""
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,445 @@
+"""
+轻量级 Prometheus 指标。
+
+不依赖 prometheus_client：只实现本项目用到的 Counter / Gauge / Histogram，
+输出 Prometheus 文本格式（text/plain; version=0.0.4），由 GET /metrics 暴露。
+
+设计说明：
+  - 每个带标签的子指标持有一把 threading.Lock，更新只是几次加法，
+    扫描线程和请求协程都可以直接调用，开销足够小，可在生产环境常开。
+  - DB 连接池等"当前值"类指标用回调 Gauge，只在抓取时读取，平时零开销。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4"
+
+# 默认桶：覆盖 1ms ~ 30s，适合单文件处理和 HTTP 请求耗时
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：管理标签子指标"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._children_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> "_Metric":
+        """获取（或创建）指定标签值的子指标"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际传入 {values}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def children(self) -> Dict[Tuple[str, ...], "_Metric"]:
+        """当前所有标签子指标的快照（供基准测试等读取）"""
+        with self._children_lock:
+            return dict(self._children)
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        """返回 (后缀, 标签串, 值) 列表"""
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        if self.labelnames:
+            for key, child in sorted(self._children.items()):
+                for suffix, extra, value in child._samples():
+                    labels = _format_labels(self.labelnames, key)
+                    if extra:
+                        labels = (labels[:-1] + "," + extra + "}") if labels else "{" + extra + "}"
+                    lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        else:
+            for suffix, extra, value in self._samples():
+                labels = "{" + extra + "}" if extra else ""
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [("_total", "", self._value)]
+
+
+class Gauge(_Metric):
+    """瞬时值；可通过 set_function 改为抓取时回调计算"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [("", "", self.value)]
+
+
+class Histogram(_Metric):
+    """直方图：累计桶 + sum + count"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._upper_bounds = tuple(sorted(buckets))
+        self._bucket_counts = [0] * (len(self._upper_bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self._upper_bounds)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """计时上下文：with HISTOGRAM.labels("x").time(): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._upper_bounds, self._bucket_counts):
+            cumulative += count
+            samples.append(("_bucket", f'le="{_format_value(bound)}"', cumulative))
+        cumulative += self._bucket_counts[-1]
+        samples.append(("_bucket", 'le="+Inf"', cumulative))
+        samples.append(("_sum", "", self._sum))
+        samples.append(("_count", "", self._count))
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# -----------------------------------------------------------------------
+# 扫描流水线
+# -----------------------------------------------------------------------
+SCAN_STAGE_SECONDS = registry.register(Histogram(
+    "simplephotos_scan_stage_seconds",
+    "Time spent in each scan stage (walk, stat, exif, decode, encode, db_write).",
+    ["stage"],
+))
+SCAN_FILES_TOTAL = registry.register(Counter(
+    "simplephotos_scan_files",
+    "Files processed by the scanner, by result.",
+    ["result"],
+))
+SCAN_FAILURES_TOTAL = registry.register(Counter(
+    "simplephotos_scan_failures",
+    "Files that failed to process, by error class.",
+    ["error_class"],
+))
+SCAN_FILES_PER_SECOND = registry.register(Gauge(
+    "simplephotos_scan_files_per_second",
+    "Throughput of the most recent file scan.",
+))
+SCAN_QUEUE_DEPTH = registry.register(Gauge(
+    "simplephotos_scan_queue_depth",
+    "Items waiting in each scan pipeline queue (walk, decode, write).",
+    ["queue"],
+))
+SCAN_BOOSTED_FILES_TOTAL = registry.register(Counter(
+    "simplephotos_scan_boosted_files",
+    "Files moved to the front of the scan queue because a user opened their folder.",
+    ["level"],
+))
+SCAN_RELINKED_TOTAL = registry.register(Counter(
+    "simplephotos_scan_relinked",
+    "Moved or renamed files and folders re-pointed by content fingerprint instead of reprocessed.",
+    ["kind"],
+))
+SCAN_LAST_DURATION_SECONDS = registry.register(Gauge(
+    "simplephotos_scan_last_duration_seconds",
+    "Wall-clock duration of the most recent file scan.",
+))
+RETRY_ATTEMPTS_TOTAL = registry.register(Counter(
+    "simplephotos_retry_attempts",
+    "Background retries of failed files, by result.",
+    ["result"],
+))
+
+# -----------------------------------------------------------------------
+# 缓存与缩略图
+# -----------------------------------------------------------------------
+VALIDATION_CACHE_TOTAL = registry.register(Counter(
+    "simplephotos_validation_cache_requests",
+    "Folder validation cache lookups, by result (hit/miss).",
+    ["result"],
+))
+VALIDATION_CACHE_HIT_RATIO = registry.register(Gauge(
+    "simplephotos_validation_cache_hit_ratio",
+    "Folder validation cache hit ratio since process start.",
+))
+THUMBNAIL_SECONDS = registry.register(Histogram(
+    "simplephotos_thumbnail_seconds",
+    "Thumbnail generation latency, by media kind.",
+    ["media"],
+))
+LISTING_CACHE_TOTAL = registry.register(Counter(
+    "simplephotos_listing_cache_requests",
+    "Folder image listing page cache lookups, by result (hit/miss).",
+    ["result"],
+))
+PREFETCH_ITEMS_TOTAL = registry.register(Counter(
+    "simplephotos_prefetch_items",
+    "Thumbnails warmed by the browse prefetcher, by result "
+    "(generated/readahead/failed) plus cancelled prefetch tasks.",
+    ["result"],
+))
+DISK_CACHE_REQUESTS_TOTAL = registry.register(Counter(
+    "simplephotos_disk_cache_requests",
+    "Disk cache lookups, by cache and result (hit/miss).",
+    ["cache", "result"],
+))
+DISK_CACHE_BYTES = registry.register(Gauge(
+    "simplephotos_disk_cache_bytes",
+    "Disk cache usage in bytes, by cache.",
+    ["cache"],
+))
+DISK_CACHE_EVICTIONS = registry.register(Gauge(
+    "simplephotos_disk_cache_evictions",
+    "Files evicted from disk cache since process start, by cache.",
+    ["cache"],
+))
+PACK_RECLAIMED_BYTES_TOTAL = registry.register(Counter(
+    "simplephotos_pack_reclaimed_bytes",
+    "Bytes reclaimed by pack store compaction, by cache.",
+    ["cache"],
+))
+
+# -----------------------------------------------------------------------
+# DB 连接池（抓取时回调）
+# -----------------------------------------------------------------------
+DB_POOL_CONNECTIONS = registry.register(Gauge(
+    "simplephotos_db_pool_connections",
+    "Database connection pool usage, by state.",
+    ["state"],
+))
+
+# -----------------------------------------------------------------------
+# HTTP 请求
+# -----------------------------------------------------------------------
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "simplephotos_http_request_duration_seconds",
+    "HTTP request latency, by method, route template and status code.",
+    ["method", "route", "status"],
+))
+
+
+def _validation_hit_ratio() -> float:
+    hits = VALIDATION_CACHE_TOTAL.labels("hit").value
+    misses = VALIDATION_CACHE_TOTAL.labels("miss").value
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+VALIDATION_CACHE_HIT_RATIO.set_function(_validation_hit_ratio)
+
+
+def bind_disk_cache(cache) -> None:
+    """把 DiskCache 的占用与淘汰数挂到对应指标上（抓取时读取）"""
+    DISK_CACHE_BYTES.labels(cache.name).set_function(lambda: cache.total_bytes)
+    DISK_CACHE_EVICTIONS.labels(cache.name).set_function(lambda: cache.evictions)
+
+
+def bind_db_pool(engine) -> None:
+    """把 Engine 的连接池状态挂到 simplephotos_db_pool_connections 上"""
+    pool = engine.pool
+
+    def _reader(method: str) -> Callable[[], float]:
+        def read() -> float:
+            func = getattr(pool, method, None)
+            return float(func()) if callable(func) else 0.0
+        return read
+
+    for state, method in (
+        ("size", "size"),
+        ("checked_out", "checkedout"),
+        ("checked_in", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        DB_POOL_CONNECTIONS.labels(state).set_function(_reader(method))
+
+
+def classify_exception(exc: Optional[BaseException]) -> str:
+    """失败原因的指标标签：直接使用异常类名，未知时为 unknown"""
+    return type(exc).__name__ if exc is not None else "unknown"
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件，按路由模板记录请求耗时。
+
+    路由模板从 Starlette 写回 scope 的 "route" 读取（如 /folders/{folder_id}/images），
+    避免按实际 URL 打标签导致时间序列爆炸；静态文件挂载使用挂载前缀。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                scope.get("method", ""),
+                _route_label(scope),
+                str(status_holder["status"]),
+            ).observe(time.perf_counter() - start)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    root_path = scope.get("root_path")
+    if root_path:
+        return root_path
+    return "<unmatched>"
@@ -0,0 +1,826 @@
+"""
+追加写的打包存储（pack file），THUMBNAIL_STORE=pack 时替代每张缩略图一个文件的 DiskCache。
+
+设计说明：
+  几百万个 8–20 KB 的小文件在 NAS 缓存卷上浪费 inode 与块空间，备份、清空缓存
+  都要逐个处理文件。这里把缩略图追加写入少数几个大段文件，另用一个 mmap 的
+  哈希表索引定位：
+
+  段文件 seg-000001.pack：文件头 + 依次追加的记录
+    记录 = 记录头 (数据 crc32, key 长度, 数据长度) + key（UTF-8）+ 数据
+    删除时追加一条数据长度为 _TOMBSTONE 的墓碑记录；索引丢失或损坏时按段号
+    顺序重放全部记录即可重建。单个段文件超过 segment_bytes 后开始写下一个段。
+
+  索引 index.bin：开放寻址（线性探测）哈希表，整个文件以 MAP_SHARED 映射：
+    文件头：magic、容量、有效条目数、已占用槽位数、退役标记、压缩代数、有效字节数
+    槽位：key 哈希（8 字节，0 表示空）、段号、key 长度、记录偏移、数据长度、
+          最近访问时间、命中次数
+    删除的槽位段号置为 _DELETED，保留哈希，探测链不断开。占用率超过 _MAX_LOAD
+    时写一份新索引替换，并在旧索引文件头置退役标记，其他进程发现后重新映射。
+    索引常驻页缓存，不必像 DiskCache 那样把几百万条目加载成 Python 对象。
+
+  读：查索引（几次内存访问）→ 对段文件 pread 一次；读取时校验 key，
+  索引与段文件不一致（崩溃后、极少数哈希冲突）时按未命中处理，由调用方重新生成。
+  ASGI 服务器支持 zero-copy 扩展时直接按 (段文件, 偏移, 长度) 发送（见 static_files）。
+
+  写：生成方仍把文件写到 path_for(key)（staging 目录下的临时文件），put(key)
+  读入后追加到当前段并删除临时文件，调用方式与 DiskCache 相同。
+  多个进程（Web 服务与离线 CLI）共享同一目录：写操作持有目录下 .lock 的 flock，
+  读操作不加锁。
+
+  配额与淘汰：有效字节数超过 max_bytes 时按 lru / lfu 淘汰到 LOW_WATERMARK 以下，
+  与 DiskCache 一致地回调 on_evict(key)；被淘汰、删除的记录只是从索引中去掉，
+  空间由 compact() 回收：已删除数据占比达到阈值的段，把有效记录复制到当前段后删除。
+  压缩在后台定期执行（见 cache_service.pack_compactor），也可由 CLI gc 触发。
+
+  legacy_root：从 files 切换到 pack 时，索引中没有、但旧目录里有同名文件的 key
+  在第一次 get() 时导入并删除旧文件（离线 CLI thumbs 可一次导入全部）。
+"""
+import hashlib
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.utils.disk_cache import LFU, LOW_WATERMARK, LRU
+from app.utils.logger import logger
+from app.utils.metrics import DISK_CACHE_REQUESTS_TOTAL, PACK_RECLAIMED_BYTES_TOTAL
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台：只有进程内互斥，不支持多进程共享目录
+    fcntl = None
+
+_SEGMENT_MAGIC = b"SPPACK1\n"
+_INDEX_MAGIC = b"SPPIDX1\n"
+_INDEX_FILE_NAME = "index.bin"
+_LOCK_FILE_NAME = ".lock"
+_STAGING_DIR_NAME = "staging"
+
+# 记录头：数据 crc32、key 长度、数据长度
+_RECORD = struct.Struct("<IHI")
+_TOMBSTONE = 0xFFFFFFFF
+
+# 索引文件头（固定占 _INDEX_HEADER_SIZE 字节，其余保留）
+_INDEX_HEADER = struct.Struct("<8sIIIIIQ")
+_INDEX_HEADER_SIZE = 64
+_CAPACITY_OFFSET = 8
+_COUNT_OFFSET = 12
+_USED_OFFSET = 16
+_RETIRED_OFFSET = 20
+_GENERATION_OFFSET = 24
+_TOTAL_BYTES_OFFSET = 28
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+# 槽位：key 哈希、段号、key 长度、记录偏移、数据长度、最近访问时间、命中次数
+_SLOT = struct.Struct("<QIHIIII")
+# 槽位内的 (最近访问时间, 命中次数)，访问记录只写这两个字段
+_SLOT_ACCESS = struct.Struct("<II")
+_SLOT_ACCESS_OFFSET = struct.calcsize("<QIHII")
+_DELETED = 0xFFFFFFFF
+_MAX_LOAD = 0.7
+# 重建 / 扩容后的目标占用率
+_TARGET_LOAD = 0.35
+_MIN_CAPACITY = 1024
+
+# staging 中超过该时间（秒）的临时文件视为生成失败遗留，打开存储时清理
+_STAGING_MAX_AGE = 3600
+
+
+class PackRef(NamedTuple):
+    """数据在段文件中的位置"""
+    segment: int
+    offset: int
+    length: int
+
+
+def _key_hash(key: bytes) -> int:
+    value = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+    # 0 表示空槽位
+    return value or 1
+
+
+def _capacity_for(count: int) -> int:
+    capacity = _MIN_CAPACITY
+    while capacity * _TARGET_LOAD < count + 1:
+        capacity *= 2
+    return capacity
+
+
+class PackStore:
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        max_bytes: int,
+        policy: str = LRU,
+        on_evict: Optional[Callable[[str], None]] = None,
+        segment_bytes: int = 256 * 1024 * 1024,
+        legacy_root: Optional[str] = None,
+    ):
+        if policy not in (LRU, LFU):
+            raise ValueError(f"不支持的淘汰策略: {policy}")
+        self.name = name
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_evict = on_evict
+        self.segment_bytes = segment_bytes
+        self.legacy_root = str(legacy_root) if legacy_root else None
+        self.staging_dir = os.path.join(self.root, _STAGING_DIR_NAME)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._index: Optional[mmap.mmap] = None
+        self._capacity = 0
+        self._generation = 0
+        # 当前映射的索引文件 inode：索引被整体替换（其他进程重建）时据此发现
+        self._index_inode = 0
+        # 段号 → 只读文件描述符
+        self._fds: Dict[int, int] = {}
+        self._lock_fd: Optional[int] = None
+        self._lock_depth = 0
+
+    # ----------------------------------------------------------------
+    # 与 DiskCache 相同的接口
+    # ----------------------------------------------------------------
+
+    def path_for(self, key: str) -> str:
+        """生成方写入的临时文件路径，写好后调用 put(key) 收入段文件"""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.staging_dir, f"{digest}{os.path.splitext(key)[1]}")
+
+    def get(self, key: str) -> Optional[PackRef]:
+        """命中返回数据位置并记录访问；旧目录中有同名文件时先导入"""
+        with self._lock:
+            self._ensure_loaded()
+            found = self._find(key.encode("utf-8"))
+            if found is None and self.legacy_root:
+                found = self._import_legacy(key)
+            if found is None:
+                self.record_miss()
+                return None
+            index, slot = found
+            self._touch_slot(index, slot)
+            return self._ref(slot)
+
+    def touch(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            found = self._find(key.encode("utf-8"))
+            if found is None:
+                self.record_miss()
+                return False
+            self._touch_slot(*found)
+            return True
+
+    def record_miss(self) -> None:
+        self.misses += 1
+        DISK_CACHE_REQUESTS_TOTAL.labels(self.name, "miss").inc()
+
+    def put(self, key: str) -> None:
+        """把 path_for(key) 处已写好的文件收入段文件并删除该文件，必要时淘汰旧数据"""
+        staging_path = self.path_for(key)
+        try:
+            with open(staging_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        self.put_bytes(key, data)
+        try:
+            os.remove(staging_path)
+        except OSError:
+            pass
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        key_bytes = key.encode("utf-8")
+        with self._lock, self._writer():
+            self._ensure_loaded()
+            self._store(key_bytes, data)
+            evicted = self._evict_over_quota(keep=key_bytes)
+        self._notify_evicted(evicted)
+
+    def discard(self, key: str) -> None:
+        key_bytes = key.encode("utf-8")
+        with self._lock, self._writer():
+            self._ensure_loaded()
+            found = self._find(key_bytes)
+            if found is None:
+                return
+            self._delete_slot(found[0], found[1], key_bytes)
+        self._notify_evicted([key])
+
+    def clear(self) -> int:
+        """删除全部数据（段文件整体删除），返回删除的条目数"""
+        with self._lock, self._writer():
+            self._ensure_loaded()
+            keys = [key for key, _ in self._iter_keys()]
+            for segment in self._segments():
+                self._unlink_segment(segment)
+            self._write_index({}, _capacity_for(0))
+        self._notify_evicted(keys)
+        return len(keys)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return self._find(key.encode("utf-8"), verify=False) is not None
+
+    def preload(self) -> None:
+        """立即打开索引（服务启动时在线程中调用，与 DiskCache.preload 一致）"""
+        with self._lock:
+            self._ensure_loaded()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return _U64.unpack_from(self._index, _TOTAL_BYTES_OFFSET)[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._ensure_loaded()
+            lookups = self.hits + self.misses
+            file_bytes = sum(self._segment_size(segment) for segment in self._segments())
+            return {
+                "entries": _U32.unpack_from(self._index, _COUNT_OFFSET)[0],
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "segments": len(self._segments()),
+                "file_bytes": file_bytes,
+                # 段文件中有效数据以外的字节数：已删除、尚未被压缩回收的记录，以及记录头与 key
+                "overhead_bytes": max(file_bytes - self.total_bytes, 0),
+            }
+
+    def save(self, force: bool = False) -> None:
+        """索引随写随更新（MAP_SHARED），force=True 时同步到磁盘"""
+        with self._lock:
+            if force and self._index is not None:
+                self._index.flush()
+
+    # ----------------------------------------------------------------
+    # 打包存储特有的接口
+    # ----------------------------------------------------------------
+
+    def read(self, key: str) -> Optional[Tuple[PackRef, bytes]]:
+        """读取数据并记录访问；不存在或校验失败时返回 None"""
+        ref = self.get(key)
+        if ref is None:
+            return None
+        data = self.load(key, ref)
+        return (ref, data) if data is not None else None
+
+    def load(self, key: str, ref: PackRef) -> Optional[bytes]:
+        """按 get() 返回的位置读取数据，校验 key 与 crc；其他进程压缩移动了记录时重新定位一次"""
+        key_bytes = key.encode("utf-8")
+        for attempt in range(2):
+            record_offset = ref.offset - _RECORD.size - len(key_bytes)
+            record = self._pread(ref.segment, _RECORD.size + len(key_bytes) + ref.length, record_offset)
+            if record is not None:
+                crc, key_length, length = _RECORD.unpack_from(record)
+                data = record[_RECORD.size + key_length:]
+                if (key_length == len(key_bytes) and length == ref.length
+                        and record[_RECORD.size:_RECORD.size + key_length] == key_bytes
+                        and zlib.crc32(data) == crc):
+                    return data
+            if attempt:
+                break
+            with self._lock:
+                self._refresh(force=True)
+                found = self._find(key_bytes)
+                if found is None or self._ref(found[1]) == ref:
+                    break
+                ref = self._ref(found[1])
+        logger.warning(f"打包存储记录损坏或已不存在 [{self.name}] {key}")
+        return None
+
+    def open(self, key: str) -> Optional[io.BytesIO]:
+        """以文件对象形式读取（Pillow 等需要文件的调用方）"""
+        result = self.read(key)
+        return io.BytesIO(result[1]) if result else None
+
+    def import_legacy(self, key: str) -> bool:
+        """旧目录中有该 key 的文件、且尚未收入段文件时导入（离线迁移用），返回是否导入"""
+        with self._lock:
+            self._ensure_loaded()
+            if not self.legacy_root or self._find(key.encode("utf-8"), verify=False) is not None:
+                return False
+            return self._import_legacy(key) is not None
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, f"seg-{segment:06d}.pack")
+
+    def readahead(self, keys: Iterable[str]) -> None:
+        """提示内核预读这些 key 的数据（posix_fadvise WILLNEED）"""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        with self._lock:
+            self._ensure_loaded()
+            refs = []
+            for key in keys:
+                found = self._find(key.encode("utf-8"), verify=False)
+                if found is not None:
+                    refs.append(self._ref(found[1]))
+        for ref in refs:
+            fd = self._fd(ref.segment)
+            if fd is not None:
+                try:
+                    os.posix_fadvise(fd, ref.offset, ref.length, os.POSIX_FADV_WILLNEED)
+                except OSError:
+                    pass
+
+    def items(self) -> Iterator[Tuple[str, float]]:
+        """全部 (key, 最近访问时间)"""
+        with self._lock:
+            self._ensure_loaded()
+            entries = list(self._iter_keys())
+        for key, slot in entries:
+            yield key.decode("utf-8"), float(slot[5])
+
+    def compact(self, min_dead_ratio: float = 0.5) -> int:
+        """
+        回收已删除数据占用的空间，返回回收的字节数。已删除数据占比达到 min_dead_ratio 的段
+        （正在写入的最后一个段除外）把有效记录复制到当前段后删除；每个段单独持锁，
+        压缩期间其他写入只在段与段之间等待。
+        """
+        with self._lock:
+            self._ensure_loaded()
+            segments = self._segments()
+            inode = self._index_inode
+            live = self._live_by_segment()
+        reclaimed = 0
+        for segment in segments[:-1]:
+            with self._lock, self._writer():
+                self._refresh()
+                if self._index_inode != inode:
+                    # 其他进程重建了索引，槽位号已失效
+                    inode = self._index_inode
+                    live = self._live_by_segment()
+                size = self._segment_size(segment)
+                if not size:
+                    continue
+                # 段间等待期间只会有删除（有效字节只减不增），沿用开始时的统计不会误压缩
+                live_bytes, indexes = live.get(segment, (0, []))
+                if live_bytes and 1 - live_bytes / size < min_dead_ratio:
+                    continue
+                moved = self._compact_segment(segment, indexes)
+                reclaimed += size - moved
+        if reclaimed:
+            PACK_RECLAIMED_BYTES_TOTAL.labels(self.name).inc(reclaimed)
+            logger.info(f"打包存储压缩完成 [{self.name}]，回收 {reclaimed} 字节")
+        return reclaimed
+
+    # ----------------------------------------------------------------
+    # 索引
+    # ----------------------------------------------------------------
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            self._refresh()
+            return
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._clean_staging()
+        self._open_index()
+        self._loaded = True
+
+    def _refresh(self, force: bool = False) -> None:
+        """其他进程扩容了索引或压缩了段文件时，重新映射索引、关闭过时的段文件描述符"""
+        if self._index is None:
+            return
+        if _U32.unpack_from(self._index, _RETIRED_OFFSET)[0]:
+            self._open_index()
+        generation = _U32.unpack_from(self._index, _GENERATION_OFFSET)[0]
+        if force or generation != self._generation:
+            self._generation = generation
+            self._close_fds()
+
+    def _open_index(self) -> None:
+        path = os.path.join(self.root, _INDEX_FILE_NAME)
+        for attempt in range(2):
+            try:
+                with open(path, "r+b") as f:
+                    index = mmap.mmap(f.fileno(), 0)
+                    inode = os.fstat(f.fileno()).st_ino
+            except (FileNotFoundError, ValueError):
+                index = None
+            if index is not None:
+                magic, capacity = _INDEX_HEADER.unpack_from(index)[:2]
+                if magic == _INDEX_MAGIC and len(index) == _INDEX_HEADER_SIZE + capacity * _SLOT.size:
+                    self._map(index, inode)
+                    return
+                index.close()
+                if attempt == 0:
+                    logger.warning(f"打包存储索引损坏，按段文件重建 [{self.name}]")
+            with self._writer():
+                # 持锁后再确认一次：可能刚由其他进程重建好
+                if attempt == 0 and self._index_valid(path):
+                    continue
+                self._rebuild_index()
+                return
+        raise RuntimeError(f"无法打开打包存储索引: {path}")
+
+    @staticmethod
+    def _index_valid(path: str) -> bool:
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_INDEX_HEADER.size)
+                size = os.fstat(f.fileno()).st_size
+        except OSError:
+            return False
+        if len(header) < _INDEX_HEADER.size:
+            return False
+        magic, capacity = _INDEX_HEADER.unpack(header)[:2]
+        return magic == _INDEX_MAGIC and size == _INDEX_HEADER_SIZE + capacity * _SLOT.size
+
+    def _map(self, index: mmap.mmap, inode: int) -> None:
+        if self._index is not None:
+            self._index.close()
+        self._index = index
+        self._index_inode = inode
+        self._capacity = _U32.unpack_from(index, _CAPACITY_OFFSET)[0]
+        self._generation = _U32.unpack_from(index, _GENERATION_OFFSET)[0]
+        self._close_fds()
+
+    def _slot(self, index: int) -> tuple:
+        return _SLOT.unpack_from(self._index, _INDEX_HEADER_SIZE + index * _SLOT.size)
+
+    def _set_slot(self, index: int, slot: tuple) -> None:
+        _SLOT.pack_into(self._index, _INDEX_HEADER_SIZE + index * _SLOT.size, *slot)
+
+    def _add_to_header(self, offset: int, delta: int, field: struct.Struct = _U32) -> None:
+        value = field.unpack_from(self._index, offset)[0]
+        field.pack_into(self._index, offset, max(value + delta, 0))
+
+    def _find(self, key: bytes, verify: bool = True) -> Optional[Tuple[int, tuple]]:
+        """返回 (槽位号, 槽位)；verify=True 时读段文件核对 key（排除哈希冲突）"""
+        key_hash = _key_hash(key)
+        capacity = self._capacity
+        index = key_hash % capacity
+        for _ in range(capacity):
+            slot = self._slot(index)
+            if slot[0] == 0:
+                return None
+            if slot[0] == key_hash and slot[1] != _DELETED:
+                if verify and slot[2] != len(key):
+                    return None
+                if verify and self._pread(slot[1], len(key), slot[3] + _RECORD.size) != key:
+                    return None
+                return index, slot
+            index = (index + 1) % capacity
+        return None
+
+    def _insert(self, key: bytes, segment: int, offset: int, length: int) -> None:
+        """写入或覆盖 key 的槽位（持写锁调用）"""
+        used = _U32.unpack_from(self._index, _USED_OFFSET)[0]
+        if used + 1 > self._capacity * _MAX_LOAD:
+            self._resize()
+
+        key_hash = _key_hash(key)
+        capacity = self._capacity
+        index = key_hash % capacity
+        free = None
+        for _ in range(capacity):
+            slot = self._slot(index)
+            if slot[0] == 0:
+                break
+            if slot[0] == key_hash and slot[1] != _DELETED:
+                # 覆盖已有条目
+                self._add_to_header(_TOTAL_BYTES_OFFSET, length - slot[4], _U64)
+                self._set_slot(index, (key_hash, segment, len(key), offset, length, int(time.time()), 0))
+                return
+            if slot[1] == _DELETED and free is None:
+                free = index
+            index = (index + 1) % capacity
+        if free is None:
+            self._add_to_header(_USED_OFFSET, 1)
+            free = index
+        self._set_slot(free, (key_hash, segment, len(key), offset, length, int(time.time()), 0))
+        self._add_to_header(_COUNT_OFFSET, 1)
+        self._add_to_header(_TOTAL_BYTES_OFFSET, length, _U64)
+
+    def _delete_slot(self, index: int, slot: tuple, key: bytes) -> None:
+        """从索引中删除并追加墓碑记录（持写锁调用）"""
+        self._append(key, None)
+        self._set_slot(index, (slot[0], _DELETED, 0, 0, 0, 0, 0))
+        self._add_to_header(_COUNT_OFFSET, -1)
+        self._add_to_header(_TOTAL_BYTES_OFFSET, -slot[4], _U64)
+
+    def _touch_slot(self, index: int, slot: tuple) -> None:
+        # 不加写锁，也不写回整个槽位：读到的槽位可能已被其他进程删除、改写或压缩到新段，
+        # 写回旧值会覆盖这些修改。只在哈希与段号仍一致时写访问时间与命中次数两个字段，
+        # 并发访问时命中次数可能少计
+        self.hits += 1
+        DISK_CACHE_REQUESTS_TOTAL.labels(self.name, "hit").inc()
+        current = self._slot(index)
+        if current[0] != slot[0] or current[1] != slot[1]:
+            return
+        _SLOT_ACCESS.pack_into(
+            self._index, _INDEX_HEADER_SIZE + index * _SLOT.size + _SLOT_ACCESS_OFFSET,
+            int(time.time()), min(current[6] + 1, 0xFFFFFFFF),
+        )
+
+    @staticmethod
+    def _ref(slot: tuple) -> PackRef:
+        return PackRef(slot[1], slot[3] + _RECORD.size + slot[2], slot[4])
+
+    def _live_slots(self) -> Iterator[Tuple[int, tuple]]:
+        for index in range(self._capacity):
+            slot = self._slot(index)
+            if slot[0] != 0 and slot[1] != _DELETED:
+                yield index, slot
+
+    def _iter_keys(self) -> Iterator[Tuple[bytes, tuple]]:
+        for _, slot in self._live_slots():
+            key = self._pread(slot[1], slot[2], slot[3] + _RECORD.size)
+            if key is not None:
+                yield key, slot
+
+    def _live_by_segment(self) -> Dict[int, Tuple[int, List[int]]]:
+        """各段中有效记录占用的字节数（含记录头）与所在槽位号"""
+        live: Dict[int, Tuple[int, List[int]]] = {}
+        for index, slot in self._live_slots():
+            size, indexes = live.get(slot[1], (0, []))
+            indexes.append(index)
+            live[slot[1]] = (size + _RECORD.size + slot[2] + slot[4], indexes)
+        return live
+
+    def _resize(self) -> None:
+        entries = {}
+        for _, slot in self._live_slots():
+            entries[slot[0]] = slot
+        self._write_index(entries, _capacity_for(len(entries)))
+
+    def _write_index(self, slots: Dict[int, tuple], capacity: int) -> None:
+        """写一份新索引替换旧索引，旧索引置退役标记（持写锁调用）"""
+        path = os.path.join(self.root, _INDEX_FILE_NAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        generation = self._generation + 1
+        total_bytes = sum(slot[4] for slot in slots.values())
+        with open(tmp_path, "w+b") as f:
+            f.truncate(_INDEX_HEADER_SIZE + capacity * _SLOT.size)
+            index = mmap.mmap(f.fileno(), 0)
+            inode = os.fstat(f.fileno()).st_ino
+        _INDEX_HEADER.pack_into(
+            index, 0, _INDEX_MAGIC, capacity, len(slots), len(slots), 0, generation, total_bytes
+        )
+        for key_hash, slot in slots.items():
+            position = key_hash % capacity
+            while _SLOT.unpack_from(index, _INDEX_HEADER_SIZE + position * _SLOT.size)[0]:
+                position = (position + 1) % capacity
+            _SLOT.pack_into(index, _INDEX_HEADER_SIZE + position * _SLOT.size, *slot)
+        index.flush()
+        os.replace(tmp_path, path)
+        if self._index is not None:
+            _U32.pack_into(self._index, _RETIRED_OFFSET, 1)
+        self._map(index, inode)
+
+    def _rebuild_index(self) -> None:
+        """按段号顺序重放全部记录重建索引（持写锁调用）"""
+        slots: Dict[int, tuple] = {}
+        segments = self._segments()
+        for segment in segments:
+            path = self.segment_path(segment)
+            stamp = int(os.path.getmtime(path))
+            valid_end = len(_SEGMENT_MAGIC)
+            with open(path, "rb") as f:
+                if f.read(len(_SEGMENT_MAGIC)) != _SEGMENT_MAGIC:
+                    logger.warning(f"跳过无法识别的段文件 {path}")
+                    continue
+                while True:
+                    offset = f.tell()
+                    header = f.read(_RECORD.size)
+                    if len(header) < _RECORD.size:
+                        break
+                    crc, key_length, length = _RECORD.unpack(header)
+                    key = f.read(key_length)
+                    data = f.read(length) if length != _TOMBSTONE else None
+                    if len(key) < key_length or (data is not None and (
+                            len(data) < length or zlib.crc32(data) != crc)):
+                        logger.warning(f"段文件 {path} 在偏移 {offset} 处不完整，忽略其后内容")
+                        break
+                    key_hash = _key_hash(key)
+                    if data is None:
+                        slots.pop(key_hash, None)
+                    else:
+                        slots[key_hash] = (key_hash, segment, key_length, offset, length, stamp, 0)
+                    valid_end = f.tell()
+            if segment == segments[-1] and valid_end < os.path.getsize(path):
+                # 最后一个段的尾部是崩溃时未写完的记录，截掉后继续追加
+                os.truncate(path, valid_end)
+        self._write_index(slots, _capacity_for(len(slots)))
+        logger.info(f"已重建打包存储索引 [{self.name}]: {len(slots)} 条，{len(segments)} 个段文件")
+
+    # ----------------------------------------------------------------
+    # 段文件
+    # ----------------------------------------------------------------
+
+    def _segments(self) -> List[int]:
+        segments = []
+        for file_name in os.listdir(self.root):
+            if file_name.startswith("seg-") and file_name.endswith(".pack"):
+                try:
+                    segments.append(int(file_name[4:-5]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _segment_size(self, segment: int) -> int:
+        try:
+            return os.path.getsize(self.segment_path(segment))
+        except OSError:
+            return 0
+
+    def _append(self, key: bytes, data: Optional[bytes]) -> Tuple[int, int]:
+        """追加一条记录（data 为 None 时为墓碑），返回 (段号, 记录偏移)（持写锁调用）"""
+        if data is None:
+            record = _RECORD.pack(0, len(key), _TOMBSTONE) + key
+        else:
+            record = _RECORD.pack(zlib.crc32(data), len(key), len(data)) + key + data
+        return self._append_record(record)
+
+    def _append_record(self, record: bytes) -> Tuple[int, int]:
+        segments = self._segments()
+        segment = segments[-1] if segments else 1
+        size = self._segment_size(segment) if segments else 0
+        if not segments or (size > len(_SEGMENT_MAGIC) and size + len(record) > self.segment_bytes):
+            segment = segments[-1] + 1 if segments else 1
+            size = 0
+        with open(self.segment_path(segment), "ab") as f:
+            if size == 0:
+                f.write(_SEGMENT_MAGIC)
+            offset = f.tell()
+            f.write(record)
+        return segment, offset
+
+    def _store(self, key: bytes, data: bytes) -> None:
+        segment, offset = self._append(key, data)
+        self._insert(key, segment, offset, len(data))
+
+    def _fd(self, segment: int) -> Optional[int]:
+        fd = self._fds.get(segment)
+        if fd is None:
+            try:
+                fd = os.open(self.segment_path(segment), os.O_RDONLY)
+            except FileNotFoundError:
+                return None
+            self._fds[segment] = fd
+        return fd
+
+    def _pread(self, segment: int, length: int, offset: int) -> Optional[bytes]:
+        fd = self._fd(segment)
+        if fd is None:
+            return None
+        data = os.pread(fd, length, offset)
+        return data if len(data) == length else None
+
+    def _close_fds(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def _unlink_segment(self, segment: int) -> None:
+        fd = self._fds.pop(segment, None)
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.remove(self.segment_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _compact_segment(self, segment: int, indexes: List[int]) -> int:
+        """
+        把该段的有效记录复制到当前段后删除该段，返回复制的字节数（持写锁调用）。
+        indexes 为该段记录所在的槽位号，其中已被删除或移走的槽位跳过。
+        """
+        moved = 0
+        for index in indexes:
+            slot = self._slot(index)
+            if slot[0] == 0 or slot[1] != segment:
+                continue
+            size = _RECORD.size + slot[2] + slot[4]
+            record = self._pread(segment, size, slot[3])
+            if record is None:
+                continue
+            new_segment, new_offset = self._append_record(record)
+            if new_segment == segment:
+                # 被压缩的段不会再被追加（它不是最后一个段），保险起见
+                raise RuntimeError(f"压缩时追加到了正在压缩的段 {segment}")
+            self._set_slot(index, (slot[0], new_segment, slot[2], new_offset, *slot[4:]))
+            moved += size
+        # 代数加一：其他进程据此关闭指向已删除段的文件描述符
+        self._add_to_header(_GENERATION_OFFSET, 1)
+        self._generation = _U32.unpack_from(self._index, _GENERATION_OFFSET)[0]
+        self._unlink_segment(segment)
+        return moved
+
+    # ----------------------------------------------------------------
+    # 淘汰、导入与锁
+    # ----------------------------------------------------------------
+
+    def _evict_over_quota(self, keep: Optional[bytes] = None) -> List[str]:
+        """超出配额时淘汰到 LOW_WATERMARK 以下，返回被淘汰的 key（持写锁调用）"""
+        total = _U64.unpack_from(self._index, _TOTAL_BYTES_OFFSET)[0]
+        if self.max_bytes <= 0 or total <= self.max_bytes:
+            return []
+
+        if self.policy == LFU:
+            order = sorted(self._live_slots(), key=lambda item: (item[1][6], item[1][5]))
+        else:
+            order = sorted(self._live_slots(), key=lambda item: item[1][5])
+        target = self.max_bytes * LOW_WATERMARK
+        evicted = []
+        for index, slot in order:
+            if total <= target:
+                break
+            key = self._pread(slot[1], slot[2], slot[3] + _RECORD.size)
+            if key is None or key == keep:
+                continue
+            self._delete_slot(index, slot, key)
+            total -= slot[4]
+            evicted.append(key.decode("utf-8"))
+
+        self.evictions += len(evicted)
+        if evicted:
+            logger.info(f"缓存超出配额，已淘汰 {len(evicted)} 条 [{self.name}]，当前 {total} 字节")
+        return evicted
+
+    def _notify_evicted(self, keys: List[str]) -> None:
+        if self.on_evict is None:
+            return
+        for key in keys:
+            try:
+                self.on_evict(key)
+            except Exception as e:
+                logger.error(f"缓存淘汰回调失败 [{self.name}] {key}: {str(e)}")
+
+    def _import_legacy(self, key: str) -> Optional[Tuple[int, tuple]]:
+        """旧目录中的同名文件收入段文件并删除（持 self._lock 调用）"""
+        legacy_path = os.path.join(self.legacy_root, key)
+        try:
+            with open(legacy_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        key_bytes = key.encode("utf-8")
+        with self._writer():
+            self._store(key_bytes, data)
+            evicted = self._evict_over_quota(keep=key_bytes)
+        self._notify_evicted(evicted)
+        try:
+            os.remove(legacy_path)
+        except OSError:
+            pass
+        return self._find(key_bytes)
+
+    @contextmanager
+    def _writer(self):
+        """跨进程写锁（目录下 .lock 文件的 flock），可重入"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._lock_fd = os.open(os.path.join(self.root, _LOCK_FILE_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            # 拿到锁之前其他进程可能扩容或重建了索引
+            if self._index is not None and self._loaded:
+                try:
+                    replaced = os.stat(os.path.join(self.root, _INDEX_FILE_NAME)).st_ino != self._index_inode
+                except FileNotFoundError:
+                    replaced = True
+                if replaced:
+                    self._open_index()
+            self._refresh()
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _clean_staging(self) -> None:
+        cutoff = time.time() - _STAGING_MAX_AGE
+        for entry in os.scandir(self.staging_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                continue
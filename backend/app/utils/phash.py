@@ -0,0 +1,240 @@
+"""
+感知哈希（dHash）与汉明距离索引。
+
+dHash：灰度缩放到 9x8，逐行比较相邻像素亮度，得到 64 位指纹。
+直接在扫描时已解码、已缩小的缩略图上计算，几乎没有额外开销；
+连拍、重新导出、轻微裁剪/压缩的照片指纹的汉明距离通常在 10 以内。
+
+HashIndex 把所有指纹打包成 uint64 NumPy 数组，查询时整体 XOR 后
+用 256 项查找表按字节统计 1 的个数，100 万条约几十毫秒。
+重复分组用鸽巢原理分段：距离 <= d 的两个指纹，把 64 位切成 d+1 段后
+至少有一段完全相同，只需比较同段值的指纹（按段值排序后逐间隔向量化比较）。
+"""
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+# 重复分组时同段值的桶内最多与后面多少个元素比较（不超过该大小的桶是精确的两两比较）：
+# 取该值与指纹均匀分布时平均桶大小的 _BUCKET_SPREAD 倍中较大的一个
+_BUCKET_LIMIT = 128
+_BUCKET_SPREAD = 4
+
+# 每个字节中 1 的个数
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_bitwise_count = getattr(np, "bitwise_count", None)
+
+
+def dhash(img: Image.Image) -> int:
+    """计算 64 位 dHash（无符号整数）"""
+    gray = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def to_signed(value: int) -> int:
+    """无符号 64 位 → 有符号（数据库 BIGINT 是有符号的）"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count("1")
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """uint64 数组逐元素统计 1 的个数（NumPy >= 2.0 直接用硬件 popcount）"""
+    if _bitwise_count is not None:
+        return _bitwise_count(values)
+    return _POPCOUNT_LUT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class HashIndex:
+    """
+    进程内指纹索引：ids / hashes 两个平行数组，追加写入先进缓冲区，
+    查询前合并。loader 返回 (id, 有符号 hash) 列表，首次查询或 invalidate 后调用。
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[int, int]]]):
+        self._loader = loader
+        self._ids = np.empty(0, dtype=np.int64)
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._pending: List[Tuple[int, int]] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+        # 索引内容每次变化（加载 / 追加 / 失效）递增，供上层缓存计算结果
+        self.version = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_ready()
+            return len(self._ids)
+
+    def add(self, image_id: int, value: int) -> None:
+        """登记新指纹（未加载时忽略，首次查询会从数据库完整加载）"""
+        with self._lock:
+            if self._loaded:
+                self._pending.append((image_id, to_unsigned(value)))
+                self.version += 1
+
+    def invalidate(self) -> None:
+        """丢弃内存索引（全盘扫描重建 ID 后调用）"""
+        with self._lock:
+            self._loaded = False
+            self.version += 1
+            self._pending.clear()
+            self._ids = np.empty(0, dtype=np.int64)
+            self._hashes = np.empty(0, dtype=np.uint64)
+
+    def search(
+        self, value: int, max_distance: int, exclude_id: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """返回 [(image_id, 距离)]，按距离升序"""
+        with self._lock:
+            self._ensure_ready()
+            ids, hashes = self._ids, self._hashes
+
+        distances = _popcount(hashes ^ np.uint64(to_unsigned(value)))
+        matched = np.nonzero(distances <= max_distance)[0]
+        matched = matched[np.argsort(distances[matched], kind="stable")]
+        return [
+            (int(ids[i]), int(distances[i]))
+            for i in matched
+            if exclude_id is None or ids[i] != exclude_id
+        ]
+
+    def duplicate_groups(self, max_distance: int) -> List[List[int]]:
+        """按汉明距离 <= max_distance 把图片连成组（并查集），返回每组的 image_id 列表"""
+        with self._lock:
+            self._ensure_ready()
+            ids, hashes = self._ids, self._hashes
+        if len(ids) == 0:
+            return []
+
+        # 完全相同的指纹先合并，后续只在不同指纹之间比较
+        unique_hashes, inverse = np.unique(hashes, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # 近黑 / 近白画面聚在一起时候选对可达千万级，并查集整体向量化
+        groups = _UnionFind(len(unique_hashes))
+        if max_distance > 0 and len(unique_hashes) > 1:
+            for lefts, rights in self._candidate_pairs(unique_hashes, max_distance):
+                groups.union(lefts, rights)
+        labels = groups.labels()[inverse]
+
+        # 只保留成员数 > 1 的组，按组标签排序后切分（单张图片的组占绝大多数，先滤掉）
+        _, label_index, label_counts = np.unique(labels, return_inverse=True, return_counts=True)
+        grouped = np.flatnonzero(label_counts[label_index.reshape(-1)] > 1)
+        order = grouped[np.argsort(labels[grouped], kind="stable")]
+        boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+        return [
+            sorted(ids[members].tolist())
+            for members in np.split(order, boundaries)
+            if len(members) > 1
+        ]
+
+    # ----------------------------------------------------------------
+    # 内部实现
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _candidate_pairs(hashes: np.ndarray, max_distance: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        鸽巢分段：每段按段值分桶（段值相同的按完整指纹排序后连续存放），
+        只比较同一桶内的元素：依次比较间隔 1、2、3… 的元素（整体向量化），
+        每轮只保留桶内还有这么远的元素，代价为各桶大小的平方和。
+        近黑 / 近白画面等大量指纹共享段值时桶会很大，间隔最多到 _BUCKET_LIMIT：
+        大桶内只与排序后相邻的若干个元素比较（近似），代价与桶大小成线性。
+        上限按均匀分布时的平均桶大小放宽（见 _BUCKET_LIMIT），正常分布的指纹仍是精确结果。
+        产出距离 <= max_distance 的下标对数组 (left, right)。
+        """
+        segments = min(max_distance + 1, HASH_BITS)
+        bounds = np.linspace(0, HASH_BITS, segments + 1, dtype=np.int64)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            bits = int(end - start)
+            limit = max(_BUCKET_LIMIT, _BUCKET_SPREAD * ((len(hashes) >> bits) + 1))
+            # 循环右移使本段位于最高位：按移位后的值排序即按 (段值, 其余位) 排序
+            rotated = (hashes >> np.uint64(end)) | (hashes << np.uint64(HASH_BITS - end)) \
+                if end < HASH_BITS else hashes
+            order = np.argsort(rotated)
+            sorted_hashes = hashes[order]
+            sorted_keys = rotated[order] >> np.uint64(HASH_BITS - bits)
+
+            bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            sizes = np.diff(np.r_[bucket_starts, len(order)])
+            # 各元素所在桶的结束位置；只有一个元素的桶不参与比较
+            ends = np.repeat(bucket_starts + sizes, sizes)
+            current = np.flatnonzero(np.repeat(sizes, sizes) > 1)
+            ends = ends[current]
+
+            gap = 1
+            while len(current) and gap <= limit:
+                inside = current + gap < ends
+                current, ends = current[inside], ends[inside]
+                distances = _popcount(sorted_hashes[current] ^ sorted_hashes[current + gap])
+                hit = current[distances <= max_distance]
+                if len(hit):
+                    yield order[hit], order[hit + gap]
+                gap += 1
+
+    def _ensure_ready(self) -> None:
+        if not self._loaded:
+            rows = list(self._loader())
+            self._ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            self._hashes = np.fromiter(
+                (to_unsigned(r[1]) for r in rows), dtype=np.uint64, count=len(rows)
+            )
+            self._pending.clear()
+            self._loaded = True
+        elif self._pending:
+            pending_ids, pending_hashes = zip(*self._pending)
+            self._ids = np.concatenate([self._ids, np.array(pending_ids, dtype=np.int64)])
+            self._hashes = np.concatenate(
+                [self._hashes, np.array(pending_hashes, dtype=np.uint64)]
+            )
+            self._pending.clear()
+
+
+class _UnionFind:
+    """
+    向量化并查集：parent[i] <= i，根节点 parent[i] == i。
+    一次合并一批下标对，每轮把根不同的对中较大的根挂到较小的根下，直到各对同根。
+    """
+
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+
+    def find(self, nodes: np.ndarray) -> np.ndarray:
+        parent = self.parent
+        roots = parent[nodes]
+        while True:
+            above = parent[roots]
+            if np.array_equal(above, roots):
+                break
+            roots = above
+        # 路径压缩
+        parent[nodes] = roots
+        return roots
+
+    def union(self, lefts: np.ndarray, rights: np.ndarray) -> None:
+        while len(lefts):
+            left_roots, right_roots = self.find(lefts), self.find(rights)
+            differ = left_roots != right_roots
+            if not differ.any():
+                return
+            lefts, rights = lefts[differ], rights[differ]
+            low = np.minimum(left_roots[differ], right_roots[differ])
+            high = np.maximum(left_roots[differ], right_roots[differ])
+            # 同一个根可能要挂到多个根下：先挂到其中最小的，其余的下一轮再合并
+            order = np.lexsort((low, high))
+            roots, first = np.unique(high[order], return_index=True)
+            self.parent[roots] = low[order][first]
+
+    def labels(self) -> np.ndarray:
+        return self.find(np.arange(len(self.parent)))
@@ -0,0 +1,176 @@
+"""
+请求级性能剖析工具。
+
+三部分，均可通过配置单独开关：
+  1. Server-Timing：每个 /api 请求内按类别（db / serialize / fs）累计耗时，
+     在响应头中输出，浏览器 DevTools 的 Timing 面板可直接查看。
+  2. 慢查询日志：基于 SQLAlchemy cursor 事件，记录超过阈值的 SQL 语句与耗时。
+  3. 采样剖析：按采样率对请求启用 cProfile，耗时超过阈值时把结果
+     dump 到 LOGS_DIR/profiles/，可用 snakeviz / pstats 查看。
+     cProfile 剖析的是整个事件循环线程：被剖析请求 await 期间执行的其他请求
+     也会计入结果。同一时间只剖析一个请求（其余被采样的请求在 Server-Timing 中
+     标记 profile;desc="busy"）；剖析期间有其他请求并发执行时，文件名带 _mixed
+     后缀并在日志中注明并发数。需要干净的结果时应在单请求负载下采样。
+
+耗时累计依赖 ContextVar：同步执行的 ORM 查询、以及 asyncio.create_task
+派生的协程都会继承请求上下文，因此无需在调用链上显式传递对象。
+"""
+import cProfile
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import logger
+from sqlalchemy import event
+
+# 当前请求的耗时累计：{类别: [秒数, 次数]}；不在请求内时为 None
+_request_timings: ContextVar[Optional[Dict[str, list]]] = ContextVar(
+    "request_timings", default=None
+)
+
+# cProfile 同一线程只能有一个活动 profiler，用锁保证同时最多剖析一个请求
+_profiler_lock = threading.Lock()
+
+# 正在处理的 /api 请求数，以及当前剖析期间并发执行过的其他请求数
+# （只在事件循环线程中读写）
+_in_flight = 0
+_profile_overlap = 0
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """把一段耗时累加到当前请求的指定类别（不在请求内时忽略）"""
+    timings = _request_timings.get()
+    if timings is None:
+        return
+    entry = timings.setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += 1
+
+
+@contextmanager
+def timing(name: str) -> Iterator[None]:
+    """计时上下文：with timing("serialize"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+def install_query_hooks(engine) -> None:
+    """注册 SQLAlchemy 事件：累计 db 耗时，并记录慢查询"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        record_timing("db", elapsed)
+
+        if settings.SLOW_QUERY_MS > 0 and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            logger.warning(
+                f"慢查询 {elapsed * 1000:.1f}ms: {' '.join(statement.split())[:1000]}"
+            )
+
+
+def _format_server_timing(timings: Dict[str, list], total: float) -> str:
+    parts = []
+    for name, (seconds, count) in timings.items():
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{count}x"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class ProfilingMiddleware:
+    """
+    纯 ASGI 中间件：为 /api 请求建立耗时上下文、输出 Server-Timing 头，
+    并按采样率对请求做 cProfile 剖析。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight, _profile_overlap
+        timings: Dict[str, list] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        if _profiler_lock.locked():
+            _profile_overlap += 1
+        profiler, profile_state = self._maybe_start_profiler()
+        if profiler is not None:
+            # 开始剖析时仍在执行的请求
+            _profile_overlap = _in_flight
+        _in_flight += 1
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING_ENABLED:
+                headers = list(message.get("headers", []))
+                value = _format_server_timing(timings, time.perf_counter() - start)
+                if profile_state:
+                    value += f', profile;desc="{profile_state}"'
+                headers.append((b"server-timing", value.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _in_flight -= 1
+            _request_timings.reset(token)
+            if profiler is not None:
+                self._finish_profiler(
+                    profiler, scope, time.perf_counter() - start, _profile_overlap
+                )
+
+    @staticmethod
+    def _maybe_start_profiler() -> Tuple[Optional[cProfile.Profile], Optional[str]]:
+        """返回 (profiler, 状态)：未被采样时状态为 None，另一个请求正在剖析时为 "busy" """
+        if settings.PROFILE_SAMPLE_RATE <= 0 or random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return None, None
+        if not _profiler_lock.acquire(blocking=False):
+            return None, "busy"
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler, "on"
+
+    @staticmethod
+    def _finish_profiler(profiler: cProfile.Profile, scope, elapsed: float, overlap: int) -> None:
+        try:
+            profiler.disable()
+            if elapsed * 1000 < settings.PROFILE_THRESHOLD_MS:
+                return
+
+            profile_dir = settings.LOGS_DIR / "profiles"
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            safe_path = scope.get("path", "").strip("/").replace("/", "_") or "root"
+            file_name = (
+                f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+                f"_{scope.get('method', '')}_{safe_path[:80]}"
+                f"{'_mixed' if overlap else ''}.prof"
+            )
+            profiler.dump_stats(str(profile_dir / file_name))
+            mixed = f"（期间另有 {overlap} 个请求并发执行，结果包含其耗时）" if overlap else ""
+            logger.warning(
+                f"慢请求 {elapsed * 1000:.1f}ms {scope.get('method')} {scope.get('path')}，"
+                f"剖析结果已保存: {file_name}{mixed}"
+            )
+        except Exception as e:
+            logger.error(f"保存剖析结果失败: {str(e)}")
+        finally:
+            _profiler_lock.release()
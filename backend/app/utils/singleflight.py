@@ -0,0 +1,34 @@
+"""
+单飞（single-flight）：同一 key 的并发请求只执行一次，其余请求等待同一结果。
+
+用于按需生成的缓存文件（HEIC 转换等）：同一张图被多个请求同时打开时，
+只做一次解码/编码，避免重复占用 CPU 并发写同一个文件。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            # shield：某个等待者被取消（客户端断开）不影响其他等待者
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        # 取走异常：所有等待者都已取消时，避免 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
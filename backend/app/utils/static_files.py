@@ -0,0 +1,117 @@
+"""
+带访问统计的静态文件路由。
+
+缩略图、HEIC 转换结果通过 StaticFiles 直接下发，不经过 API；
+这里在响应成功时刷新 DiskCache 的访问记录（LRU / LFU 依据），
+404 时计为未命中，命中率统计因此覆盖真实的浏览流量。
+
+缩略图使用打包存储（THUMBNAIL_STORE=pack）时由 PackedStaticFiles 下发：
+按 key 查索引得到 (段文件, 偏移, 长度)，ETag 即该位置（记录只追加不修改，位置不变
+内容就不变），If-None-Match 匹配时返回 304。ASGI 服务器提供
+http.response.zerocopysend 扩展时直接把段文件的这一段交给服务器 sendfile，
+否则 pread 一次后整体发送（缩略图只有十几 KB）。
+"""
+import asyncio
+import os
+from typing import Optional
+
+from app.utils.disk_cache import DiskCache
+from app.utils.pack_store import PackRef, PackStore
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+_ZEROCOPY = "http.response.zerocopysend"
+
+
+class CachedStaticFiles(StaticFiles):
+
+    def __init__(self, *, cache: DiskCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    async def get_response(self, path: str, scope: Scope):
+        try:
+            response = await super().get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code == 404:
+                self.cache.record_miss()
+            raise
+        # 304 表示浏览器缓存仍有效，同样算一次访问
+        if response.status_code in (200, 304):
+            self.cache.touch(path)
+        return response
+
+
+class PackedResponse(Response):
+    """打包存储中一条记录的响应体（见模块说明）"""
+
+    def __init__(self, store: PackStore, key: str, ref: PackRef, headers: dict, media_type: str):
+        super().__init__(headers=headers, media_type=media_type)
+        self.store = store
+        self.key = key
+        self.ref = ref
+        self.headers["content-length"] = str(ref.length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if _ZEROCOPY in scope.get("extensions", {}):
+            fd = os.open(self.store.segment_path(self.ref.segment), os.O_RDONLY)
+            try:
+                await send({"type": "http.response.start", "status": self.status_code,
+                            "headers": self.raw_headers})
+                if scope["method"] != "HEAD":
+                    await send({"type": _ZEROCOPY, "file": fd,
+                                "offset": self.ref.offset, "count": self.ref.length})
+                else:
+                    await send({"type": "http.response.body", "body": b""})
+            finally:
+                os.close(fd)
+            return
+
+        body = b""
+        if scope["method"] != "HEAD":
+            data = await asyncio.to_thread(self.store.load, self.key, self.ref)
+            if data is None:
+                # 响应头尚未发出：记录损坏时按不存在处理
+                await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+                return
+            body = data
+        await send({"type": "http.response.start", "status": self.status_code,
+                    "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def packed_response(
+    store: PackStore, key: str, request_headers: Headers, media_type: str = "image/jpeg"
+) -> Optional[Response]:
+    """key 对应的响应（200 / 304），不存在时返回 None"""
+    ref = await asyncio.to_thread(store.get, key)
+    if ref is None:
+        return None
+    etag = f'"{ref.segment:x}-{ref.offset:x}-{ref.length:x}"'
+    headers = {"etag": etag}
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return PackedResponse(store, key, ref, headers, media_type)
+
+
+class PackedStaticFiles:
+    """按 URL 路径（即 key）从打包存储下发，替代 CachedStaticFiles"""
+
+    def __init__(self, *, store: PackStore):
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        key = os.path.normpath(os.path.join(*scope["path"].split("/")))
+        if key.startswith(".."):
+            raise HTTPException(status_code=404)
+        response = await packed_response(self.store, key, Headers(scope=scope))
+        if response is None:
+            raise HTTPException(status_code=404)
+        await response(scope, receive, send)
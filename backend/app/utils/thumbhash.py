@@ -0,0 +1,110 @@
+"""
+ThumbHash 占位图编码。
+
+ThumbHash（https://evanw.github.io/thumbhash/）把图片压缩成约 25 字节的
+低频 DCT 系数（亮度 + 两个色度通道 + 可选透明度），并带有宽高比信息。
+前端解码出 32px 左右的模糊图，在缩略图加载前立即绘制占位。
+
+这里是参考实现 rgbaToThumbHash 的 NumPy 版本：每个通道的 DCT 用两次矩阵乘法
+完成，输入为扫描时已生成的缩略图（缩到 100px 以内），耗时可以忽略。
+结果以 base64 字符串存储和传输。
+"""
+import base64
+import math
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# 参考实现要求输入不超过 100x100
+_MAX_SIZE = 100
+
+
+def _round(value: float) -> int:
+    """与 JavaScript Math.round 一致（.5 向上取整），保证与参考实现逐字节相同"""
+    return math.floor(value + 0.5)
+
+
+def _encode_channel(channel: np.ndarray, nx: int, ny: int) -> Tuple[float, List[float], float]:
+    """对一个通道做 DCT，返回 (直流分量, 归一化后的交流分量, 缩放系数)"""
+    h, w = channel.shape
+    fx = np.cos(np.pi / w * np.outer(np.arange(nx), np.arange(w) + 0.5))
+    fy = np.cos(np.pi / h * np.outer(np.arange(ny), np.arange(h) + 0.5))
+    coefficients = fy @ channel @ fx.T / (w * h)
+
+    dc = 0.0
+    ac: List[float] = []
+    # 只保留左上三角区域的系数（遍历顺序与参考实现一致）
+    for cy in range(ny):
+        cx = 0
+        while cx * ny < nx * (ny - cy):
+            f = float(coefficients[cy, cx])
+            if cx or cy:
+                ac.append(f)
+            else:
+                dc = f
+            cx += 1
+
+    scale = max((abs(f) for f in ac), default=0.0)
+    if scale:
+        ac = [0.5 + 0.5 / scale * f for f in ac]
+    return dc, ac, scale
+
+
+def encode(img: Image.Image) -> str:
+    """计算图片的 ThumbHash，返回 base64 字符串"""
+    img = img.convert("RGBA")
+    if img.width > _MAX_SIZE or img.height > _MAX_SIZE:
+        img = img.copy()
+        img.thumbnail((_MAX_SIZE, _MAX_SIZE), Image.Resampling.BILINEAR)
+    w, h = img.size
+
+    rgba = np.asarray(img, dtype=np.float64) / 255
+    rgb, alpha = rgba[..., :3], rgba[..., 3]
+
+    # 平均色（按透明度加权），透明像素用平均色填充
+    total_alpha = float(alpha.sum())
+    average = (rgb * alpha[..., None]).sum(axis=(0, 1))
+    if total_alpha:
+        average /= total_alpha
+    has_alpha = total_alpha < w * h
+    rgb = average * (1 - alpha[..., None]) + rgb * alpha[..., None]
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    l_limit = 5 if has_alpha else 7
+    lx = max(1, _round(l_limit * w / max(w, h)))
+    ly = max(1, _round(l_limit * h / max(w, h)))
+
+    l_dc, l_ac, l_scale = _encode_channel((r + g + b) / 3, max(3, lx), max(3, ly))
+    p_dc, p_ac, p_scale = _encode_channel((r + g) / 2 - b, 3, 3)
+    q_dc, q_ac, q_scale = _encode_channel(r - g, 3, 3)
+    channels = [l_ac, p_ac, q_ac]
+
+    is_landscape = w > h
+    header24 = (
+        _round(63 * l_dc)
+        | (_round(31.5 + 31.5 * p_dc) << 6)
+        | (_round(31.5 + 31.5 * q_dc) << 12)
+        | (_round(31 * l_scale) << 18)
+        | (int(has_alpha) << 23)
+    )
+    header16 = (
+        (ly if is_landscape else lx)
+        | (_round(63 * p_scale) << 3)
+        | (_round(63 * q_scale) << 9)
+        | (int(is_landscape) << 15)
+    )
+    data = [header24 & 255, (header24 >> 8) & 255, header24 >> 16, header16 & 255, header16 >> 8]
+
+    if has_alpha:
+        a_dc, a_ac, a_scale = _encode_channel(alpha, 5, 5)
+        data.append(_round(15 * a_dc) | (_round(15 * a_scale) << 4))
+        channels.append(a_ac)
+
+    # 交流分量每个 4 位，两个一字节
+    nibbles = [_round(15 * f) for ac in channels for f in ac]
+    if len(nibbles) % 2:
+        nibbles.append(0)
+    data.extend(nibbles[i] | (nibbles[i + 1] << 4) for i in range(0, len(nibbles), 2))
+
+    return base64.b64encode(bytes(data)).decode("ascii")
@@ -0,0 +1,230 @@
+"""
+流式 ZIP64 打包（只存储不压缩）。
+
+设计说明：
+  照片与视频本身已经压缩过，再 deflate 只会白白消耗 CPU，因此所有条目都用
+  store 模式。store 模式下每个条目的字节数只取决于文件名与文件大小，
+  整个归档的长度在开始传输前即可算出，于是：
+
+    - 可以返回 Content-Length，浏览器能显示进度；
+    - 支持 Range 续传：从任意偏移量开始生成，偏移量之前的内容不发送。
+
+  CRC32 要读完文件才知道，放在文件数据之后的数据描述符（通用标志位 3）
+  和中央目录中，本地文件头里的 CRC 填 0。续传时跳过的文件仍需读一遍以计算
+  CRC（只读磁盘，不占带宽）；不在请求范围内、之后也用不到 CRC 的部分不读。
+
+  所有条目都带 ZIP64 扩展字段，单个文件与整个归档都不受 4 GiB 限制。
+  内存占用只有一个读块（DOWNLOAD_CHUNK_KB）加条目列表，与归档大小无关。
+
+  归档内容由条目列表 (文件名, 大小, mtime) 决定，etag 据此计算：
+  两次请求之间文件发生变化时 etag 不同，If-Range 不匹配则重新完整下载。
+"""
+import hashlib
+import struct
+import time
+import zlib
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_DATA_DESCRIPTOR = struct.Struct("<IIQQ")
+_ZIP64_LOCAL_EXTRA = struct.Struct("<HHQQ")
+_ZIP64_CENTRAL_EXTRA = struct.Struct("<HHQQQ")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+
+# 需要 ZIP64 支持的最低版本（4.5）
+_VERSION = 45
+# 通用标志：位 3 = CRC 与大小在数据描述符中，位 11 = 文件名为 UTF-8
+_FLAGS = 0x0008 | 0x0800
+# 创建系统为 Unix，外部属性携带普通文件权限 0644
+_VERSION_MADE_BY = (3 << 8) | _VERSION
+_EXTERNAL_ATTR = 0o100644 << 16
+_MAX32 = 0xFFFFFFFF
+_MAX16 = 0xFFFF
+
+
+class ZipEntry(NamedTuple):
+    arcname: str
+    path: str
+    size: int
+    mtime: float
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStream:
+
+    def __init__(self, entries: List[ZipEntry], chunk_size: int = 1024 * 1024):
+        self.entries = entries
+        self.chunk_size = chunk_size
+        self._names = [entry.arcname.encode("utf-8") for entry in entries]
+        self._dates = [_dos_datetime(entry.mtime) for entry in entries]
+
+        # 各条目本地文件头的偏移量，以及中央目录的位置
+        self._offsets = []
+        offset = 0
+        for name, entry in zip(self._names, entries):
+            self._offsets.append(offset)
+            offset += self._local_header_size(name) + entry.size + _DATA_DESCRIPTOR.size
+        self._central_offset = offset
+        self._central_size = sum(
+            _CENTRAL_HEADER.size + len(name) + _ZIP64_CENTRAL_EXTRA.size for name in self._names
+        )
+        self.size = (
+            self._central_offset + self._central_size
+            + _ZIP64_END.size + _ZIP64_LOCATOR.size + _END.size
+        )
+
+    @property
+    def etag(self) -> str:
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(f"{entry.arcname}\0{entry.size}\0{entry.mtime}\n".encode("utf-8"))
+        return f'"{digest.hexdigest()[:20]}"'
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """生成归档中 [start, end]（闭区间，end 默认到末尾）的字节"""
+        end = self.size - 1 if end is None else end
+        crcs: List[Optional[int]] = [None] * len(self.entries)
+
+        def clip(data: bytes, position: int) -> bytes:
+            return data[max(start - position, 0):end + 1 - position]
+
+        for index, entry in enumerate(self.entries):
+            position = self._offsets[index]
+            if position > end:
+                return
+            header = self._local_header(index)
+            if position + len(header) > start:
+                yield clip(header, position)
+            position += len(header)
+
+            # 数据段完全在 start 之前时推迟读取：只有后面用到 CRC 时才读
+            if position + entry.size > start:
+                crc = 0
+                for chunk in self._read(entry):
+                    crc = zlib.crc32(chunk, crc)
+                    if position <= end and position + len(chunk) > start:
+                        yield clip(chunk, position)
+                    position += len(chunk)
+                    if position > end:
+                        return
+                crcs[index] = crc
+            else:
+                position += entry.size
+
+            if position + _DATA_DESCRIPTOR.size > start:
+                if position > end:
+                    return
+                descriptor = _DATA_DESCRIPTOR.pack(
+                    0x08074B50, self._crc(crcs, index), entry.size, entry.size
+                )
+                yield clip(descriptor, position)
+
+        if self._central_offset + self._central_size <= start:
+            position = self._central_offset + self._central_size
+        else:
+            position = self._central_offset
+            for index, name in enumerate(self._names):
+                if position > end:
+                    return
+                length = _CENTRAL_HEADER.size + len(name) + _ZIP64_CENTRAL_EXTRA.size
+                if position + length > start:
+                    yield clip(self._central_header(index, self._crc(crcs, index)), position)
+                position += length
+
+        if position <= end:
+            yield clip(self._end_records(), position)
+
+    # ----------------------------------------------------------------
+    # 记录结构
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _local_header_size(name: bytes) -> int:
+        return _LOCAL_HEADER.size + len(name) + _ZIP64_LOCAL_EXTRA.size
+
+    def _local_header(self, index: int) -> bytes:
+        name, size = self._names[index], self.entries[index].size
+        dos_time, dos_date = self._dates[index]
+        return _LOCAL_HEADER.pack(
+            0x04034B50, _VERSION, _FLAGS, 0, dos_time, dos_date,
+            0, _MAX32, _MAX32, len(name), _ZIP64_LOCAL_EXTRA.size,
+        ) + name + _ZIP64_LOCAL_EXTRA.pack(0x0001, 16, size, size)
+
+    def _central_header(self, index: int, crc: int) -> bytes:
+        name, size = self._names[index], self.entries[index].size
+        dos_time, dos_date = self._dates[index]
+        return _CENTRAL_HEADER.pack(
+            0x02014B50, _VERSION_MADE_BY, _VERSION, _FLAGS, 0, dos_time, dos_date,
+            crc, _MAX32, _MAX32, len(name), _ZIP64_CENTRAL_EXTRA.size, 0, 0, 0,
+            _EXTERNAL_ATTR, _MAX32,
+        ) + name + _ZIP64_CENTRAL_EXTRA.pack(0x0001, 24, size, size, self._offsets[index])
+
+    def _end_records(self) -> bytes:
+        count = len(self.entries)
+        zip64_end_offset = self._central_offset + self._central_size
+        return (
+            _ZIP64_END.pack(
+                0x06064B50, _ZIP64_END.size - 12, _VERSION_MADE_BY, _VERSION, 0, 0,
+                count, count, self._central_size, self._central_offset,
+            )
+            + _ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+            + _END.pack(0x06054B50, _MAX16, _MAX16, _MAX16, _MAX16, _MAX32, _MAX32, 0)
+        )
+
+    # ----------------------------------------------------------------
+    # 文件数据
+    # ----------------------------------------------------------------
+
+    def _crc(self, crcs: List[Optional[int]], index: int) -> int:
+        if crcs[index] is None:
+            crc = 0
+            for chunk in self._read(self.entries[index]):
+                crc = zlib.crc32(chunk, crc)
+            crcs[index] = crc
+        return crcs[index]
+
+    def _read(self, entry: ZipEntry) -> Iterator[bytes]:
+        """按块读取文件，恰好读 entry.size 字节；文件在打包期间变短时报错中止传输"""
+        remaining = entry.size
+        with open(entry.path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"文件在打包期间被修改: {entry.path}")
+                remaining -= len(chunk)
+                yield chunk
+
+
+def parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个 bytes 区间，返回闭区间 (start, end)；没有 Range 头或格式不支持时返回 None
+    （按完整响应处理），区间无法满足时抛出 ValueError。
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N：最后 N 个字节
+        if not end:
+            raise ValueError(header)
+        return max(total - end, 0), total - 1
+    end = total - 1 if end is None else min(end, total - 1)
+    if start >= total or end < start:
+        raise ValueError(header)
+    return start, end
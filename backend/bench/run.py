@@ -0,0 +1,593 @@
+"""
+基准测试入口。
+
+在临时工作目录中生成（或使用指定的）图库，依次运行场景，结果输出为 JSON，
+便于在 CI 或本地对比改动前后的回归情况。
+
+用法（在 backend 目录下）：
+  python -m bench.run --out bench_result.json
+  python -m bench.run --library /path/to/photos --scenarios cold_scan,api_reads
+
+场景：
+  cold_scan         空库全量扫描（InitializationService.initialize_database）
+  incremental_scan  新增约 10% 文件后，通过 FolderService 补偿验证逐个文件夹增量入库
+  validation        无变更时对所有文件夹做一次验证（纯 diff 开销）
+  api_reads         启动 uvicorn，并发读取分页接口，统计 p50/p99 延迟
+  api_payload       图片列表序列化前后对比：响应体积（含 gzip/brotli）与序列化耗时
+  startup           导入 main 的耗时，以及空库 / 已扫描库启动到首次响应、初始扫描完成的耗时
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -----------------------------------------------------------------------
+# 工具函数
+# -----------------------------------------------------------------------
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """延迟统计（毫秒）"""
+    to_ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    return {
+        "count": len(latencies),
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(max(latencies) if latencies else None),
+    }
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值 RSS（MB）；Linux 上 ru_maxrss 单位为 KB，macOS 为字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(rss / divisor, 1)
+
+
+def stage_breakdown() -> Dict[str, Dict[str, float]]:
+    """从 /metrics 的扫描阶段直方图读取各阶段累计耗时"""
+    from app.utils.metrics import SCAN_STAGE_SECONDS
+
+    return {
+        key[0]: {"count": child.count, "seconds": round(child.sum, 4)}
+        for key, child in SCAN_STAGE_SECONDS.children().items()
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BenchContext:
+    """各场景共享的环境：图库路径、数据目录、命令行参数"""
+
+    def __init__(self, library: str, data_root: str, args: argparse.Namespace):
+        self.library = library
+        self.data_root = data_root
+        self.args = args
+        self.scanned = False
+
+    def env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["DATA_ROOT"] = self.data_root
+        env["IMAGES_DIR"] = self.library
+        return env
+
+
+# -----------------------------------------------------------------------
+# 场景
+# -----------------------------------------------------------------------
+def bench_cold_scan(ctx: BenchContext) -> Dict:
+    from app.database.database import SessionLocal, create_tables, engine
+    from app.database.models import Base, FailedImage, Image
+    from app.services.init_service import InitializationService
+
+    Base.metadata.drop_all(bind=engine)
+    create_tables()
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        ok = asyncio.run(InitializationService(db).initialize_database())
+        elapsed = time.perf_counter() - start
+
+        images = db.query(Image).count()
+        failed = db.query(FailedImage).count()
+    finally:
+        db.close()
+
+    ctx.scanned = ok
+    return {
+        "ok": ok,
+        "seconds": round(elapsed, 3),
+        "images": images,
+        "failed": failed,
+        "files_per_sec": round((images + failed) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stage_breakdown(),
+    }
+
+
+def _validate_all_folders() -> List[float]:
+    """清空验证缓存后逐个文件夹验证，返回每个文件夹的耗时"""
+    from app.database.database import SessionLocal
+    from app.database.models import Folder
+    from app.services.folder_service import FolderService
+
+    FolderService.clear_all_cache()
+    latencies = []
+    db = SessionLocal()
+    try:
+        folder_ids = [row.id for row in db.query(Folder.id).order_by(Folder.id)]
+        service = FolderService(db)
+        for folder_id in folder_ids:
+            start = time.perf_counter()
+            asyncio.run(service.validate_folder_content(folder_id))
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return latencies
+
+
+def bench_incremental_scan(ctx: BenchContext) -> Dict:
+    from app.database.database import SessionLocal
+    from app.database.models import Image
+
+    if not ctx.scanned:
+        bench_cold_scan(ctx)
+
+    # 每 10 个文件复制一份，模拟 NAS 上新增的照片
+    copies = []
+    for root, _, files in os.walk(ctx.library):
+        for name in sorted(files)[::10]:
+            stem, ext = os.path.splitext(name)
+            target = os.path.join(root, f"{stem}_bench_copy{ext}")
+            shutil.copyfile(os.path.join(root, name), target)
+            copies.append(target)
+
+    db = SessionLocal()
+    try:
+        before = db.query(Image).count()
+        start = time.perf_counter()
+        latencies = _validate_all_folders()
+        elapsed = time.perf_counter() - start
+        added = db.query(Image).count() - before
+    finally:
+        db.close()
+
+    # 恢复图库，便于后续场景和重复运行
+    for path in copies:
+        os.remove(path)
+    _validate_all_folders()
+
+    return {
+        "new_files": len(copies),
+        "indexed": added,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(added / elapsed, 2) if elapsed else None,
+        "folder_latency": latency_summary(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_validation(ctx: BenchContext) -> Dict:
+    if not ctx.scanned:
+        bench_cold_scan(ctx)
+
+    start = time.perf_counter()
+    latencies = _validate_all_folders()
+    elapsed = time.perf_counter() - start
+    return {
+        "folders": len(latencies),
+        "seconds": round(elapsed, 3),
+        "folders_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "folder_latency": latency_summary(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _listing_pages(max_pages: int) -> List[list]:
+    """按文件夹取图片分页（Image 对象列表），最多 max_pages 页"""
+    from app.config import settings
+    from app.database.database import SessionLocal
+    from app.database.models import Image
+    from app.services.image_service import ImageService
+    from sqlalchemy import func
+
+    db = SessionLocal()
+    try:
+        pages = []
+        service = ImageService(db)
+        counts = db.query(Image.folder_id, func.count(Image.id)).group_by(Image.folder_id)
+        for folder_id, count in counts.order_by(Image.folder_id):
+            for page in range(1, -(-count // settings.PAGE_SIZE) + 1):
+                pages.append(service.get_folder_page(folder_id, page))
+                if len(pages) >= max_pages:
+                    return pages
+        return pages
+    finally:
+        db.close()
+
+
+def bench_api_payload(ctx: BenchContext) -> Dict:
+    """
+    图片列表序列化对比（进程内，不含网络）：
+      before  全部字段（含 exif_data）+ jsonable_encoder + 标准库 json（FastAPI 默认路径）
+      after   默认字段（不含 exif_data）+ orjson，另给出 gzip / brotli 压缩后体积
+    """
+    import gzip
+    import json
+
+    import orjson
+    from app.api.routes import _LISTING_FIELDS, _build_image_dict, _IMAGE_FIELDS
+    from app.config import settings
+    from app.utils.compression import brotli
+    from fastapi.encoders import jsonable_encoder
+
+    if not ctx.scanned:
+        bench_cold_scan(ctx)
+
+    pages = _listing_pages(ctx.args.payload_pages)
+
+    def serialize_before(images) -> bytes:
+        content = {"items": [_build_image_dict(img, tuple(_IMAGE_FIELDS)) for img in images]}
+        return json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+            indent=None, separators=(",", ":"),
+        ).encode("utf-8")
+
+    def serialize_after(images) -> bytes:
+        content = {"items": [_build_image_dict(img, _LISTING_FIELDS) for img in images]}
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+    def measure(serialize) -> Dict:
+        latencies, sizes, bodies = [], [], []
+        for images in pages:
+            start = time.perf_counter()
+            body = serialize(images)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(body))
+            bodies.append(body)
+        return {
+            "avg_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+            "serialize": latency_summary(latencies),
+        }, bodies
+
+    before, _ = measure(serialize_before)
+    after, bodies = measure(serialize_after)
+
+    def avg_compressed(compress) -> Optional[int]:
+        if not bodies:
+            return None
+        return round(sum(len(compress(body)) for body in bodies) / len(bodies))
+
+    after["gzip_avg_bytes"] = avg_compressed(
+        lambda body: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+    )
+    after["br_avg_bytes"] = avg_compressed(
+        lambda body: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    ) if brotli is not None else None
+
+    return {"pages": len(pages), "page_size": settings.PAGE_SIZE, "before": before, "after": after}
+
+
+def _start_server(ctx: BenchContext, port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env or ctx.env(),
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(ctx.data_root, "server.log"), "ab"),
+    )
+
+
+def _wait_ready(base_url: str, timeout: float = 120.0) -> float:
+    """轮询直到服务可响应，返回等待时长"""
+    import httpx
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if httpx.get(f"{base_url}/api/", timeout=1.0).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"服务在 {timeout}s 内未就绪: {base_url}")
+
+
+def _server_peak_rss_mb(pid: int) -> Optional[float]:
+    """读取子进程峰值 RSS（仅 Linux /proc 可用）"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _api_urls(ctx: BenchContext) -> List[str]:
+    """按真实浏览路径构造请求：每个文件夹的子文件夹列表 + 所有图片分页"""
+    from app.config import settings
+    from app.database.database import SessionLocal
+    from app.database.models import Folder, Image
+    from sqlalchemy import func
+
+    db = SessionLocal()
+    try:
+        urls = ["/api/folders/0/subfolders"]
+        counts = dict(
+            db.query(Image.folder_id, func.count(Image.id)).group_by(Image.folder_id).all()
+        )
+        for (folder_id,) in db.query(Folder.id).order_by(Folder.id):
+            urls.append(f"/api/folders/{folder_id}/subfolders")
+            pages = max(1, -(-counts.get(folder_id, 0) // settings.PAGE_SIZE))
+            urls.extend(f"/api/folders/{folder_id}/images?page={p}" for p in range(1, pages + 1))
+        return urls
+    finally:
+        db.close()
+
+
+async def _run_requests(base_url: str, urls: List[str], total: int, concurrency: int) -> Dict:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    response_bytes = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        async def one(url: str) -> None:
+            nonlocal errors, response_bytes
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    response_bytes += len(response.content)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(urls[i % len(urls)]) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 2) if elapsed else None,
+        "avg_response_bytes": round(response_bytes / total) if total else 0,
+        "latency": latency_summary(latencies),
+    }
+
+
+def bench_api_reads(ctx: BenchContext) -> Dict:
+    if not ctx.scanned:
+        bench_cold_scan(ctx)
+
+    urls = _api_urls(ctx)
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = _start_server(ctx, port)
+    try:
+        _wait_ready(base_url)
+        result = asyncio.run(
+            _run_requests(base_url, urls, ctx.args.requests, ctx.args.concurrency)
+        )
+        result["server_peak_rss_mb"] = _server_peak_rss_mb(server.pid)
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# 启动时不应加载的重型编解码模块
+_HEAVY_MODULES = ("cv2", "pillow_heif")
+
+_IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(json.dumps({'seconds': elapsed, 'heavy': [m for m in %r if m in sys.modules]}))\n"
+) % (_HEAVY_MODULES,)
+
+
+def _measure_import(env: Dict[str, str], runs: int = 3) -> Dict:
+    """在独立子进程中导入 main（每次都是冷的解释器），取多次运行的中位数"""
+    samples = []
+    heavy: List[str] = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+            stderr=subprocess.DEVNULL, text=True,
+        )
+        probe = json.loads(output.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        heavy = probe["heavy"]
+    return {
+        "seconds_p50": round(percentile(samples, 50), 3),
+        "seconds_min": round(min(samples), 3),
+        "heavy_modules_loaded": heavy,
+    }
+
+
+def _measure_boot(ctx: BenchContext, env: Dict[str, str], timeout: float = 600.0) -> Dict:
+    """启动 uvicorn：记录首次响应就绪检查的耗时，以及初始扫描完成的耗时"""
+    import httpx
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = _start_server(ctx, port, env)
+    try:
+        first_response = None
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"{base_url}/api/health/ready", timeout=1.0)
+            except httpx.HTTPError:
+                time.sleep(0.02)
+                continue
+            if first_response is None:
+                first_response = time.perf_counter() - start
+            scan = response.json()["scan"]
+            if scan["phase"] in ("ready", "failed"):
+                return {
+                    "first_response_seconds": round(first_response, 3),
+                    "scan_ready_seconds": round(time.perf_counter() - start, 3),
+                    "scan": scan,
+                }
+            time.sleep(0.05)
+        raise TimeoutError(f"服务在 {timeout}s 内未完成初始扫描: {base_url}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def bench_startup(ctx: BenchContext) -> Dict:
+    if not ctx.scanned:
+        bench_cold_scan(ctx)
+
+    # 空库启动：使用单独的数据目录，初始扫描在后台进行
+    cold_env = ctx.env()
+    cold_env["DATA_ROOT"] = tempfile.mkdtemp(prefix="startup-", dir=ctx.data_root)
+
+    return {
+        "import": _measure_import(ctx.env()),
+        "boot_scanned": _measure_boot(ctx, ctx.env()),
+        "boot_empty": _measure_boot(ctx, cold_env),
+    }
+
+
+SCENARIOS: Dict[str, Callable[[BenchContext], Dict]] = {
+    "cold_scan": bench_cold_scan,
+    "incremental_scan": bench_incremental_scan,
+    "validation": bench_validation,
+    "api_reads": bench_api_reads,
+    "api_payload": bench_api_payload,
+    "startup": bench_startup,
+}
+
+
+# -----------------------------------------------------------------------
+# 入口
+# -----------------------------------------------------------------------
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SimplePhotos 基准测试")
+    parser.add_argument("--out", default="-", help="结果 JSON 输出路径，- 表示 stdout")
+    parser.add_argument("--library", help="使用已有图库（不指定则生成合成图库）")
+    parser.add_argument("--workdir", help="工作目录（DB / 缓存），默认临时目录")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"逗号分隔，可选: {','.join(SCENARIOS)}")
+    parser.add_argument("--folders", type=int, default=20, help="合成图库文件夹数")
+    parser.add_argument("--files-per-folder", type=int, default=30, help="合成图库每个文件夹文件数")
+    parser.add_argument("--image-size", default="2016x1512", help="合成图片尺寸，宽x高")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="api_reads 总请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="api_reads 并发数")
+    parser.add_argument("--payload-pages", type=int, default=50, help="api_payload 序列化的分页数")
+    parser.add_argument("--keep", action="store_true", help="保留工作目录")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="simplephotos-bench-")
+    data_root = os.path.join(workdir, "data")
+    os.makedirs(data_root, exist_ok=True)
+
+    library_stats = None
+    library = args.library
+    if not library:
+        from bench.synth import LibrarySpec, generate_library
+
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        library = os.path.join(workdir, "library")
+        spec = LibrarySpec(
+            folders=args.folders,
+            files_per_folder=args.files_per_folder,
+            image_size=(width, height),
+            seed=args.seed,
+        )
+        library_stats = asdict(generate_library(library, spec))
+
+    # 必须在导入 app 之前设置，app.config 在导入时读取环境变量
+    os.environ["DATA_ROOT"] = data_root
+    os.environ["IMAGES_DIR"] = os.path.abspath(library)
+    sys.path.insert(0, BACKEND_DIR)
+
+    ctx = BenchContext(os.path.abspath(library), data_root, args)
+    results = {}
+    try:
+        for name in names:
+            print(f"[bench] {name} ...", file=sys.stderr)
+            results[name] = SCENARIOS[name](ctx)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db_type": os.getenv("DB_TYPE", "sqlite"),
+            "library": library_stats or {"root": ctx.library},
+        },
+        "results": results,
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(output)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"[bench] 结果已写入 {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
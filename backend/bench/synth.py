@@ -0,0 +1,220 @@
+"""
+合成图库生成器。
+
+按固定随机种子生成可复现的测试图库：多层嵌套文件夹，混合 JPEG / PNG / GIF /
+HEIC / MP4，JPEG 带 EXIF（相机型号、拍摄时间、方向）。
+图片内容为渐变 + 低幅噪声，压缩后的体积接近真实照片，而不是纯色的几 KB。
+
+用法：
+  python -m bench.synth /tmp/library --folders 30 --files-per-folder 40
+"""
+import argparse
+import json
+import os
+import random
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# 各格式在图库中的占比（按真实 NAS 相册粗略估计）
+DEFAULT_MIX: Dict[str, float] = {
+    ".jpg": 0.60,
+    ".heic": 0.20,
+    ".png": 0.10,
+    ".gif": 0.05,
+    ".mp4": 0.05,
+}
+
+CAMERAS = [
+    ("Apple", "iPhone 14 Pro"),
+    ("Apple", "iPhone 12"),
+    ("Canon", "Canon EOS R6"),
+    ("SONY", "ILCE-7M3"),
+    ("FUJIFILM", "X-T4"),
+]
+
+# EXIF 标签号
+_TAG_MAKE = 0x010F
+_TAG_MODEL = 0x0110
+_TAG_ORIENTATION = 0x0112
+_TAG_DATETIME = 0x0132
+
+
+@dataclass
+class LibrarySpec:
+    folders: int = 20
+    files_per_folder: int = 30
+    max_depth: int = 3
+    image_size: Tuple[int, int] = (2016, 1512)
+    video_seconds: float = 3.0
+    seed: int = 42
+    mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+
+
+@dataclass
+class LibraryStats:
+    root: str
+    files: int = 0
+    folders: int = 0
+    bytes: int = 0
+    by_format: Dict[str, int] = field(default_factory=dict)
+    skipped_formats: List[str] = field(default_factory=list)
+
+
+def _heif_available() -> bool:
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        return True
+    except ImportError:
+        return False
+
+
+def _video_available() -> bool:
+    try:
+        import cv2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _make_pixels(rng: np.random.Generator, size: Tuple[int, int]) -> np.ndarray:
+    """渐变 + 低幅噪声，JPEG 压缩后大小接近真实照片"""
+    width, height = size
+    base = rng.integers(0, 256, size=3)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    direction = rng.uniform(-120, 120, size=(2, 3)).astype(np.float32)
+    pixels = base + x * direction[0] + y * direction[1]
+    pixels = pixels + rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def _make_exif(rng: random.Random, taken_at: datetime) -> Image.Exif:
+    make, model = rng.choice(CAMERAS)
+    exif = Image.Exif()
+    exif[_TAG_MAKE] = make
+    exif[_TAG_MODEL] = model
+    exif[_TAG_ORIENTATION] = rng.choice([1, 1, 1, 6, 8, 3])
+    exif[_TAG_DATETIME] = taken_at.strftime("%Y:%m:%d %H:%M:%S")
+    return exif
+
+
+def _write_video(path: str, np_rng: np.random.Generator, spec: LibrarySpec) -> None:
+    import cv2
+
+    width, height, fps = 640, 360, 24
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    try:
+        frame = _make_pixels(np_rng, (width, height))
+        for i in range(int(spec.video_seconds * fps)):
+            # 平移画面，让每帧都不同（开头几帧保持全黑，模拟真实视频的黑场）
+            shifted = np.roll(frame, i * 4, axis=1)
+            writer.write(shifted if i >= fps // 4 else np.zeros_like(frame))
+    finally:
+        writer.release()
+
+
+def _write_file(
+    path: str, ext: str, rng: random.Random, np_rng: np.random.Generator, spec: LibrarySpec
+) -> None:
+    taken_at = datetime(2020, 1, 1) + timedelta(seconds=rng.randint(0, 4 * 365 * 86400))
+
+    if ext == ".mp4":
+        _write_video(path, np_rng, spec)
+        return
+
+    if ext == ".gif":
+        frames = [
+            Image.fromarray(_make_pixels(np_rng, (480, 360))).convert("P")
+            for _ in range(4)
+        ]
+        frames[0].save(path, save_all=True, append_images=frames[1:], duration=120, loop=0)
+        return
+
+    # 尺寸带一点随机，避免所有文件完全等大
+    scale = rng.uniform(0.6, 1.0)
+    width, height = (int(spec.image_size[0] * scale), int(spec.image_size[1] * scale))
+    if rng.random() < 0.3:
+        width, height = height, width
+    img = Image.fromarray(_make_pixels(np_rng, (width, height)))
+
+    if ext == ".jpg":
+        img.save(path, "JPEG", quality=90, exif=_make_exif(rng, taken_at))
+    elif ext == ".heic":
+        img.save(path, "HEIF", quality=80, exif=_make_exif(rng, taken_at).tobytes())
+    elif ext == ".png":
+        img.save(path, "PNG", compress_level=1)
+
+
+def _folder_layout(rng: random.Random, spec: LibrarySpec) -> List[str]:
+    """生成嵌套文件夹相对路径列表（父目录总在子目录之前）"""
+    folders = ["."]
+    for i in range(spec.folders):
+        parent = rng.choice(folders)
+        depth = 0 if parent == "." else parent.count(os.sep) + 1
+        if depth >= spec.max_depth:
+            parent = "."
+        name = f"{2015 + i % 10}-{rng.randint(1, 12):02d} album_{i:04d}"
+        folders.append(os.path.normpath(os.path.join(parent, name)))
+    return folders
+
+
+def generate_library(root: str, spec: LibrarySpec) -> LibraryStats:
+    """在 root 下生成图库；同一 spec 多次生成结果一致"""
+    rng = random.Random(spec.seed)
+    np_rng = np.random.default_rng(spec.seed)
+    stats = LibraryStats(root=os.path.abspath(root))
+
+    mix = dict(spec.mix)
+    if ".heic" in mix and not _heif_available():
+        stats.skipped_formats.append(".heic")
+        mix.pop(".heic")
+    if ".mp4" in mix and not _video_available():
+        stats.skipped_formats.append(".mp4")
+        mix.pop(".mp4")
+    extensions, weights = zip(*mix.items())
+
+    for rel_folder in _folder_layout(rng, spec):
+        folder = os.path.join(root, rel_folder)
+        os.makedirs(folder, exist_ok=True)
+        stats.folders += 1
+
+        for i in range(spec.files_per_folder):
+            ext = rng.choices(extensions, weights=weights)[0]
+            path = os.path.join(folder, f"IMG_{i:05d}{ext}")
+            _write_file(path, ext, rng, np_rng, spec)
+            stats.files += 1
+            stats.bytes += os.path.getsize(path)
+            stats.by_format[ext] = stats.by_format.get(ext, 0) + 1
+
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="生成可复现的合成图库")
+    parser.add_argument("root", help="输出目录")
+    parser.add_argument("--folders", type=int, default=LibrarySpec.folders)
+    parser.add_argument("--files-per-folder", type=int, default=LibrarySpec.files_per_folder)
+    parser.add_argument("--max-depth", type=int, default=LibrarySpec.max_depth)
+    parser.add_argument("--image-size", default="2016x1512", help="宽x高，如 4032x3024")
+    parser.add_argument("--seed", type=int, default=LibrarySpec.seed)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    spec = LibrarySpec(
+        folders=args.folders,
+        files_per_folder=args.files_per_folder,
+        max_depth=args.max_depth,
+        image_size=(width, height),
+        seed=args.seed,
+    )
+    stats = generate_library(args.root, spec)
+    print(json.dumps(asdict(stats), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
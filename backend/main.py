@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import os
 import signal
@@ -8,43 +9,93 @@ from typing import Optional
 import uvicorn
 from app.api.routes import router
 from app.config import settings
-from app.database import models
-from app.database.database import SessionLocal, engine, get_db
-from app.services.init_service import InitializationService
+from app.database.database import SessionLocal, create_tables, engine, get_db
+from app.services.cache_service import (CacheService,
+                                        flush_thumbnail_evictions,
+                                        pack_compactor, sprite_cache,
+                                        thumbnail_cache)
+from app.services.conversion_service import converted_cache
+from app.services.folder_tree_service import folder_tree, install_folder_tree_hooks
+from app.services.init_service import InitializationService, scan_state
+from app.services.prefetch_service import prefetcher
+from app.services.render_service import rendition_cache
+from app.services.retry_service import retry_worker
+from app.utils.compression import CompressionMiddleware
 from app.utils.logger import logger
-from fastapi import FastAPI
+from app.utils.metrics import (CONTENT_TYPE_LATEST, MetricsMiddleware,
+                               bind_db_pool, bind_disk_cache, registry)
+from app.utils.profiling import ProfilingMiddleware, install_query_hooks
+from app.utils.pack_store import PackStore
+from app.utils.static_files import CachedStaticFiles, PackedStaticFiles
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 
-# 创建数据库表
-logger.info("正在创建数据库表...")
-models.Base.metadata.create_all(bind=engine)
-logger.info("数据库表创建完成")
+# 关闭服务时等待后台扫描退出的最长时间（秒）
+_SCAN_STOP_TIMEOUT = 30
+
+
+def _run_initialization() -> bool:
+    """在独立线程中用单独的事件循环执行初始化（扫描中的解码、写库都是同步的）"""
+    db = SessionLocal()
+    try:
+        return asyncio.run(InitializationService(db).initialize_database())
+    finally:
+        db.close()
+
+
+async def _initial_scan() -> None:
+    """
+    后台初始化任务：首次启动时的全盘扫描可能耗时很久，
+    放到独立线程中执行，不阻塞服务就绪，也不占用服务的事件循环；
+    扫描期间接口照常响应（结果随扫描逐步出现），进度见 /api/health/ready。
+    """
+    if not await asyncio.to_thread(_run_initialization):
+        logger.error("数据库初始化失败，请检查图片目录与数据库配置")
+        return
+    if scan_state.stop_requested:
+        return
+
+    # 后台按退避计划重试失败文件（初始扫描完成后再启动，避免与扫描争用写锁）
+    retry_worker.start()
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    db = SessionLocal()
-
+    logger.info(settings.describe())
+
+    # 建表（幂等）放在启动阶段而不是模块导入时，导入 main 不产生数据库副作用
+    logger.info("正在创建数据库表...")
+    create_tables()
+    logger.info("数据库表创建完成")
+    # 文件夹树快照（浏览接口使用），之后由会话事件增量维护
+    await asyncio.to_thread(folder_tree.load)
+    # 缓存索引缺失时需遍历缓存目录重建，放在线程中完成，不让第一个请求卡住事件循环
+    await asyncio.to_thread(CacheService.preload_indexes)
+
+    scan_task = asyncio.create_task(_initial_scan())
+    pack_compactor.start()
     try:
-        # 初始化数据库（首次启动时触发全盘扫描）
-        init_service = InitializationService(db)
-        if not await init_service.initialize_database():
-            db.close()
-            logger.error("数据库初始化失败，应用无法启动")
-            raise RuntimeError("数据库初始化失败")
-
         yield
 
+        # 通知扫描在当前文件处理完后退出，最多等待 _SCAN_STOP_TIMEOUT 秒
+        scan_state.request_stop()
+        with contextlib.suppress(asyncio.TimeoutError, asyncio.CancelledError):
+            await asyncio.wait_for(scan_task, timeout=_SCAN_STOP_TIMEOUT)
+        await retry_worker.stop()
+        await prefetcher.stop()
+        await pack_compactor.stop()
+        # 读请求只在内存中更新访问记录，退出前写回索引并同步淘汰记录
+        flush_thumbnail_evictions()
+        CacheService.save_indexes()
+
     except Exception as e:
-        logger.error(f"应用启动失败: {str(e)}")
+        logger.error(f"应用运行异常: {str(e)}")
         raise
     finally:
-        # 应用关闭时关闭 DB Session
-        db.close()
         logger.info("应用已停止")
 
 # 配置 uvicorn 访问日志
@@ -85,6 +136,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# JSON 响应压缩（brotli / gzip，超过阈值才压缩），位于剖析中间件内层，
+# 压缩耗时计入 Server-Timing
+app.add_middleware(CompressionMiddleware)
+
+# 请求级剖析（Server-Timing / 采样 cProfile）与慢查询日志
+app.add_middleware(ProfilingMiddleware)
+install_query_hooks(engine)
+install_folder_tree_hooks()
+
+# 请求耗时指标（按路由模板统计）
+app.add_middleware(MetricsMiddleware)
+bind_db_pool(engine)
+bind_disk_cache(thumbnail_cache)
+bind_disk_cache(converted_cache)
+bind_disk_cache(sprite_cache)
+bind_disk_cache(rendition_cache)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指标抓取端点"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 # 注册 API 路由（必须在静态文件挂载之前，否则 catch-all 会拦截 API 请求）
 app.include_router(router, prefix="/api")
 
@@ -92,11 +167,15 @@ app.include_router(router, prefix="/api")
 app.mount("/data/images",
           StaticFiles(directory=str(settings.IMAGES_DIR)),
           name="images")
-app.mount("/data/thumbnails",
-          StaticFiles(directory=str(settings.THUMBNAIL_DIR)),
-          name="thumbnails")
+# 缓存目录的访问会刷新对应 DiskCache 的 LRU / LFU 记录
+if isinstance(thumbnail_cache, PackStore):
+    app.mount("/data/thumbnails", PackedStaticFiles(store=thumbnail_cache), name="thumbnails")
+else:
+    app.mount("/data/thumbnails",
+              CachedStaticFiles(directory=str(settings.THUMBNAIL_DIR), cache=thumbnail_cache),
+              name="thumbnails")
 app.mount("/data/converted",
-          StaticFiles(directory=str(settings.CONVERTED_DIR)),
+          CachedStaticFiles(directory=str(settings.CONVERTED_DIR), cache=converted_cache),
           name="converted")
 
 # -------------------------------------------------------------------
@@ -0,0 +1,83 @@
+"""
+被移动 / 改名的 HEIC 沿用原来的按需转换结果（FolderService._relink_file 改指向新路径后
+ConversionService 仍命中缓存，不再重新转换）。
+
+在 backend 目录下运行：python -m pytest tests
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+
+# 配置在导入 app 时读取，先指向临时目录
+_DATA_ROOT = tempfile.mkdtemp()
+os.environ["DATA_ROOT"] = _DATA_ROOT
+os.environ["IMAGES_DIR"] = os.path.join(_DATA_ROOT, "images")
+
+from app.config import settings  # noqa: E402
+from app.database.database import SessionLocal, create_tables  # noqa: E402
+from app.database.models import Folder, Image  # noqa: E402
+from app.services import conversion_service  # noqa: E402
+from app.services.conversion_service import ConversionService, converted_cache  # noqa: E402
+from app.services.folder_service import FolderService  # noqa: E402
+from app.utils.fingerprint import file_fingerprint  # noqa: E402
+
+
+def teardown_module(module):
+    shutil.rmtree(_DATA_ROOT, ignore_errors=True)
+
+
+def _write(rel_path: str, data: bytes) -> str:
+    full_path = os.path.join(str(settings.IMAGES_DIR), rel_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as f:
+        f.write(data)
+    return full_path
+
+
+def test_moved_heic_reuses_converted_file(monkeypatch):
+    calls = []
+
+    async def fake_convert(file_path: str, key: str) -> str:
+        calls.append(file_path)
+        target = converted_cache.path_for(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(b"jpeg")
+        converted_cache.put(key)
+        return target
+
+    monkeypatch.setattr(conversion_service, "_convert", fake_convert)
+    create_tables()
+
+    old_rel = os.path.join("a", "IMG_0001.HEIC")
+    new_rel = os.path.join("b", "IMG_0001.HEIC")
+    old_full = _write(old_rel, os.urandom(200 * 1024))
+
+    db = SessionLocal()
+    try:
+        folder_a = Folder(folder_path="a", name="a")
+        folder_b = Folder(folder_path="b", name="b")
+        db.add_all([folder_a, folder_b])
+        db.flush()
+        image = Image(
+            folder_id=folder_a.id, file_path=old_rel, is_heic=True,
+            image_type="heif", fingerprint=file_fingerprint(old_full),
+        )
+        db.add(image)
+        db.commit()
+
+        first = asyncio.run(ConversionService(db).get_converted_path(image))
+        assert calls == [old_rel]
+
+        os.makedirs(os.path.join(str(settings.IMAGES_DIR), "b"), exist_ok=True)
+        os.replace(old_full, os.path.join(str(settings.IMAGES_DIR), new_rel))
+        assert asyncio.run(FolderService(db)._relink_file(new_rel, folder_b.id))
+
+        db.refresh(image)
+        assert image.file_path == new_rel
+        second = asyncio.run(ConversionService(db).get_converted_path(image))
+        assert second == first
+        assert calls == [old_rel]
+    finally:
+        db.close()
@@ -1,18 +1,57 @@
 import { Image } from '@/types';
 import { motion } from 'framer-motion';
-import { useState } from 'react';
+import { CSSProperties, useMemo, useState } from 'react';
 import { FaPlay, FaGift } from 'react-icons/fa';
+import { thumbHashToDataURL } from '@/utils/thumbhash';
 
 interface ImageCardProps {
   image: Image;
   onClick?: (image: Image) => void;
 }
 
+// 雪碧图按格子边长缩放到卡片大小：背景尺寸与位置都用百分比表示，与卡片实际宽度无关
+const getSpriteStyle = (image: Image): CSSProperties | null => {
+  const sheet = image.sprite_sheet;
+  const pos = image.sprite;
+  if (!sheet || !pos) return null;
+  const percent = (offset: number, total: number) =>
+    total > sheet.cell ? (offset / (total - sheet.cell)) * 100 : 0;
+  return {
+    backgroundImage: `url(${sheet.url})`,
+    backgroundSize: `${(sheet.width / sheet.cell) * 100}% ${(sheet.height / sheet.cell) * 100}%`,
+    backgroundPosition: `${percent(pos.x, sheet.width)}% ${percent(pos.y, sheet.height)}%`,
+  };
+};
+
+// 同一页的卡片共用一个雪碧图 URL，浏览器只请求一次；借一个隐藏的 img 获知加载完成
+const SpriteThumbnail = ({ url, style, isLoading, onLoad }: {
+  url: string;
+  style: CSSProperties;
+  isLoading: boolean;
+  onLoad: () => void;
+}) => (
+  <div
+    className={`w-full h-full bg-no-repeat transition-all duration-500 ease-in-out ${
+      isLoading ? 'opacity-0 scale-105' : 'opacity-100 scale-100 group-hover:scale-105'
+    }`}
+    style={style}
+  >
+    <img src={url} alt="" className="hidden" onLoad={onLoad} />
+  </div>
+);
+
 export const ImageCard = ({ image, onClick }: ImageCardProps) => {
   const [isLoading, setIsLoading] = useState(true);
 
   const previewUrl = image.thumbnail_path || image.file_path;
 
+  const spriteStyle = getSpriteStyle(image);
+  // ThumbHash 占位图：随列表数据下发，无需额外请求即可画出模糊预览
+  const placeholderUrl = useMemo(
+    () => (image.thumbhash ? thumbHashToDataURL(image.thumbhash) : null),
+    [image.thumbhash]
+  );
+
   const isVideo = image.mime_type?.startsWith('video/');
   const isGif = image.mime_type === 'image/gif';
 
@@ -24,19 +63,34 @@ export const ImageCard = ({ image, onClick }: ImageCardProps) => {
       onClick={() => onClick?.(image)}
       layout
     >
-      {isLoading && (
-        <div className="absolute inset-0 animate-pulse bg-gray-200 dark:bg-gray-700" />
-      )}
-      <div className="aspect-square w-full">
+      {isLoading && (placeholderUrl ? (
         <img
-          src={previewUrl}
+          src={placeholderUrl}
           alt=""
-          className={`w-full h-full object-cover transition-all duration-500 ease-in-out ${
-            isLoading ? 'opacity-0 scale-105' : 'opacity-100 scale-100 group-hover:scale-105'
-          }`}
-          onLoad={() => setIsLoading(false)}
-          loading="lazy"
+          className="absolute inset-0 w-full h-full object-cover"
         />
+      ) : (
+        <div className="absolute inset-0 animate-pulse bg-gray-200 dark:bg-gray-700" />
+      ))}
+      <div className="aspect-square w-full">
+        {spriteStyle ? (
+          <SpriteThumbnail
+            url={image.sprite_sheet!.url}
+            style={spriteStyle}
+            isLoading={isLoading}
+            onLoad={() => setIsLoading(false)}
+          />
+        ) : (
+          <img
+            src={previewUrl}
+            alt=""
+            className={`w-full h-full object-cover transition-all duration-500 ease-in-out ${
+              isLoading ? 'opacity-0 scale-105' : 'opacity-100 scale-100 group-hover:scale-105'
+            }`}
+            onLoad={() => setIsLoading(false)}
+            loading="lazy"
+          />
+        )}
       </div>
       
       {/* 渐变遮罩用于 hover */}
@@ -1,8 +1,10 @@
 import { Image } from '@/types';
+import { api } from '@/services/api';
 import { motion, AnimatePresence } from 'framer-motion';
 import { useEffect, useCallback, useState, useRef } from 'react';
 import { TransformWrapper, TransformComponent } from 'react-zoom-pan-pinch';
 import { useSwipeable } from 'react-swipeable';
+import { useQuery } from '@tanstack/react-query';
 
 interface ImageViewerProps {
   image: Image | null;
@@ -15,6 +17,14 @@ export const ImageViewer = ({ image, images, onClose, onNavigate }: ImageViewerP
   const [showExif, setShowExif] = useState(false);
   const [isZoomed, setIsZoomed] = useState(false);
   
+  // 列表数据不含 EXIF 时按需获取（hook 必须在提前 return 之前调用）
+  const { data: exifResponse } = useQuery({
+    queryKey: ['image-exif', image?.id],
+    queryFn: () => api.getImageExif(image!.id),
+    enabled: !!image && image.exif_data === undefined,
+    staleTime: Infinity,
+  });
+
   // 添加 ref 来获取 transform 实例
   const transformRef = useRef<any>(null);
 
@@ -71,10 +81,11 @@ export const ImageViewer = ({ image, images, onClose, onNavigate }: ImageViewerP
 
   if (!image) return null;
 
-  const hasExif = image.exif_data && Object.keys(image.exif_data).length > 0;
+  const exifData = image.exif_data ?? exifResponse?.exif_data ?? null;
+  const hasExif = exifData && Object.keys(exifData).length > 0;
 
-  // 获取显示路径
-  const displayPath = image.converted_path || image.file_path;
+  // 获取显示路径：HEIC 由后端按需转换为 JPEG
+  const displayPath = image.is_heic ? api.getImageUrl(image.id) : image.file_path;
 
   // 格式化 EXIF 数据显示
   const formatExifData = (exif: any) => {
@@ -135,7 +146,7 @@ export const ImageViewer = ({ image, images, onClose, onNavigate }: ImageViewerP
             >
               <h3 className="text-lg font-semibold mb-2">图片信息</h3>
               <div className="space-y-2">
-                {formatExifData(image.exif_data).map(({ label, value }) => (
+                {formatExifData(exifData).map(({ label, value }) => (
                   <div key={label} className="flex justify-between">
                     <span className="text-white/70">{label}:</span>
                     <span>{String(value)}</span>
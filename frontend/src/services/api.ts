@@ -1,3 +1,5 @@
+import { Image } from '@/types';
+
 const API_BASE = '/api';
 
 export const api = {
@@ -12,6 +14,17 @@ export const api = {
     const response = await fetch(
       `${API_BASE}/folders/${folderId}/images?page=${page}`
     );
+    const data = await response.json();
+    // 把本页雪碧图信息挂到每张图片上，ImageCard 据此从雪碧图中裁出缩略图
+    if (data?.sprite && Array.isArray(data.items)) {
+      data.items = data.items.map((item: Image) => ({ ...item, sprite_sheet: data.sprite }));
+    }
+    return data;
+  },
+
+  // 列表接口默认不含 exif_data，查看大图时单独获取
+  async getImageExif(imageId: number): Promise<{ id: number; exif_data: Record<string, any> | null }> {
+    const response = await fetch(`${API_BASE}/images/${imageId}/exif`);
     return response.json();
   },
 
@@ -6,9 +6,29 @@ export interface Image {
   image_type: string;
   mime_type?: string;
   file_path: string;
-  thumbnail_path: string;
+  thumbnail_path: string;  // 缩略图被缓存淘汰时为按需生成接口地址
   converted_path: string | null;
   exif_data?: Record<string, any>;
+  thumbhash?: string | null;       // ThumbHash 占位图（base64），见 utils/thumbhash.ts
+  duration?: number | null;
+  fps?: number | null;
+  width?: number | null;
+  height?: number | null;
+  sprite?: SpritePosition | null;  // 在本页雪碧图中的格子坐标，缩略图不可用时为 null
+  sprite_sheet?: SpriteSheet;      // 本页雪碧图（由 api.getFolderImages 挂载）
+}
+
+export interface SpritePosition {
+  x: number;
+  y: number;
+}
+
+export interface SpriteSheet {
+  url: string;
+  cell: number;
+  columns: number;
+  width: number;
+  height: number;
 }
 
 export interface Folder {
@@ -0,0 +1,120 @@
+// ThumbHash 解码（参考实现 https://github.com/evanw/thumbhash 的 thumbHashToRGBA）
+// 后端扫描时为每张图片计算约 25 字节的 ThumbHash，这里解码成 32px 的模糊图，
+// 在缩略图加载前作为占位绘制。
+
+const cache = new Map<string, string>();
+
+const decodeBase64 = (value: string): Uint8Array =>
+  Uint8Array.from(atob(value), (c) => c.charCodeAt(0));
+
+const thumbHashToRGBA = (hash: Uint8Array) => {
+  const { PI, min, max, cos, round } = Math;
+  const header24 = hash[0] | (hash[1] << 8) | (hash[2] << 16);
+  const header16 = hash[3] | (hash[4] << 8);
+  const lDc = (header24 & 63) / 63;
+  const pDc = ((header24 >> 6) & 63) / 31.5 - 1;
+  const qDc = ((header24 >> 12) & 63) / 31.5 - 1;
+  const lScale = ((header24 >> 18) & 31) / 31;
+  const hasAlpha = header24 >> 23;
+  const pScale = ((header16 >> 3) & 63) / 63;
+  const qScale = ((header16 >> 9) & 63) / 63;
+  const isLandscape = header16 >> 15;
+  const lx = max(3, isLandscape ? (hasAlpha ? 5 : 7) : header16 & 7);
+  const ly = max(3, isLandscape ? header16 & 7 : hasAlpha ? 5 : 7);
+  const aDc = hasAlpha ? (hash[5] & 15) / 15 : 1;
+  const aScale = (hash[5] >> 4) / 15;
+
+  // 交流分量按 4 位紧密排列
+  const acStart = hasAlpha ? 6 : 5;
+  let acIndex = 0;
+  const decodeChannel = (nx: number, ny: number, scale: number) => {
+    const ac: number[] = [];
+    for (let cy = 0; cy < ny; cy++) {
+      for (let cx = cy ? 0 : 1; cx * ny < nx * (ny - cy); cx++, acIndex++) {
+        const nibble = (hash[acStart + (acIndex >> 1)] >> ((acIndex & 1) << 2)) & 15;
+        ac.push((nibble / 7.5 - 1) * scale);
+      }
+    }
+    return ac;
+  };
+  const lAc = decodeChannel(lx, ly, lScale);
+  const pAc = decodeChannel(3, 3, pScale * 1.25);
+  const qAc = decodeChannel(3, 3, qScale * 1.25);
+  const aAc = hasAlpha ? decodeChannel(5, 5, aScale) : [];
+
+  // 近似宽高比，长边 32px
+  const ratio = (isLandscape ? (hasAlpha ? 5 : 7) : header16 & 7) /
+    (isLandscape ? header16 & 7 : hasAlpha ? 5 : 7);
+  const w = round(ratio > 1 ? 32 : 32 * ratio);
+  const h = round(ratio > 1 ? 32 / ratio : 32);
+  const rgba = new Uint8ClampedArray(w * h * 4);
+  const fx: number[] = [];
+  const fy: number[] = [];
+
+  for (let y = 0, i = 0; y < h; y++) {
+    for (let x = 0; x < w; x++, i += 4) {
+      let l = lDc;
+      let p = pDc;
+      let q = qDc;
+      let a = aDc;
+
+      for (let cx = 0, n = max(lx, hasAlpha ? 5 : 3); cx < n; cx++) {
+        fx[cx] = cos((PI / w) * (x + 0.5) * cx);
+      }
+      for (let cy = 0, n = max(ly, hasAlpha ? 5 : 3); cy < n; cy++) {
+        fy[cy] = cos((PI / h) * (y + 0.5) * cy);
+      }
+
+      for (let cy = 0, j = 0; cy < ly; cy++) {
+        for (let cx = cy ? 0 : 1, fy2 = fy[cy] * 2; cx * ly < lx * (ly - cy); cx++, j++) {
+          l += lAc[j] * fx[cx] * fy2;
+        }
+      }
+      for (let cy = 0, j = 0; cy < 3; cy++) {
+        for (let cx = cy ? 0 : 1, fy2 = fy[cy] * 2; cx < 3 - cy; cx++, j++) {
+          const f = fx[cx] * fy2;
+          p += pAc[j] * f;
+          q += qAc[j] * f;
+        }
+      }
+      if (hasAlpha) {
+        for (let cy = 0, j = 0; cy < 5; cy++) {
+          for (let cx = cy ? 0 : 1, fy2 = fy[cy] * 2; cx < 5 - cy; cx++, j++) {
+            a += aAc[j] * fx[cx] * fy2;
+          }
+        }
+      }
+
+      // LPQ 转回 RGB
+      const b = l - (2 / 3) * p;
+      const r = (3 * l - b + q) / 2;
+      const g = r - q;
+      rgba[i] = max(0, 255 * min(1, r));
+      rgba[i + 1] = max(0, 255 * min(1, g));
+      rgba[i + 2] = max(0, 255 * min(1, b));
+      rgba[i + 3] = max(0, 255 * min(1, a));
+    }
+  }
+  return { w, h, rgba };
+};
+
+// ThumbHash（base64）→ 可直接用作 src / background-image 的 data URL，结果按 hash 缓存
+export const thumbHashToDataURL = (value: string): string | null => {
+  const cached = cache.get(value);
+  if (cached) return cached;
+
+  try {
+    const { w, h, rgba } = thumbHashToRGBA(decodeBase64(value));
+    const canvas = document.createElement('canvas');
+    canvas.width = w;
+    canvas.height = h;
+    const context = canvas.getContext('2d');
+    if (!context) return null;
+    context.putImageData(new ImageData(rgba, w, h), 0, 0);
+    const url = canvas.toDataURL();
+    cache.set(value, url);
+    return url;
+  } catch {
+    return null;
+  }
+};